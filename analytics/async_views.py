@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from datetime import timedelta
+from .models import UserActivity
+from .views import _trend_rows, _rank_trends
+from backend.cache import aread_through
+from recommendations.async_views import json_response, throttled, unauthorized
+from users.authentication import aauthenticate
+
+User = get_user_model()
+
+
+async def _abuild_trends():
+    artist_rows, genre_rows = _trend_rows()
+    return _rank_trends(
+        [row async for row in artist_rows],
+        [row async for row in genre_rows]
+    )
+
+
+async def _abuild_engagement(user):
+    """Async variant of views._build_engagement"""
+    activities = UserActivity.objects.filter(user=user)
+    week_ago = timezone.now() - timedelta(days=7)
+    
+    activity_breakdown = activities.values('interaction_type').annotate(count=Count('id'))
+    
+    top_tracks = activities.values(
+        'recommendation__track_name',
+        'recommendation__artist_name'
+    ).annotate(
+        interaction_count=Count('id')
+    ).order_by('-interaction_count')[:10]
+    
+    counts = await activities.aaggregate(
+        total=Count('id'),
+        recent=Count('id', filter=Q(timestamp__gte=week_ago))
+    )
+    
+    return {
+        'user_id': user.id,
+        'user_email': user.email,
+        'total_activities': counts['total'],
+        'activities_last_7_days': counts['recent'],
+        'activity_breakdown': [row async for row in activity_breakdown],
+        'top_tracks': [row async for row in top_tracks]
+    }
+
+
+@require_GET
+async def trends(request):
+    """GET /analytics/trends/ - Async variant of TrendsView"""
+    if await aauthenticate(request) is None:
+        return unauthorized()
+    
+    refused = await throttled(request)
+    if refused is not None:
+        return refused
+    
+    data, _ = await aread_through('analytics_trends', _abuild_trends, timeout=600)
+    return json_response(data)
+
+
+@require_GET
+async def user_engagement(request, user_id):
+    """GET /analytics/user/{user_id}/ - Async variant of UserEngagementView"""
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized()
+    
+    refused = await throttled(request)
+    if refused is not None:
+        return refused
+    
+    if user.id != user_id and not user.is_staff:
+        return json_response(
+            {'error': 'You can only view your own engagement stats'},
+            status=403
+        )
+    
+    target = await User.objects.filter(id=user_id).afirst()
+    if target is None:
+        return json_response({'error': 'User not found'}, status=404)
+    
+    data, _ = await aread_through(
+        f'engagement_user_{user_id}',
+        lambda: _abuild_engagement(target),
+        timeout=300
+    )
+    return json_response(data)
@@ -27,4 +27,4 @@ class UserActivity(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.email} - {self.interaction_type} - {self.recommendation.track_name}"
+        return f"user {self.user_id} - {self.interaction_type} - recommendation {self.recommendation_id}"
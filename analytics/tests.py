@@ -1,3 +1,38 @@
-from django.test import TestCase
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from analytics import views
+from recommendations.models import Recommendation
 
-# Create your tests here.
+User = get_user_model()
+
+
+@pytest.mark.django_db
+class TestRecordActivity:
+    
+    @pytest.fixture
+    def dirty(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(views, 'mark_dirty', lambda user_id, **kwargs: calls.append((user_id, kwargs)))
+        return calls
+    
+    def test_likes_and_skips_schedule_refresh(self, dirty):
+        """Test that likes and skips batch up a refresh while plays do not"""
+        user = User.objects.create_user(email='activity@example.com', password='x')
+        recommendation = Recommendation.objects.create(
+            user=user, track_id='track', track_name='Track', artist_name='Artist'
+        )
+        client = APIClient()
+        client.force_authenticate(user=user)
+        
+        for interaction_type in ('play', 'like', 'skip'):
+            response = client.post(
+                reverse('record-activity'),
+                {'recommendation': recommendation.id, 'interaction_type': interaction_type},
+                format='json'
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+        
+        assert dirty == [(user.id, {'delay': 15 * 60, 'jitter': 5 * 60})] * 2
@@ -0,0 +1,51 @@
+import pytest
+from django.urls import reverse
+
+from analytics import views
+
+
+@pytest.mark.performance
+@pytest.mark.django_db
+class TestAnalyticsBudgets:
+
+    def test_record_activity(self, perf_data, auth_client, budget, monkeypatch):
+        monkeypatch.setattr(views, 'mark_dirty', lambda *args, **kwargs: None)
+        user = perf_data['user']
+        recommendation = user.recommendations.first()
+        client = auth_client(user)
+        with budget(queries=5, ms=100):
+            response = client.post(
+                reverse('record-activity'),
+                {'recommendation': recommendation.id, 'interaction_type': 'like'},
+                format='json'
+            )
+        assert response.status_code == 201
+        assert response.data['track_name'] == recommendation.track_name
+
+    def test_summary_staff(self, perf_data, auth_client, budget):
+        client = auth_client(perf_data['staff'])
+        with budget(queries=6, ms=150):
+            response = client.get(reverse('analytics-summary'))
+        assert response.data['total_activities'] == 400
+
+    def test_summary_user(self, perf_data, auth_client, budget):
+        client = auth_client(perf_data['user'])
+        with budget(queries=4, ms=100):
+            response = client.get(reverse('analytics-summary'))
+        assert response.data['total_activities'] == 20
+
+    def test_trends(self, perf_data, auth_client, budget):
+        """Trends are grouped in SQL, not ranked row by row in Python"""
+        client = auth_client(perf_data['user'])
+        with budget(queries=4, ms=150):
+            response = client.get(reverse('analytics-trends'))
+        top = response.data['trending_artists'][0]
+        assert top['interactions'] >= response.data['trending_artists'][-1]['interactions']
+        assert response.data['trending_genres'][0] == {'name': 'pop', 'interactions': 400}
+
+    def test_user_engagement(self, perf_data, auth_client, budget):
+        user = perf_data['user']
+        client = auth_client(user)
+        with budget(queries=6, ms=150):
+            response = client.get(reverse('user-engagement', kwargs={'user_id': user.id}))
+        assert response.data['total_activities'] == 20
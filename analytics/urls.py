@@ -1,14 +1,26 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RecordActivityView,
     AnalyticsSummaryView,
     TrendsView,
-    UserEngagementView
+    UserEngagementView,
+    CacheStatsView
 )
+from .async_views import trends, user_engagement
+
+# Read endpoints are served by native async views on ASGI deployments
+if settings.ASYNC_READ_VIEWS:
+    trends_view = trends
+    user_engagement_view = user_engagement
+else:
+    trends_view = TrendsView.as_view()
+    user_engagement_view = UserEngagementView.as_view()
 
 urlpatterns = [
     path('', RecordActivityView.as_view(), name='record-activity'),
     path('summary/', AnalyticsSummaryView.as_view(), name='analytics-summary'),
-    path('trends/', TrendsView.as_view(), name='analytics-trends'),
-    path('user/<int:user_id>/', UserEngagementView.as_view(), name='user-engagement'),
+    path('trends/', trends_view, name='analytics-trends'),
+    path('user/<int:user_id>/', user_engagement_view, name='user-engagement'),
+    path('cache/', CacheStatsView.as_view(), name='cache-stats'),
 ]
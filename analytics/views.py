@@ -1,14 +1,17 @@
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count, Q
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.core.cache import cache
+from django.db.models import Count, F, Q
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from datetime import timedelta
 from .models import UserActivity
 from .serializers import UserActivitySerializer
 from recommendations.models import Recommendation
+from recommendations.scheduling import mark_dirty
+from backend.cache import read_through
 
 User = get_user_model()
 
@@ -25,7 +28,10 @@ class RecordActivityView(APIView):
         serializer = UserActivitySerializer(data=data)
         
         if serializer.is_valid():
-            serializer.save()
+            activity = serializer.save()
+            # Likes and skips reshape the user's taste, batch them up for a while
+            if activity.interaction_type in ('like', 'skip'):
+                mark_dirty(request.user.id, delay=15 * 60, jitter=5 * 60)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -40,94 +46,140 @@ class AnalyticsSummaryView(APIView):
         if request.user.is_staff:
             total_users = User.objects.count()
             total_recommendations = Recommendation.objects.count()
-            total_activities = UserActivity.objects.count()
             
             activity_breakdown = UserActivity.objects.values('interaction_type').annotate(
                 count=Count('id')
             )
             
+            # One pass over the table for all three activity counts
             week_ago = timezone.now() - timedelta(days=7)
-            recent_activities = UserActivity.objects.filter(timestamp__gte=week_ago).count()
-            
-            active_users = UserActivity.objects.filter(
-                timestamp__gte=week_ago
-            ).values('user').distinct().count()
+            recent = Q(timestamp__gte=week_ago)
+            counts = UserActivity.objects.aggregate(
+                total=Count('id'),
+                recent=Count('id', filter=recent),
+                active_users=Count('user', filter=recent, distinct=True)
+            )
             
             return Response({
                 'total_users': total_users,
                 'total_recommendations': total_recommendations,
-                'total_activities': total_activities,
-                'active_users_last_7_days': active_users,
-                'activities_last_7_days': recent_activities,
+                'total_activities': counts['total'],
+                'active_users_last_7_days': counts['active_users'],
+                'activities_last_7_days': counts['recent'],
                 'activity_breakdown': list(activity_breakdown)
             })
         else:
             # Regular user sees only their stats
             user = request.user
-            total_activities = UserActivity.objects.filter(user=user).count()
-            
             activity_breakdown = UserActivity.objects.filter(user=user).values(
                 'interaction_type'
             ).annotate(count=Count('id'))
             
             week_ago = timezone.now() - timedelta(days=7)
-            recent_activities = UserActivity.objects.filter(
-                user=user,
-                timestamp__gte=week_ago
-            ).count()
+            counts = UserActivity.objects.filter(user=user).aggregate(
+                total=Count('id'),
+                recent=Count('id', filter=Q(timestamp__gte=week_ago))
+            )
             
             return Response({
                 'user_id': user.id,
-                'total_activities': total_activities,
-                'activities_last_7_days': recent_activities,
+                'total_activities': counts['total'],
+                'activities_last_7_days': counts['recent'],
                 'activity_breakdown': list(activity_breakdown)
             })
 
 
+def _trend_rows():
+    """
+    Per-artist and per-genre-list interaction counts over the last week,
+    grouped in the database rather than by loading every activity
+    """
+    week_ago = timezone.now() - timedelta(days=7)
+    
+    recent = UserActivity.objects.filter(
+        timestamp__gte=week_ago,
+        interaction_type__in=['play', 'like']
+    ).order_by()
+    
+    artist_rows = recent.values(
+        artist=F('recommendation__artist_name')
+    ).annotate(
+        interactions=Count('id')
+    ).order_by('-interactions', 'artist')[:10]
+    
+    genre_rows = recent.values(
+        genre_list=F('recommendation__genres')
+    ).annotate(interactions=Count('id'))
+    
+    return artist_rows, genre_rows
+
+
+def _rank_trends(artist_rows, genre_rows):
+    """Top artists and genres from the grouped counts of ``_trend_rows``"""
+    genre_counts = {}
+    for row in genre_rows:
+        for genre in row['genre_list'] or []:
+            genre_counts[genre] = genre_counts.get(genre, 0) + row['interactions']
+    
+    trending_genres = sorted(
+        genre_counts.items(), 
+        key=lambda x: (-x[1], x[0])
+    )[:10]
+    
+    return {
+        'trending_artists': [
+            {'name': row['artist'], 'interactions': row['interactions']} 
+            for row in artist_rows
+        ],
+        'trending_genres': [
+            {'name': genre, 'interactions': count} 
+            for genre, count in trending_genres
+        ]
+    }
+
+
+def _build_trends():
+    """Rank artists and genres by plays and likes over the last week"""
+    artist_rows, genre_rows = _trend_rows()
+    return _rank_trends(list(artist_rows), list(genre_rows))
+
+
 class TrendsView(APIView):
     """GET /analytics/trends/ - Trending genres/artists"""
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        week_ago = timezone.now() - timedelta(days=7)
-        
-        recent_activities = UserActivity.objects.filter(
-            timestamp__gte=week_ago,
-            interaction_type__in=['play', 'like']
-        ).select_related('recommendation')
-        
-        artist_counts = {}
-        genre_counts = {}
-        
-        for activity in recent_activities:
-            artist = activity.recommendation.artist_name
-            artist_counts[artist] = artist_counts.get(artist, 0) + 1
-            
-            for genre in activity.recommendation.genres:
-                genre_counts[genre] = genre_counts.get(genre, 0) + 1
-        
-        trending_artists = sorted(
-            artist_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10]
-        
-        trending_genres = sorted(
-            genre_counts.items(), 
-            key=lambda x: x[1], 
-            reverse=True
-        )[:10]
-        
-        return Response({
-            'trending_artists': [
-                {'name': artist, 'interactions': count} 
-                for artist, count in trending_artists
-            ],
-            'trending_genres': [
-                {'name': genre, 'interactions': count} 
-                for genre, count in trending_genres
-            ]
-        })
+        trends, _ = read_through('analytics_trends', _build_trends, timeout=600)
+        return Response(trends)
+
+
+def _build_engagement(user):
+    """Summarise a single user's activity"""
+    activity_breakdown = UserActivity.objects.filter(user=user).values(
+        'interaction_type'
+    ).annotate(count=Count('id'))
+    
+    week_ago = timezone.now() - timedelta(days=7)
+    counts = UserActivity.objects.filter(user=user).aggregate(
+        total=Count('id'),
+        recent=Count('id', filter=Q(timestamp__gte=week_ago))
+    )
+    
+    top_tracks = UserActivity.objects.filter(user=user).values(
+        'recommendation__track_name',
+        'recommendation__artist_name'
+    ).annotate(
+        interaction_count=Count('id')
+    ).order_by('-interaction_count')[:10]
+    
+    return {
+        'user_id': user.id,
+        'user_email': user.email,
+        'total_activities': counts['total'],
+        'activities_last_7_days': counts['recent'],
+        'activity_breakdown': list(activity_breakdown),
+        'top_tracks': list(top_tracks)
+    }
 
 
 class UserEngagementView(APIView):
@@ -150,30 +202,22 @@ class UserEngagementView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        total_activities = UserActivity.objects.filter(user=user).count()
-        
-        activity_breakdown = UserActivity.objects.filter(user=user).values(
-            'interaction_type'
-        ).annotate(count=Count('id'))
-        
-        week_ago = timezone.now() - timedelta(days=7)
-        recent_activities = UserActivity.objects.filter(
-            user=user, 
-            timestamp__gte=week_ago
-        ).count()
-        
-        top_tracks = UserActivity.objects.filter(user=user).values(
-            'recommendation__track_name',
-            'recommendation__artist_name'
-        ).annotate(
-            interaction_count=Count('id')
-        ).order_by('-interaction_count')[:10]
-        
-        return Response({
-            'user_id': user_id,
-            'user_email': user.email,
-            'total_activities': total_activities,
-            'activities_last_7_days': recent_activities,
-            'activity_breakdown': list(activity_breakdown),
-            'top_tracks': list(top_tracks)
-        })
+        engagement, _ = read_through(
+            f'engagement_user_{user_id}',
+            lambda: _build_engagement(user),
+            timeout=300
+        )
+        return Response(engagement)
+
+
+class CacheStatsView(APIView):
+    """GET /analytics/cache/ - Local cache hit ratios of the serving worker"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        if not hasattr(cache, 'l1_stats'):
+            return Response(
+                {'error': 'The cache backend has no local layer'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(cache.l1_stats())
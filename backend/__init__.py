@@ -0,0 +1,4 @@
+# Make sure the Celery app (and its task routing) is loaded with Django
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
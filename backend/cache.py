@@ -0,0 +1,170 @@
+"""
+Read-through cache helpers shared by the API views and background tasks.
+
+Entries are stored as ``(value, delta, expires_at)`` where ``delta`` is how long
+the value took to build. Readers use it to refresh entries slightly before they
+expire (XFetch), and entries are kept for a grace period past ``expires_at`` so
+that a single caller rebuilds them while everyone else is served the stale copy.
+
+``aread_through``/``astore`` are the same operations for async views, taking a
+coroutine function as ``rebuild``.
+"""
+import asyncio
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+# Seconds an expired entry is still served while it is being rebuilt
+STALE_TTL = 300
+# Seconds a rebuild lock is held before another caller may take over
+LOCK_TIMEOUT = 30
+# Seconds a cold-miss caller waits for another caller's rebuild
+LOCK_WAIT = 2.0
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _entry(value):
+    """
+    ``value`` if it is a read-through entry, else ``None``. Keys may still hold
+    a bare value written before they were read through (msgpack turns the
+    entry tuple into a list), which counts as a miss
+    """
+    if (
+        isinstance(value, (tuple, list)) and len(value) == 3
+        and isinstance(value[1], (int, float)) and isinstance(value[2], (int, float))
+    ):
+        return value
+    return None
+
+
+def store(key, value, timeout, delta=0.0, stale_ttl=STALE_TTL):
+    """Write ``value`` to ``key`` in the read-through entry format"""
+    expires_at = time.time() + timeout
+    cache.set(key, (value, delta, expires_at), timeout=timeout + stale_ttl)
+
+
+def store_many(values, timeout, delta=0.0, stale_ttl=STALE_TTL):
+    """``store`` for a dict of keys and values, in one round trip"""
+    expires_at = time.time() + timeout
+    cache.set_many(
+        {key: (value, delta, expires_at) for key, value in values.items()},
+        timeout=timeout + stale_ttl
+    )
+
+
+def read_many(keys):
+    """
+    Values of the unexpired read-through entries among ``keys``, fetched in
+    one round trip (``MGET`` on Redis). Expired and missing keys are left out
+    for the caller to rebuild, nobody is made to wait on a lock.
+    """
+    now = time.time()
+    entries = {key: _entry(value) for key, value in cache.get_many(keys).items()}
+    return {
+        key: entry[0]
+        for key, entry in entries.items()
+        if entry is not None and entry[2] > now
+    }
+
+
+def _should_refresh(delta, expires_at, beta):
+    """XFetch: refresh early with a probability that grows towards expiry"""
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+def _rebuild(key, rebuild, timeout, stale_ttl):
+    start = time.time()
+    value = rebuild()
+    store(key, value, timeout, delta=time.time() - start, stale_ttl=stale_ttl)
+    return value
+
+
+def read_through(key, rebuild, timeout, stale_ttl=STALE_TTL, beta=1.0):
+    """
+    Return ``(value, hit)`` for ``key``, calling ``rebuild()`` on a miss.
+
+    Only the caller holding the per-key lock runs ``rebuild``. Others get the
+    stale value if there is one, or wait briefly for the lock holder to finish.
+    """
+    entry = _entry(cache.get(key))
+    lock_key = _lock_key(key)
+
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _should_refresh(delta, expires_at, beta):
+            return value, True
+        if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            # Someone else is rebuilding, serve what we have
+            return value, True
+        try:
+            return _rebuild(key, rebuild, timeout, stale_ttl), False
+        finally:
+            cache.delete(lock_key)
+
+    if cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            return _rebuild(key, rebuild, timeout, stale_ttl), False
+        finally:
+            cache.delete(lock_key)
+
+    # Cold miss while another caller rebuilds: wait for its result
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        entry = _entry(cache.get(key))
+        if entry is not None:
+            return entry[0], True
+
+    # The lock holder is too slow, build it ourselves without waiting further
+    return _rebuild(key, rebuild, timeout, stale_ttl), False
+
+
+async def astore(key, value, timeout, delta=0.0, stale_ttl=STALE_TTL):
+    """Async variant of ``store``"""
+    expires_at = time.time() + timeout
+    await cache.aset(key, (value, delta, expires_at), timeout=timeout + stale_ttl)
+
+
+async def _arebuild(key, rebuild, timeout, stale_ttl):
+    start = time.time()
+    value = await rebuild()
+    await astore(key, value, timeout, delta=time.time() - start, stale_ttl=stale_ttl)
+    return value
+
+
+async def aread_through(key, rebuild, timeout, stale_ttl=STALE_TTL, beta=1.0):
+    """Async variant of ``read_through``, ``rebuild`` is a coroutine function"""
+    entry = _entry(await cache.aget(key))
+    lock_key = _lock_key(key)
+
+    if entry is not None:
+        value, delta, expires_at = entry
+        if not _should_refresh(delta, expires_at, beta):
+            return value, True
+        if not await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+            return value, True
+        try:
+            return await _arebuild(key, rebuild, timeout, stale_ttl), False
+        finally:
+            await cache.adelete(lock_key)
+
+    if await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+        try:
+            return await _arebuild(key, rebuild, timeout, stale_ttl), False
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = _entry(await cache.aget(key))
+        if entry is not None:
+            return entry[0], True
+
+    return await _arebuild(key, rebuild, timeout, stale_ttl), False
@@ -0,0 +1,343 @@
+"""
+Redis cache backend with a per-process LRU layer for hot keys.
+
+Only keys matching ``settings.L1_CACHE['KEYS']`` (fnmatch patterns) are kept in
+process memory. Every write or delete of such a key is broadcast over Redis
+pub/sub so that the other workers drop their local copy. Local entries hold the
+encoded value and are decoded on every hit, so a caller changing what it got
+back cannot change it for the rest of the process.
+
+The ``aget``/``aset``/``aadd``/``adelete`` methods talk to Redis through
+``redis.asyncio`` instead of Django's default thread-pool wrappers, sharing the
+sync client's key format and serializer so both paths read each other's values.
+
+Values are encoded per key prefix (``settings.CACHE_CODECS``) before they reach
+django-redis, see ``backend.cache_codecs``.
+"""
+import asyncio
+import fnmatch
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import RedisCache
+import redis.asyncio as aioredis
+
+from .cache_codecs import CodecRouter, EncodedValue, decode
+from .middleware import note_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _l1_decode(stored):
+    # Plain ints are stored as is, everything else as its envelope
+    return decode(stored) if isinstance(stored, EncodedValue) else stored
+
+
+class _LocalStore:
+    """Bounded, thread-safe LRU with per-entry expiry and per-prefix stats"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = {}
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return _MISSING
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return _MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, max_entries):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def record(self, prefix, hit):
+        with self.lock:
+            counts = self.stats.setdefault(prefix, [0, 0])
+            counts[0 if hit else 1] += 1
+
+
+# Django creates one cache instance per thread, the local layer is per process
+_store = _LocalStore()
+_listener = {'pid': None, 'thread': None}
+_listener_lock = threading.Lock()
+_SENDER_ID = uuid.uuid4().hex
+# Async connection pools cannot be shared across event loops
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class L1RedisCache(RedisCache):
+    """django-redis cache that serves configured hot keys from process memory"""
+
+    def __init__(self, server, params):
+        super().__init__(server, params)
+        config = getattr(settings, 'L1_CACHE', {})
+        self._l1_patterns = list(config.get('KEYS', []))
+        self._l1_regexes = [re.compile(fnmatch.translate(p)) for p in self._l1_patterns]
+        self._l1_max_entries = config.get('MAX_ENTRIES', 1024)
+        self._l1_timeout = config.get('TIMEOUT', 30)
+        self._l1_channel = f"{params.get('KEY_PREFIX', '')}:l1_invalidate"
+        self._codecs = CodecRouter(getattr(settings, 'CACHE_CODECS', {}))
+
+    def _l1_prefix(self, key):
+        """Return the configured pattern ``key`` falls under, if any"""
+        for pattern, regex in zip(self._l1_patterns, self._l1_regexes):
+            if regex.match(key):
+                return pattern
+        return None
+
+    def _encode(self, key, value):
+        # Plain ints stay plain so django-redis can still incr/decr them
+        if type(value) is int:
+            return value
+        return self._codecs.codec_for(key).encode(value)
+
+    def _l1_key(self, key, version):
+        return self.make_key(key, version=version)
+
+    def _l1_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._l1_timeout
+        return max(0, min(self._l1_timeout, timeout))
+
+    # Invalidation
+
+    def _ensure_listener(self):
+        pid = os.getpid()
+        if _listener['pid'] == pid:
+            return
+        with _listener_lock:
+            if _listener['pid'] == pid:
+                return
+            # Anything inherited from a parent process may already be stale
+            _store.clear()
+            thread = threading.Thread(
+                target=self._listen, name='l1-cache-invalidation', daemon=True
+            )
+            _listener['pid'] = pid
+            _listener['thread'] = thread
+            thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.get_client(write=True).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self._l1_channel)
+                # Messages may have been missed while disconnected
+                _store.clear()
+                for message in pubsub.listen():
+                    sender, _, key = message['data'].decode().partition(' ')
+                    if sender == _SENDER_ID:
+                        continue
+                    if key == '*':
+                        _store.clear()
+                    else:
+                        _store.discard(key)
+            except Exception as exc:
+                logger.warning(f"L1 cache invalidation listener failed: {exc}")
+                _store.clear()
+                time.sleep(1)
+
+    def _broadcast(self, key):
+        try:
+            self.client.get_client(write=True).publish(
+                self._l1_channel, f'{_SENDER_ID} {key}'
+            )
+        except Exception as exc:
+            logger.warning(f"Could not broadcast L1 invalidation for {key}: {exc}")
+
+    # Cache API
+
+    def get(self, key, default=None, version=None, client=None):
+        prefix = self._l1_prefix(key)
+        if prefix is None:
+            value = super().get(key, default=_MISSING, version=version, client=client)
+            note_cache_lookup(value is not _MISSING)
+            return default if value is _MISSING else value
+
+        self._ensure_listener()
+        l1_key = self._l1_key(key, version)
+        stored = _store.get(l1_key)
+        _store.record(prefix, stored is not _MISSING)
+        if stored is not _MISSING:
+            note_cache_lookup(True)
+            return _l1_decode(stored)
+
+        value = super().get(key, default=_MISSING, version=version, client=client)
+        note_cache_lookup(value is not _MISSING)
+        if value is _MISSING:
+            return default
+        _store.set(l1_key, self._encode(key, value), self._l1_timeout, self._l1_max_entries)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None, nx=False, xx=False):
+        encoded = self._encode(key, value)
+        result = super().set(
+            key, encoded, timeout=timeout, version=version, client=client, nx=nx, xx=xx
+        )
+        if self._l1_prefix(key) is not None and result:
+            self._ensure_listener()
+            l1_key = self._l1_key(key, version)
+            _store.set(l1_key, encoded, self._l1_ttl(timeout), self._l1_max_entries)
+            self._broadcast(l1_key)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        return self.set(key, value, timeout=timeout, version=version, client=client, nx=True)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None, client=None):
+        encoded = {key: self._encode(key, value) for key, value in data.items()}
+        result = super().set_many(encoded, timeout=timeout, version=version, client=client)
+        for key, value in encoded.items():
+            if self._l1_prefix(key) is not None:
+                self._ensure_listener()
+                l1_key = self._l1_key(key, version)
+                _store.set(l1_key, value, self._l1_ttl(timeout), self._l1_max_entries)
+                self._broadcast(l1_key)
+        return result
+
+    def delete(self, key, version=None, prefix=None, client=None):
+        result = super().delete(key, version=version, prefix=prefix, client=client)
+        if self._l1_prefix(key) is not None:
+            l1_key = self._l1_key(key, version)
+            _store.discard(l1_key)
+            self._broadcast(l1_key)
+        return result
+
+    def delete_many(self, keys, version=None):
+        result = super().delete_many(keys, version=version)
+        for key in keys:
+            if self._l1_prefix(key) is not None:
+                l1_key = self._l1_key(key, version)
+                _store.discard(l1_key)
+                self._broadcast(l1_key)
+        return result
+
+    def clear(self):
+        result = super().clear()
+        _store.clear()
+        self._broadcast('*')
+        return result
+
+    # Async cache API
+
+    def async_client(self):
+        """The ``redis.asyncio`` client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = _async_clients.get(loop)
+        if client is None:
+            server = self._server if isinstance(self._server, str) else self._server[0]
+            client = aioredis.from_url(server.split(',')[0])
+            _async_clients[loop] = client
+        return client
+
+    async def _abroadcast(self, key):
+        try:
+            await self.async_client().publish(self._l1_channel, f'{_SENDER_ID} {key}')
+        except Exception as exc:
+            logger.warning(f"Could not broadcast L1 invalidation for {key}: {exc}")
+
+    async def aget(self, key, default=None, version=None):
+        prefix = self._l1_prefix(key)
+        if prefix is not None:
+            self._ensure_listener()
+            l1_key = self._l1_key(key, version)
+            stored = _store.get(l1_key)
+            _store.record(prefix, stored is not _MISSING)
+            if stored is not _MISSING:
+                note_cache_lookup(True)
+                return _l1_decode(stored)
+
+        raw = await self.async_client().get(self.client.make_key(key, version=version))
+        note_cache_lookup(raw is not None)
+        if raw is None:
+            return default
+        value = self.client.decode(raw)
+        if prefix is not None:
+            _store.set(l1_key, self._encode(key, value), self._l1_timeout, self._l1_max_entries)
+        return value
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None, nx=False):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        px = None
+        if timeout is not None:
+            px = int(timeout * 1000)
+            if px <= 0:
+                # Same semantics as the sync client: expired means deleted
+                if nx:
+                    return False
+                return await self.adelete(key, version=version)
+
+        encoded = self._encode(key, value)
+        result = bool(await self.async_client().set(
+            self.client.make_key(key, version=version),
+            self.client.encode(encoded),
+            nx=nx, px=px
+        ))
+        if self._l1_prefix(key) is not None and result:
+            self._ensure_listener()
+            l1_key = self._l1_key(key, version)
+            _store.set(l1_key, encoded, self._l1_ttl(timeout), self._l1_max_entries)
+            await self._abroadcast(l1_key)
+        return result
+
+    async def aadd(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return await self.aset(key, value, timeout=timeout, version=version, nx=True)
+
+    async def adelete(self, key, version=None):
+        result = bool(await self.async_client().delete(self.client.make_key(key, version=version)))
+        if self._l1_prefix(key) is not None:
+            l1_key = self._l1_key(key, version)
+            _store.discard(l1_key)
+            await self._abroadcast(l1_key)
+        return result
+
+    def l1_stats(self):
+        """Hit/miss counts and hit ratio of the local layer per key pattern"""
+        with _store.lock:
+            stats = {prefix: tuple(counts) for prefix, counts in _store.stats.items()}
+            size = len(_store.entries)
+        return {
+            'pid': os.getpid(),
+            'entries': size,
+            'prefixes': {
+                prefix: {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                }
+                for prefix, (hits, misses) in stats.items()
+            },
+        }
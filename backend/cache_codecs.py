@@ -0,0 +1,190 @@
+"""
+Versioned, per-key-prefix encoding of cached values.
+
+Every value is stored as a small envelope::
+
+    0xC1 | version | codec id | compression id | payload
+
+The header says how the payload was written, so codecs and compression
+settings can change per prefix (``settings.CACHE_CODECS``, fnmatch patterns
+like ``L1_CACHE``) without flushing Redis: old entries still decode, and
+values without the header are read as the plain pickles django-redis wrote
+before envelopes existed.
+
+``L1RedisCache`` picks the codec from the key and hands django-redis an
+``EncodedValue``, which ``EnvelopeSerializer`` stores unchanged. Anything
+written without a key (or by plain django-redis code paths) gets the
+``DEFAULT`` codec.
+"""
+import fnmatch
+import pickle
+import re
+import zlib
+
+import msgpack
+from django_redis.serializers.base import BaseSerializer
+
+MAGIC = b'\xc1'
+VERSION = 1
+
+PICKLE = 0
+MSGPACK = 1
+CODEC_IDS = {'pickle': PICKLE, 'msgpack': MSGPACK}
+
+NO_COMPRESSION = 0
+ZLIB = 1
+
+DEFAULT_CONFIG = {
+    'CODEC': 'pickle',
+    # Payloads at least this large are zlib compressed, None disables it
+    'COMPRESS_MIN_BYTES': 1024,
+    'COMPRESS_LEVEL': 1,
+}
+
+
+class EncodedValue(bytes):
+    """An envelope already encoded for its key, stored as is"""
+
+
+# msgpack extension holding a list of same-keyed dicts as keys + row arrays
+TABLE_EXT = 1
+
+
+_CONTAINERS = (list, tuple, dict)
+
+
+def _tabulate(value):
+    """Replace lists of dicts sharing the same keys with TABLE_EXT values"""
+    if isinstance(value, (list, tuple)):
+        if len(value) > 1 and type(value[0]) is dict:
+            keys = list(value[0])
+            if all(type(item) is dict and list(item) == keys for item in value):
+                rows = [
+                    [_tabulate(field) if isinstance(field, _CONTAINERS) else field for field in item.values()]
+                    for item in value
+                ]
+                # Rows are tabulated already, pack them directly
+                return msgpack.ExtType(TABLE_EXT, _pack([keys, rows]))
+        return [_tabulate(item) if isinstance(item, _CONTAINERS) else item for item in value]
+    if type(value) is dict:
+        return {
+            key: _tabulate(item) if isinstance(item, _CONTAINERS) else item
+            for key, item in value.items()
+        }
+    return value
+
+
+def _ext_hook(code, data):
+    if code == TABLE_EXT:
+        keys, rows = _msgpack_loads(data)
+        return [dict(zip(keys, row)) for row in rows]
+    return msgpack.ExtType(code, data)
+
+
+def _pack(value):
+    # Aware datetimes use msgpack's timestamp extension, tuples become lists
+    return msgpack.packb(value, use_bin_type=True, datetime=True)
+
+
+def _msgpack_dumps(value):
+    return _pack(_tabulate(value))
+
+
+def _msgpack_loads(payload):
+    return msgpack.unpackb(
+        payload, raw=False, timestamp=3, strict_map_key=False, ext_hook=_ext_hook
+    )
+
+
+class Codec:
+    def __init__(self, config=None):
+        config = {**DEFAULT_CONFIG, **(config or {})}
+        self.name = config['CODEC']
+        self.codec_id = CODEC_IDS[self.name]
+        self.compress_min_bytes = config['COMPRESS_MIN_BYTES']
+        self.compress_level = config['COMPRESS_LEVEL']
+
+    def encode(self, value):
+        codec_id = self.codec_id
+        payload = None
+        if codec_id == MSGPACK:
+            try:
+                payload = _msgpack_dumps(value)
+            except (TypeError, ValueError):
+                # Model instances, naive datetimes, ... are still cacheable
+                codec_id = PICKLE
+        if payload is None:
+            payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        compression = NO_COMPRESSION
+        if self.compress_min_bytes is not None and len(payload) >= self.compress_min_bytes:
+            compressed = zlib.compress(payload, self.compress_level)
+            if len(compressed) < len(payload):
+                payload, compression = compressed, ZLIB
+
+        return EncodedValue(MAGIC + bytes((VERSION, codec_id, compression)) + payload)
+
+
+def decode(data):
+    data = bytes(data)
+    if not data.startswith(MAGIC):
+        return pickle.loads(data)
+    version, codec_id, compression = data[1], data[2], data[3]
+    if version != VERSION:
+        raise ValueError(f'Unknown cache envelope version {version}')
+    payload = data[4:]
+    if compression == ZLIB:
+        payload = zlib.decompress(payload)
+    if codec_id == MSGPACK:
+        return _msgpack_loads(payload)
+    return pickle.loads(payload)
+
+
+def describe(data):
+    """``(codec, compressed)`` of a stored value, for reporting"""
+    data = bytes(data)
+    if not data.startswith(MAGIC):
+        return 'legacy-pickle', False
+    names = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+    return names.get(data[2], 'unknown'), data[3] == ZLIB
+
+
+class CodecRouter:
+    """Maps keys to the codec of the first matching ``CACHE_CODECS`` pattern"""
+
+    def __init__(self, config):
+        config = dict(config or {})
+        self.default = Codec(config.pop('DEFAULT', None))
+        self.routes = [
+            (pattern, re.compile(fnmatch.translate(pattern)), Codec(options))
+            for pattern, options in config.items()
+        ]
+
+    def pattern_for(self, key):
+        for pattern, regex, _ in self.routes:
+            if regex.match(key):
+                return pattern
+        return 'DEFAULT'
+
+    def codec_for(self, key):
+        for _, regex, codec in self.routes:
+            if regex.match(key):
+                return codec
+        return self.default
+
+
+class EnvelopeSerializer(BaseSerializer):
+    """django-redis serializer storing ``EncodedValue``s unchanged"""
+
+    def __init__(self, options):
+        from django.conf import settings
+        self.default = Codec(getattr(settings, 'CACHE_CODECS', {}).get('DEFAULT'))
+        super().__init__(options=options)
+
+    def dumps(self, value):
+        if isinstance(value, EncodedValue):
+            return bytes(value)
+        return bytes(self.default.encode(value))
+
+    def loads(self, value):
+        return decode(value)
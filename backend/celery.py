@@ -8,11 +8,37 @@ app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# Queue depth and wait-time tracking per lane
+import backend.task_metrics  # noqa: E402,F401
+
 # Periodic Tasks
 app.conf.beat_schedule = {
-    'refresh-all-user-recommendations': {
-        'task': 'recommendations.tasks.refresh_all_users_recommendations',
-        'schedule': crontab(hour='*/6'),  # Every 6 hours
+    # Queue active users with stale recommendations, spread over the hour
+    'schedule-stale-refreshes': {
+        'task': 'recommendations.tasks.schedule_stale_refreshes',
+        'schedule': crontab(minute=0),
+    },
+    # Enqueue users who are due (stale or with changed preferences)
+    'dispatch-due-refreshes': {
+        'task': 'recommendations.tasks.dispatch_due_refreshes',
+        'schedule': crontab(),  # Every minute
+    },
+    # Drop catalog snapshot tracks not seen for a month
+    'prune-catalog-tracks': {
+        'task': 'recommendations.tasks.prune_catalog_tracks',
+        'schedule': crontab(minute=0, hour=4),
+    },
+    # Delete expired refresh tokens, then rebuild the blacklist filter
+    'prune-expired-tokens': {
+        'task': 'users.tasks.prune_expired_tokens',
+        'schedule': crontab(minute=30, hour=3),
+    },
+    # Bring the filter back quickly if it was never built or got lost, else
+    # re-add the last two hours of blacklistings
+    'ensure-blacklist-filter': {
+        'task': 'users.tasks.rebuild_blacklist_filter',
+        'schedule': crontab(minute=15),
+        'kwargs': {'if_missing': True},
     },
 }
 
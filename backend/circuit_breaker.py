@@ -0,0 +1,158 @@
+"""
+Circuit breaker with its state in Redis, shared by every web and worker
+process.
+
+Closed: calls go through and their outcomes are counted in ``WINDOW``
+second buckets. Errors and calls slower than ``SLOW_CALL_SECONDS`` are
+failures; once at least ``MIN_CALLS`` calls were seen and the failure rate
+reaches ``FAILURE_RATE``, the circuit opens.
+
+Open: ``allow()`` raises ``CircuitOpen`` immediately for ``OPEN_SECONDS``.
+
+Half-open: afterwards a single caller is let through as a probe (the others
+still fail fast). Its success closes the circuit, its failure opens it again.
+
+If Redis is unreachable the breaker stays out of the way and allows calls.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_TRANSITIONS = Counter(
+    'circuit_transitions', 'Circuit breaker state changes', ['circuit', 'state']
+)
+CIRCUIT_REJECTED = Counter(
+    'circuit_rejected', 'Calls refused by an open circuit breaker', ['circuit']
+)
+
+DEFAULT_CONFIG = {
+    'WINDOW': 60,
+    'MIN_CALLS': 20,
+    'FAILURE_RATE': 0.5,
+    'SLOW_CALL_SECONDS': 5,
+    'OPEN_SECONDS': 30,
+    # A probe that never reports back frees the slot after this long
+    'PROBE_SECONDS': 30,
+}
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f'Circuit {name} is open, retry after {retry_after}s')
+        self.name = name
+        self.retry_after = retry_after
+
+
+def _prefix():
+    return settings.CACHES['default'].get('KEY_PREFIX', '')
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, config=None):
+        self.name = name
+        config = {**DEFAULT_CONFIG, **(config or {})}
+        self.window = config['WINDOW']
+        self.min_calls = config['MIN_CALLS']
+        self.failure_rate = config['FAILURE_RATE']
+        self.slow_call_seconds = config['SLOW_CALL_SECONDS']
+        self.open_seconds = config['OPEN_SECONDS']
+        self.probe_seconds = config['PROBE_SECONDS']
+
+    def _key(self, suffix):
+        return f"{_prefix()}:circuit:{self.name}:{suffix}"
+
+    def _bucket_key(self, bucket):
+        return self._key(f'calls:{bucket}')
+
+    def allow(self):
+        """
+        Return ``True`` if the call is the half-open probe, ``False`` for an
+        ordinary call, or raise ``CircuitOpen``
+        """
+        try:
+            redis = get_redis_connection('default')
+            pipe = redis.pipeline(transaction=False)
+            pipe.pttl(self._key('open'))
+            pipe.exists(self._key('half_open'))
+            open_ms, half_open = pipe.execute()
+            if open_ms > 0 or open_ms == -1:
+                self._reject(max(1, round(open_ms / 1000)) if open_ms > 0 else self.open_seconds)
+            if not half_open:
+                return False
+            if redis.set(self._key('probe'), 1, nx=True, ex=self.probe_seconds):
+                return True
+        except CircuitOpen:
+            raise
+        except Exception as exc:
+            logger.warning(f"Circuit {self.name} state unavailable, allowing call: {exc}")
+            return False
+        self._reject(self.probe_seconds)
+
+    def _reject(self, retry_after):
+        CIRCUIT_REJECTED.inc(circuit=self.name)
+        raise CircuitOpen(self.name, retry_after)
+
+    def state(self):
+        redis = get_redis_connection('default')
+        if redis.exists(self._key('open')):
+            return 'open'
+        if redis.exists(self._key('half_open')):
+            return 'half_open'
+        return 'closed'
+
+    def record(self, success, duration, probe=False):
+        """Report the outcome of a call ``allow()`` let through"""
+        failed = not success or duration >= self.slow_call_seconds
+        try:
+            redis = get_redis_connection('default')
+            if probe:
+                if failed:
+                    self._open(redis)
+                else:
+                    self._close(redis)
+                return
+
+            now = time.time()
+            bucket = int(now // self.window)
+            pipe = redis.pipeline(transaction=False)
+            pipe.hincrby(self._bucket_key(bucket), 'calls', 1)
+            pipe.hincrby(self._bucket_key(bucket), 'failures', int(failed))
+            pipe.expire(self._bucket_key(bucket), self.window * 2)
+            pipe.hgetall(self._bucket_key(bucket - 1))
+            calls, failures, _, previous = pipe.execute()
+            if not failed:
+                return
+
+            # Sliding window: the previous bucket counts for the part still inside it
+            weight = 1 - (now % self.window) / self.window
+            calls += int(previous.get(b'calls', 0)) * weight
+            failures += int(previous.get(b'failures', 0)) * weight
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self._open(redis)
+        except Exception as exc:
+            logger.warning(f"Could not record circuit {self.name} outcome: {exc}")
+
+    def _open(self, redis):
+        pipe = redis.pipeline()
+        pipe.set(self._key('open'), 1, ex=self.open_seconds)
+        pipe.set(self._key('half_open'), 1)
+        pipe.delete(self._key('probe'))
+        pipe.execute()
+        CIRCUIT_TRANSITIONS.inc(circuit=self.name, state='open')
+        logger.warning(f"Circuit {self.name} opened for {self.open_seconds}s")
+
+    def _close(self, redis):
+        bucket = int(time.time() // self.window)
+        redis.delete(
+            self._key('half_open'), self._key('probe'),
+            self._bucket_key(bucket), self._bucket_key(bucket - 1)
+        )
+        CIRCUIT_TRANSITIONS.inc(circuit=self.name, state='closed')
+        logger.info(f"Circuit {self.name} closed")
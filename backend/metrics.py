@@ -0,0 +1,196 @@
+"""
+Prometheus metrics shared by every web and worker process.
+
+Counters and histograms live in Redis hashes, one per metric, whose fields are
+the rendered sample names (``name_bucket{view="x",le="0.1"}``) and whose values
+are the running totals. Every gunicorn/uvicorn worker and Celery process
+increments the same hashes, so ``/metrics`` on any instance returns totals for
+the whole deployment without a multiprocess directory or per-worker scraping.
+
+Updates are summed in memory per unit of work (a request, a task) and flushed
+in one pipelined round trip, one HINCRBYFLOAT per distinct sample. Histograms
+store only the bucket each observation falls in, and ``render`` accumulates
+them, so an observation costs three increments whatever the bucket count.
+Nothing is written while ``METRICS_ENABLED`` is off. Apps declare their
+metrics in a ``metrics`` module, which ``render`` imports so a process that
+never used them still reports them.
+
+The endpoint is meant for the internal network: compose publishes the app
+ports on loopback only, nginx refuses ``/metrics``, and with ``METRICS_TOKEN``
+set scrapes must send it as a bearer token.
+"""
+import hmac
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.module_loading import autodiscover_modules
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_registry = {}
+_buffer = ContextVar('metrics_buffer', default=None)
+
+
+def _enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def _metric_key(name):
+    # v2: histogram buckets are stored per bucket, no longer cumulatively
+    return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:metrics:v2:{name}"
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+    @property
+    def family(self):
+        """Name used in the HELP/TYPE lines"""
+        return self.name
+
+    def _pairs(self, labels):
+        return [(name, labels.get(name, '')) for name in self.labelnames]
+
+    def _incr(self, field, amount):
+        if not _enabled():
+            return
+        buffer = _buffer.get()
+        if buffer is not None:
+            buffer[(_metric_key(self.name), field)] += amount
+            return
+        try:
+            get_redis_connection('default').hincrbyfloat(_metric_key(self.name), field, amount)
+        except Exception as exc:
+            logger.warning(f"Could not record metric {self.name}: {exc}")
+
+    def samples(self, fields):
+        """``(sample, value)`` lines to render from the stored hash ``fields``"""
+        return [(field, fields[field]) for field in sorted(fields)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    @property
+    def family(self):
+        return f'{self.name}_total'
+
+    def inc(self, amount=1, **labels):
+        self._incr(f'{self.family}{_labels(self._pairs(labels))}', amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        labelset = _labels(self._pairs(labels))
+        bound = next((bound for bound in self.buckets if value <= bound), '+Inf')
+        self._incr(f'{self.name}_bucket{labelset} le={bound}', 1)
+        self._incr(f'{self.name}_sum{labelset}', value)
+        self._incr(f'{self.name}_count{labelset}', 1)
+
+    def samples(self, fields):
+        """Cumulative buckets for every label set, then its sum and count"""
+        counts = f'{self.name}_count'
+        lines = []
+        for count_field in sorted(field for field in fields if field.startswith(counts)):
+            labelset = count_field[len(counts):]
+            cumulative = 0.0
+            for bound in self.buckets + ('+Inf',):
+                cumulative += float(fields.get(f'{self.name}_bucket{labelset} le={bound}', 0))
+                le = f'le="{bound}"'
+                merged = labelset[:-1] + ',' + le + '}' if labelset else '{' + le + '}'
+                lines.append((f'{self.name}_bucket{merged}', cumulative))
+            lines.append((f'{self.name}_sum{labelset}', fields.get(f'{self.name}_sum{labelset}', 0)))
+            lines.append((count_field, fields[count_field]))
+        return lines
+
+
+@contextmanager
+def batch():
+    """Sum every metric update in this context and flush them in one round trip"""
+    if _buffer.get() is not None or not _enabled():
+        yield
+        return
+    buffer = defaultdict(float)
+    token = _buffer.set(buffer)
+    try:
+        yield
+    finally:
+        _buffer.reset(token)
+    if not buffer:
+        return
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for (key, field), amount in buffer.items():
+            pipe.hincrbyfloat(key, field, amount)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Could not flush metrics: {exc}")
+
+
+def _format_value(raw):
+    value = float(raw)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    autodiscover_modules('metrics')
+    redis = get_redis_connection('default')
+    pipe = redis.pipeline(transaction=False)
+    metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+    for metric in metrics:
+        pipe.hgetall(_metric_key(metric.name))
+
+    lines = []
+    for metric, samples in zip(metrics, pipe.execute()):
+        lines.append(f'# HELP {metric.family} {metric.documentation}')
+        lines.append(f'# TYPE {metric.family} {metric.kind}')
+        fields = {field.decode(): value for field, value in samples.items()}
+        for sample, value in metric.samples(fields):
+            lines.append(f'{sample} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Drop every stored sample, e.g. between benchmark runs"""
+    get_redis_connection('default').delete(*[_metric_key(name) for name in _registry])
+
+
+def metrics_view(request):
+    """GET /metrics - Prometheus scrape endpoint (bearer ``METRICS_TOKEN`` when set)"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,137 @@
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+REQUEST_LATENCY = metrics.Histogram(
+    'http_request_duration_seconds', 'Request latency by URL name', ['view', 'method']
+)
+REQUESTS = metrics.Counter(
+    'http_requests', 'Requests by URL name and status code', ['view', 'method', 'status']
+)
+REQUEST_QUERIES = metrics.Histogram(
+    'http_request_db_queries', 'Database queries per request', ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+REQUEST_QUERY_TIME = metrics.Counter(
+    'http_request_db_query_seconds', 'Time spent in database queries', ['view']
+)
+REQUEST_CACHE = metrics.Counter(
+    'http_request_cache_lookups', 'Cache reads by result (hit/miss)', ['view', 'result']
+)
+RESPONSE_SIZE = metrics.Histogram(
+    'http_response_size_bytes', 'Response body size', ['view'], buckets=metrics.SIZE_BUCKETS
+)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'query_seconds', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+# Context variables follow the request into sync_to_async threads
+_request_stats = ContextVar('request_stats', default=None)
+
+
+def note_cache_lookup(hit):
+    """Called by the cache backend for every read"""
+    stats = _request_stats.get()
+    if stats is not None:
+        if hit:
+            stats.cache_hits += 1
+        else:
+            stats.cache_misses += 1
+
+
+def _time_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - start
+
+
+def _install_query_timer(connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record latency, DB queries, cache reads and response size per URL name.
+
+    Goes first in MIDDLEWARE so the latency covers the whole stack. The query
+    timer is installed on every database connection (each thread has its own),
+    so views need no changes to be covered.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(_install_query_timer, dispatch_uid='request_metrics_query_timer')
+        for connection in connections.all(initialized_only=True):
+            _install_query_timer(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        await sync_to_async(self._record, thread_sensitive=False)(
+            request, response, stats, time.perf_counter() - start
+        )
+        return response
+
+    def _record(self, request, response, stats, elapsed):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else '<unmatched>'
+        with metrics.batch():
+            REQUEST_LATENCY.observe(elapsed, view=view, method=request.method)
+            REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+            REQUEST_QUERIES.observe(stats.queries, view=view)
+            if stats.queries:
+                REQUEST_QUERY_TIME.inc(stats.query_seconds, view=view)
+            if stats.cache_hits:
+                REQUEST_CACHE.inc(stats.cache_hits, view=view, result='hit')
+            if stats.cache_misses:
+                REQUEST_CACHE.inc(stats.cache_misses, view=view, result='miss')
+            # Streaming responses (SSE) have no size up front
+            if not response.streaming:
+                RESPONSE_SIZE.observe(len(response.content), view=view)
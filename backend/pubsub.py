@@ -0,0 +1,103 @@
+"""
+Application events delivered over Redis pub/sub.
+
+Tasks publish with ``publish()``. Async consumers use ``hub.subscribe()``, which
+shares one Redis connection per process and fans messages out to local queues,
+so holding many idle client connections costs no extra Redis connections.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+import redis.asyncio as aioredis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds a subscriber waits for the Redis subscription before going on without it
+READY_TIMEOUT = 5
+
+
+def _prefix():
+    return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:events:"
+
+
+def publish(name, payload):
+    """Publish ``payload`` as JSON to the event channel ``name``"""
+    get_redis_connection('default').publish(_prefix() + name, json.dumps(payload))
+
+
+class EventHub:
+    """Single pattern subscription per process, dispatched to asyncio queues"""
+
+    def __init__(self):
+        self.queues = defaultdict(set)
+        self.loop = None
+        self.task = None
+        self.ready = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is loop and self.task is not None and not self.task.done():
+            return
+        self.loop = loop
+        self.ready = asyncio.Event()
+        self.task = loop.create_task(self._run())
+
+    async def _run(self):
+        prefix = _prefix()
+        while True:
+            client = aioredis.from_url(settings.CACHES['default']['LOCATION'])
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(prefix + '*')
+                self.ready.set()
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    name = message['channel'].decode()[len(prefix):]
+                    payload = json.loads(message['data'])
+                    for queue in self.queues.get(name, ()):
+                        queue.put_nowait(payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Event hub connection failed: {exc}")
+                self.ready.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+    @property
+    def connected(self):
+        """Whether published payloads currently reach the queues"""
+        return self.ready is not None and self.ready.is_set()
+
+    @asynccontextmanager
+    async def subscribe(self, name):
+        """
+        Yield a queue receiving every payload published to ``name``. If Redis
+        cannot be subscribed to within READY_TIMEOUT the queue is yielded
+        anyway, and only fills once it is; callers check ``connected``
+        """
+        self._start()
+        queue = asyncio.Queue()
+        self.queues[name].add(queue)
+        try:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout=READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Event hub not subscribed after {READY_TIMEOUT}s, {name} goes on without it")
+            yield queue
+        finally:
+            self.queues[name].discard(queue)
+            if not self.queues[name]:
+                del self.queues[name]
+
+
+hub = EventHub()
@@ -0,0 +1,47 @@
+"""
+orjson-backed JSON rendering with the output of DRF's JSONRenderer.
+
+Types orjson does not format the way DRF does (datetimes, lazy strings,
+decimals, ...) are passed to DRF's own encoder, and data orjson refuses
+outright (integers beyond 64 bits) is rendered by DRF instead, so responses
+stay byte-identical while the common case skips ``json.dumps``.
+
+Two float cases still differ from DRF, as finding them would mean walking
+the data on every render:
+
+- NaN and Infinity render as ``null``, where DRF (``STRICT_JSON``) raises
+  ``ValueError``.
+- Exponents are written without sign or padding (``1e16``, ``1e-7``) where
+  DRF writes ``1e+16`` and ``1e-07``. Both parse to the same number.
+"""
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+_encoder = JSONEncoder()
+_renderer = JSONRenderer()
+
+
+def dumps(data):
+    """Compact, unicode JSON bytes as DRF's JSONRenderer would produce them"""
+    try:
+        content = orjson.dumps(data, default=_encoder.default, option=_OPTIONS)
+    except orjson.JSONEncodeError:
+        # Also re-raises what DRF cannot encode either
+        return _renderer.render(data)
+    # DRF escapes these two so the output is also valid JavaScript
+    if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Drop-in JSONRenderer using orjson, falling back to it for indented output"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -39,6 +40,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'users.middleware.LastSeenMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -61,6 +63,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Serve the read-heavy endpoints with native async views (ASGI workers only)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+
 # Database
 DATABASES = {
     'default': {
@@ -108,23 +113,64 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Task lanes: user-triggered refreshes jump ahead of periodic/bulk refreshes,
+# housekeeping runs on its own. Each lane has dedicated workers (docker-compose.yml)
+CELERY_TASK_QUEUE_LANES = ['interactive', 'batch', 'maintenance']
+CELERY_TASK_DEFAULT_QUEUE = 'batch'
+CELERY_TASK_ROUTES = {
+    'recommendations.tasks.refresh_all_users_recommendations': {'queue': 'maintenance'},
+    'recommendations.tasks.schedule_stale_refreshes': {'queue': 'maintenance'},
+    'recommendations.tasks.dispatch_due_refreshes': {'queue': 'maintenance'},
+    'recommendations.tasks.prune_catalog_tracks': {'queue': 'maintenance'},
+    'recommendations.tasks.plan_bulk_refresh': {'queue': 'maintenance'},
+    'recommendations.tasks.refresh_bulk_chunk': {'queue': 'maintenance'},
+    'users.tasks.prune_expired_tokens': {'queue': 'maintenance'},
+    'users.tasks.rebuild_blacklist_filter': {'queue': 'maintenance'},
+}
+
+# Task runs taking at least this many seconds are kept as slow samples (task_timings)
+TASK_SLOW_THRESHOLD = float(os.getenv('TASK_SLOW_THRESHOLD', 10))
+
 # Redis Cache Configuration
 CACHES = {
     'default': {
-        'BACKEND': 'django_redis.cache.RedisCache',
+        'BACKEND': 'backend.cache_backends.L1RedisCache',
         'LOCATION': os.getenv('REDIS_URL', 'redis://redis:6379/1'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SERIALIZER': 'backend.cache_codecs.EnvelopeSerializer',
         },
         'KEY_PREFIX': 'music_discovery',
         'TIMEOUT': 3600,
     }
 }
 
+# Per-request latency/query/cache metrics exposed at /metrics, see backend/metrics.py
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Bearer token Prometheus must send to /metrics, unchecked when empty
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Encoding of cached values by key pattern (backend/cache_codecs.py). msgpack
+# falls back to pickle per value for types it cannot represent
+CACHE_CODECS = {
+    'DEFAULT': {'CODEC': 'pickle', 'COMPRESS_MIN_BYTES': 1024},
+    'recommendations_user_*': {'CODEC': 'msgpack', 'COMPRESS_MIN_BYTES': 512},
+    'engagement_user_*': {'CODEC': 'msgpack', 'COMPRESS_MIN_BYTES': 512},
+    'analytics_trends': {'CODEC': 'msgpack', 'COMPRESS_MIN_BYTES': 512},
+    'spotify_artist_genres_*': {'CODEC': 'msgpack'},
+}
+
+# Per-process cache in front of Redis for hot, rarely changing keys
+L1_CACHE = {
+    'KEYS': ['analytics_trends', 'spotify_access_token'],
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 30,
+}
+
 # DRF Settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -133,16 +179,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'backend.throttling.AnonRateThrottle',
+        'backend.throttling.UserRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '10/hour',
-        'user': '100/hour',
+        'user': os.getenv('THROTTLE_RATE_USER', '100/hour'),
         'refresh': '5/hour',
     },
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'backend.renderers.ORJSONRenderer',
     ],
 }
 
@@ -169,10 +215,45 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     
     'JTI_CLAIM': 'jti',
+    
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.FilteredTokenRefreshSerializer',
+}
+
+# Bloom filter answering "not blacklisted" for refresh tokens without a query.
+# Sized for the unexpired blacklist (about one row per refresh within
+# REFRESH_TOKEN_LIFETIME), rebuilt daily after pruning
+TOKEN_BLACKLIST_FILTER = {
+    'CAPACITY': int(os.getenv('TOKEN_BLACKLIST_FILTER_CAPACITY', 1_000_000)),
+    'ERROR_RATE': 0.001,
 }
 
+# Seconds an authenticated user stays cached between saves (CachedJWTAuthentication)
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', 300))
+
 # Spotify API Configuration
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
-SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
-SPOTIFY_API_BASE_URL = 'https://api.spotify.com/v1'
+SPOTIFY_TOKEN_URL = os.getenv('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_BASE_URL = os.getenv('SPOTIFY_API_BASE_URL', 'https://api.spotify.com/v1')
+# Per-call timeout (seconds), retries of timeouts/5xx/short 429s, and the
+# longest Retry-After waited out inline before failing over to a task retry
+SPOTIFY_TIMEOUT = float(os.getenv('SPOTIFY_TIMEOUT', 10))
+SPOTIFY_MAX_RETRIES = int(os.getenv('SPOTIFY_MAX_RETRIES', 2))
+SPOTIFY_MAX_RETRY_AFTER = int(os.getenv('SPOTIFY_MAX_RETRY_AFTER', 5))
+# Seconds a coalesced Spotify lookup is reused within a worker process, and
+# how long an artist lookup waits for others to share its multi-ID request
+SPOTIFY_COALESCE_TTL = float(os.getenv('SPOTIFY_COALESCE_TTL', 60))
+SPOTIFY_COALESCE_WINDOW = float(os.getenv('SPOTIFY_COALESCE_WINDOW', 0.005))
+# Circuit breaker around Spotify calls (backend.circuit_breaker). While open,
+# refreshes are built from the CatalogTrack snapshot instead
+SPOTIFY_BREAKER = {
+    'WINDOW': 60,
+    'MIN_CALLS': 20,
+    'FAILURE_RATE': 0.5,
+    'SLOW_CALL_SECONDS': SPOTIFY_TIMEOUT / 2,
+    'OPEN_SECONDS': int(os.getenv('SPOTIFY_BREAKER_OPEN_SECONDS', 30)),
+    'PROBE_SECONDS': SPOTIFY_TIMEOUT + 5,
+}
+
+# Refresh requests are skipped while the current set is younger than this (seconds)
+RECOMMENDATIONS_FRESH_FOR = int(os.getenv('RECOMMENDATIONS_FRESH_FOR', 300))
@@ -0,0 +1,11 @@
+"""Percentiles shared by the task metrics and the benchmark harness"""
+import math
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples`` (``None`` when empty)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, rank - 1)]
@@ -0,0 +1,206 @@
+"""
+Per-lane Celery queue metrics and per-task run timings.
+
+Publishing stamps every message with an ``enqueued_at`` header. When a worker
+starts the task, the time it spent waiting is pushed onto a capped Redis list
+for its queue, from which ``lane_stats`` reports wait-time percentiles next to
+the current broker queue depth.
+
+Each run is also recorded per task name: enqueue-to-start lag, total runtime
+and the named ``stage`` spans the task marks. ``task_stats`` turns those into
+percentiles, and runs slower than TASK_SLOW_THRESHOLD are kept separately
+together with the fields the task attached through ``tag``.
+"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from celery import current_task
+from celery.signals import before_task_publish, task_postrun, task_prerun
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .stats import percentile
+
+logger = logging.getLogger(__name__)
+
+# Wait-time samples kept per lane, and run samples kept per task
+SAMPLE_SIZE = 1000
+# Slow runs kept per task
+SLOW_SAMPLE_SIZE = 100
+
+# Runs in progress in this worker process, by task id
+_runs = {}
+
+
+def _prefix():
+    return settings.CACHES['default'].get('KEY_PREFIX', '')
+
+
+def _wait_key(queue):
+    return f"{_prefix()}:task_wait:{queue}"
+
+
+def _runs_key(task_name):
+    return f"{_prefix()}:task_runs:{task_name}"
+
+
+def _slow_key(task_name):
+    return f"{_prefix()}:task_slow:{task_name}"
+
+
+def _tasks_key():
+    return f"{_prefix()}:task_names"
+
+
+class _Run:
+    def __init__(self, lag):
+        self.started = time.perf_counter()
+        self.lag = lag
+        self.stages = {}
+        self.tags = {}
+
+
+@before_task_publish.connect
+def stamp_enqueue_time(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
+def _queue_wait(request):
+    """Seconds the message waited since it became runnable, ``None`` if unknown"""
+    enqueued_at = getattr(request, 'enqueued_at', None)
+    if enqueued_at is None:
+        return None
+    # Delayed messages (retries, countdowns) only start waiting at their ETA
+    ready_at = float(enqueued_at)
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready_at = max(ready_at, eta.timestamp())
+    return max(0.0, time.time() - ready_at)
+
+
+@task_prerun.connect
+def record_queue_wait(task_id=None, task=None, **kwargs):
+    request = task.request
+    wait = _queue_wait(request)
+    _runs[task_id] = _Run(wait)
+    queue = (request.delivery_info or {}).get('routing_key')
+    if wait is None or not queue:
+        return
+
+    try:
+        pipe = get_redis_connection('default').pipeline()
+        pipe.lpush(_wait_key(queue), wait)
+        pipe.ltrim(_wait_key(queue), 0, SAMPLE_SIZE - 1)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Could not record queue wait for {queue}: {exc}")
+
+
+@contextmanager
+def stage(name):
+    """Time a named stage of the running task, repeated stages add up"""
+    run = _runs.get(getattr(current_task.request, 'id', None)) if current_task else None
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if run is not None:
+            run.stages[name] = run.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def tag(**fields):
+    """Attach fields (e.g. ``user_id``) to the running task's slow-run sample"""
+    run = _runs.get(getattr(current_task.request, 'id', None)) if current_task else None
+    if run is not None:
+        run.tags.update(fields)
+
+
+@task_postrun.connect
+def record_task_run(task_id=None, task=None, state=None, **kwargs):
+    run = _runs.pop(task_id, None)
+    if run is None:
+        return
+    runtime = time.perf_counter() - run.started
+    record = {
+        'task_id': task_id,
+        'state': state,
+        'finished_at': time.time(),
+        'lag': run.lag,
+        'runtime': runtime,
+        'stages': run.stages,
+        **run.tags,
+    }
+    payload = json.dumps(record)
+
+    try:
+        pipe = get_redis_connection('default').pipeline()
+        pipe.sadd(_tasks_key(), task.name)
+        pipe.lpush(_runs_key(task.name), payload)
+        pipe.ltrim(_runs_key(task.name), 0, SAMPLE_SIZE - 1)
+        if runtime >= settings.TASK_SLOW_THRESHOLD:
+            pipe.lpush(_slow_key(task.name), payload)
+            pipe.ltrim(_slow_key(task.name), 0, SLOW_SAMPLE_SIZE - 1)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Could not record run of {task.name}: {exc}")
+
+
+def _percentiles(samples):
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def task_stats(task_names=None):
+    """
+    Lag, runtime and per-stage percentiles (seconds) for each task, plus its
+    slowest retained runs
+    """
+    redis = get_redis_connection('default')
+    if task_names is None:
+        task_names = sorted(name.decode() for name in redis.smembers(_tasks_key()))
+    stats = {}
+    for name in task_names:
+        runs = [json.loads(raw) for raw in redis.lrange(_runs_key(name), 0, -1)]
+        slow = [json.loads(raw) for raw in redis.lrange(_slow_key(name), 0, -1)]
+        stage_names = sorted({stage for run in runs for stage in run['stages']})
+        stats[name] = {
+            'runs': len(runs),
+            'failures': sum(1 for run in runs if run['state'] != 'SUCCESS'),
+            'lag': _percentiles([run['lag'] for run in runs if run['lag'] is not None]),
+            'runtime': _percentiles([run['runtime'] for run in runs]),
+            'stages': {
+                stage: _percentiles([run['stages'][stage] for run in runs if stage in run['stages']])
+                for stage in stage_names
+            },
+            'slowest': sorted(slow, key=lambda run: run['runtime'], reverse=True),
+        }
+    return stats
+
+
+def lane_stats(app, queues):
+    """Depth and wait-time percentiles (seconds) for each queue in ``queues``"""
+    redis = get_redis_connection('default')
+    stats = {}
+    with app.connection_for_read() as connection:
+        channel = connection.default_channel
+        for queue in queues:
+            try:
+                depth = channel.queue_declare(queue=queue, passive=True).message_count
+            except Exception:
+                depth = 0
+            waits = [float(value) for value in redis.lrange(_wait_key(queue), 0, -1)]
+            stats[queue] = {
+                'depth': depth,
+                'wait_samples': len(waits),
+                'wait_p50': percentile(waits, 50),
+                'wait_p95': percentile(waits, 95),
+                'wait_p99': percentile(waits, 99),
+            }
+    return stats
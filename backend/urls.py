@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from backend.metrics import metrics_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -8,6 +9,7 @@ from rest_framework_simplejwt.views import (
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     
     # Authentication endpoints
     path('api/auth/register/', include('users.urls_auth')),
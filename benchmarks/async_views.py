@@ -0,0 +1,105 @@
+"""
+Compare the sync (gunicorn/WSGI) and async (uvicorn/ASGI) read endpoints.
+
+Runs the same number of concurrent GETs against both deployments and prints
+throughput and latency percentiles for each:
+
+    python -m benchmarks.async_views --email test@example.com --password TestPass123! \\
+        --sync-url http://localhost:8000 --async-url http://localhost:8001 --concurrency 64
+
+Both deployments apply the default DRF throttles, so start them with
+THROTTLE_RATE_USER raised (e.g. ``1000000/hour``) or most requests get a 429.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .stats import summarize
+
+ENDPOINTS = [
+    '/api/recommendations/me/',
+    '/api/analytics/trends/',
+]
+
+
+def _login(base_url, email, password):
+    response = requests.post(
+        f'{base_url}/api/auth/token/',
+        json={'email': email, 'password': password},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()['access']
+
+
+def run_mode(base_url, token, path, total, concurrency):
+    session = requests.Session()
+    session.headers['Authorization'] = f'Bearer {token}'
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def call(_):
+        start = time.perf_counter()
+        try:
+            ok = session.get(base_url + path, timeout=30).status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, _ in results]
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'path': path,
+        'requests': total,
+        'errors': errors,
+        'rps': round(total / elapsed, 1),
+        **summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sync-url', default='http://localhost:8000')
+    parser.add_argument('--async-url', default='http://localhost:8001')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for mode, base_url in (('sync', args.sync_url), ('async', args.async_url)):
+        token = _login(base_url, args.email, args.password)
+        # Warm the cache so both modes measure the same hit path
+        for path in ENDPOINTS:
+            run_mode(base_url, token, path, args.concurrency, args.concurrency)
+        results[mode] = [
+            run_mode(base_url, token, path, args.requests, args.concurrency)
+            for path in ENDPOINTS
+        ]
+
+    print(f"{'mode':<6} {'path':<32} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for mode, rows in results.items():
+        for row in rows:
+            print(
+                f"{mode:<6} {row['path']:<32} {row['rps']:>8} {row['p50_ms']:>8} "
+                f"{row['p95_ms']:>8} {row['p99_ms']:>8} {row['errors']:>7}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Local stand-in for the parts of the Spotify Web API the backend uses.
+
+Serves the token endpoint, ``/search`` (artists and tracks),
+``/artists?ids=`` and ``/artists/{id}/top-tracks`` with deterministic fake data. Latency, error rate
+and 429 rate limiting are configurable, and every call is counted per endpoint.
+
+    python -m benchmarks.fake_spotify --port 8900 --latency-ms 80 --rate-limit-rate 0.01
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+GENRES = ['pop', 'rock', 'hip-hop', 'jazz', 'classical', 'electronic', 'indie', 'metal', 'country', 'r-n-b']
+
+
+def spotify_id(seed):
+    """Deterministic 22 character base62 ID, like Spotify's"""
+    number = int(hashlib.sha1(seed.encode()).hexdigest(), 16)
+    chars = []
+    for _ in range(22):
+        number, index = divmod(number, 62)
+        chars.append(BASE62[index])
+    return ''.join(chars)
+
+
+def fake_artist(artist_id, name=None):
+    rng = random.Random(artist_id)
+    return {
+        'id': artist_id,
+        'name': name or f'Artist {artist_id[:6]}',
+        'genres': rng.sample(GENRES, 2),
+        'popularity': rng.randint(10, 100),
+        'type': 'artist',
+    }
+
+
+def fake_track(seed, artist_id=None):
+    track_id = spotify_id(f'track:{seed}')
+    rng = random.Random(track_id)
+    artist_id = artist_id or spotify_id(f'artist:{rng.randint(0, 5000)}')
+    return {
+        'id': track_id,
+        'name': f'Track {track_id[:6]}',
+        'artists': [{'id': artist_id, 'name': f'Artist {artist_id[:6]}'}],
+        'album': {
+            'name': f'Album {track_id[6:12]}',
+            'images': [{'url': f'https://i.scdn.co/image/{track_id}'}],
+            'release_date': f'20{rng.randint(0, 24):02d}-01-01',
+        },
+        'preview_url': None,
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+        'popularity': rng.randint(0, 100),
+        'duration_ms': rng.randint(120000, 300000),
+    }
+
+
+class FakeSpotifyConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.statuses = Counter()
+
+    def roll(self):
+        with self.lock:
+            return self.rng.random(), self.rng.random(), self.rng.random()
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    server_version = 'FakeSpotify/1.0'
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.config.lock:
+            self.config.statuses[status] += 1
+
+    def _simulate(self, endpoint):
+        """Apply latency and failure injection, True if the request may proceed"""
+        with self.config.lock:
+            self.config.calls[endpoint] += 1
+        jitter_roll, error_roll, limit_roll = self.config.roll()
+        delay = self.config.latency_ms + (jitter_roll * 2 - 1) * self.config.jitter_ms
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if limit_roll < self.config.rate_limit_rate:
+            self._send(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                       {'Retry-After': self.config.retry_after})
+            return False
+        if error_roll < self.config.error_rate:
+            self._send(500, {'error': {'status': 500, 'message': 'Server error'}})
+            return False
+        return True
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/api/token':
+            return self._send(404, {'error': 'not found'})
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if self._simulate('token'):
+            self._send(200, {'access_token': 'fake-token', 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/v1/search':
+            if not self._simulate(f"search:{query.get('type', 'track')}"):
+                return
+            return self._send(200, self._search(query))
+
+        if url.path == '/v1/artists':
+            ids = [artist_id for artist_id in query.get('ids', '').split(',') if artist_id]
+            if not ids or len(ids) > 50:
+                return self._send(400, {'error': {'status': 400, 'message': 'Invalid ids'}})
+            if not self._simulate('artists'):
+                return
+            return self._send(200, {'artists': [fake_artist(artist_id) for artist_id in ids]})
+
+        match = re.fullmatch(r'/v1/artists/([0-9A-Za-z]{22})/top-tracks', url.path)
+        if match:
+            if not self._simulate('top-tracks'):
+                return
+            artist_id = match.group(1)
+            tracks = [fake_track(f'{artist_id}:{index}', artist_id) for index in range(10)]
+            return self._send(200, {'tracks': tracks})
+
+        self._send(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+    def _search(self, query):
+        q = query.get('q', '')
+        limit = min(int(query.get('limit', 20)), 50)
+        if query.get('type') == 'artist':
+            artist_id = spotify_id(f'artist-name:{q.lower()}')
+            items = [fake_artist(artist_id, q)][:limit]
+            return {'artists': {'items': items, 'total': len(items)}}
+        items = [fake_track(f'search:{q}:{index}') for index in range(limit)]
+        return {'tracks': {'items': items, 'total': len(items)}}
+
+
+def start_server(port=0, **config):
+    """Start the fake server in a background thread, return ``(server, base_url)``"""
+    handler = type('Handler', (FakeSpotifyHandler,), {'config': FakeSpotifyConfig(**config)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def server_stats(server):
+    config = server.RequestHandlerClass.config
+    with config.lock:
+        return {'calls': dict(config.calls), 'statuses': {str(k): v for k, v in config.statuses.items()}}
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def config_from_args(args):
+    return {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+        'retry_after': args.retry_after,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Spotify Web API')
+    parser.add_argument('--port', type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.port, **config_from_args(args))
+    print(f'Fake Spotify listening on {base_url}')
+    print(f'  SPOTIFY_TOKEN_URL={base_url}/api/token')
+    print(f'  SPOTIFY_API_BASE_URL={base_url}/v1')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
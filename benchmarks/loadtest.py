@@ -0,0 +1,290 @@
+"""
+Open-loop HTTP load test against a running deployment.
+
+Logs users in through ``/api/auth/token/`` and sends a weighted mix of reads and
+activity writes at a fixed target rate. Requests are scheduled on the clock,
+not after the previous one returns, and latency is measured from the scheduled
+start, so a slow server shows up as latency instead of silently lowering the
+offered load. Each ``--rates`` stage reports throughput, error rate and
+p50/p95/p99 per endpoint:
+
+    python -m benchmarks.loadtest --base-url http://localhost --credentials users.txt \\
+        --rates 50,100,200,400 --duration 60 --mix me=6,trends=3,activity=1 --output run.json
+    python -m benchmarks.loadtest --compare baseline.json run.json
+
+``users.txt`` holds one ``email:password`` per line. Activity writes need users
+with recommendations. THROTTLE_RATE_USER on the target has to be raised for
+anything beyond a smoke test.
+"""
+import argparse
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .stats import summarize
+
+ENDPOINTS = {
+    'me': ('GET', '/api/recommendations/me/'),
+    'trends': ('GET', '/api/analytics/trends/'),
+    'activity': ('POST', '/api/activity/'),
+}
+INTERACTIONS = ['play', 'play', 'play', 'like', 'skip']
+COMPARED_METRICS = ('rps', 'error_rate', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+class LoadUser:
+    def __init__(self, token, recommendation_ids):
+        self.token = token
+        self.recommendation_ids = recommendation_ids
+
+
+def _read_credentials(args):
+    if args.credentials:
+        with open(args.credentials) as fh:
+            lines = [line.strip() for line in fh if line.strip() and not line.startswith('#')]
+        return [tuple(line.split(':', 1)) for line in lines]
+    if args.email and args.password:
+        return [(args.email, args.password)]
+    raise SystemExit('Pass --credentials or --email and --password')
+
+
+def _login(session, base_url, email, password):
+    response = session.post(
+        f'{base_url}/api/auth/token/',
+        json={'email': email, 'password': password},
+        timeout=10
+    )
+    response.raise_for_status()
+    token = response.json()['access']
+    response = session.get(
+        base_url + ENDPOINTS['me'][1],
+        headers={'Authorization': f'Bearer {token}'},
+        timeout=30
+    )
+    response.raise_for_status()
+    ids = [item['id'] for item in response.json().get('recommendations', [])]
+    return LoadUser(token, ids)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {name!r}, pick from {", ".join(ENDPOINTS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Stage:
+    """One fixed-rate run: schedules requests and collects their outcomes"""
+
+    def __init__(self, base_url, users, mix, rate, duration, concurrency, seed):
+        self.base_url = base_url
+        self.users = users
+        self.writers = [user for user in users if user.recommendation_ids]
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.late = 0
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def _plan(self):
+        """Pre-draw the request sequence so the run itself only sends requests"""
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        total = int(self.rate * self.duration)
+        plan = []
+        for index in range(total):
+            name = self.rng.choices(names, weights)[0]
+            if name == 'activity':
+                user = self.rng.choice(self.writers)
+                body = {
+                    'recommendation': self.rng.choice(user.recommendation_ids),
+                    'interaction_type': self.rng.choice(INTERACTIONS),
+                }
+            else:
+                user, body = self.rng.choice(self.users), None
+            plan.append((index / self.rate, name, user, body))
+        return plan
+
+    def _send(self, started, offset, name, user, body):
+        scheduled = started + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -0.001:
+            with self.lock:
+                self.late += 1
+
+        method, path = ENDPOINTS[name]
+        try:
+            response = self._session().request(
+                method, self.base_url + path, json=body,
+                headers={'Authorization': f'Bearer {user.token}'}, timeout=30
+            )
+            status = response.status_code
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        latency = (time.perf_counter() - scheduled) * 1000
+
+        with self.lock:
+            self.latencies[name].append(latency)
+            self.statuses[name][str(status)] += 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors[name] += 1
+
+    def run(self):
+        if 'activity' in self.mix and not self.writers:
+            raise SystemExit('No user has recommendations, drop activity from --mix or refresh first')
+        plan = self._plan()
+        started = time.perf_counter() + 0.1
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for _ in pool.map(lambda item: self._send(started, *item), plan):
+                pass
+        elapsed = time.perf_counter() - started
+        return self._report(elapsed)
+
+    def _report(self, elapsed):
+        endpoints = {}
+        for name in self.mix:
+            count = len(self.latencies[name])
+            endpoints[name] = {
+                'requests': count,
+                'errors': self.errors[name],
+                'error_rate': round(self.errors[name] / count, 4) if count else 0.0,
+                'rps': round(count / elapsed, 1),
+                'statuses': dict(self.statuses[name]),
+                **summarize(self.latencies[name]),
+            }
+        every = list(itertools.chain.from_iterable(self.latencies.values()))
+        errors = sum(self.errors.values())
+        return {
+            'target_rps': self.rate,
+            'achieved_rps': round(len(every) / elapsed, 1),
+            'error_rate': round(errors / len(every), 4) if every else 0.0,
+            # Requests that started late because every worker was busy
+            'late_starts': self.late,
+            'all': summarize(every),
+            'endpoints': endpoints,
+        }
+
+
+def print_stage(result):
+    print(
+        f"\ntarget {result['target_rps']} req/s, achieved {result['achieved_rps']} req/s, "
+        f"errors {result['error_rate']:.2%}, late starts {result['late_starts']}"
+    )
+    print(f"{'endpoint':<10} {'requests':>9} {'rps':>8} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, row in result['endpoints'].items():
+        if not row['requests']:
+            continue
+        print(
+            f"{name:<10} {row['requests']:>9} {row['rps']:>8} {row['error_rate']:>7.2%} "
+            f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+
+
+def compare(baseline, current):
+    """Print per-stage, per-endpoint changes between two result files"""
+    previous = {stage['target_rps']: stage for stage in baseline['stages']}
+    print(f"{'rate':>6} {'endpoint':<10} {'metric':<10} {'baseline':>10} {'current':>10} {'change':>8}")
+    for stage in current['stages']:
+        old_stage = previous.get(stage['target_rps'])
+        if not old_stage:
+            continue
+        for name, row in stage['endpoints'].items():
+            old_row = old_stage['endpoints'].get(name)
+            if not old_row:
+                continue
+            for metric in COMPARED_METRICS:
+                old, new = old_row.get(metric), row.get(metric)
+                if old is None or new is None:
+                    continue
+                change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+                print(
+                    f"{stage['target_rps']:>6} {name:<10} {metric:<10} "
+                    f"{old:>10.3f} {new:>10.3f} {change:>8}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running deployment')
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--credentials', help='File with one email:password per line')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--rates', default='50', help='Comma separated target req/s, one stage each')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('me=6,trends=3,activity=1'),
+                        help='Weighted endpoints, e.g. me=6,trends=3,activity=1')
+    parser.add_argument('--concurrency', type=int, default=128, help='Maximum requests in flight')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help='Diff BASELINE against this run, or BASELINE against CURRENT without running')
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            compare(json.load(baseline), json.load(current))
+        return
+
+    session = requests.Session()
+    users = [
+        _login(session, args.base_url, email, password)
+        for email, password in _read_credentials(args)
+    ]
+    stages = []
+    for index, rate in enumerate(float(value) for value in args.rates.split(',')):
+        stage = Stage(
+            args.base_url, users, args.mix, rate, args.duration,
+            args.concurrency, seed=args.seed + index
+        )
+        result = stage.run()
+        print_stage(result)
+        stages.append(result)
+
+    results = {
+        'timestamp': time.time(),
+        'base_url': args.base_url,
+        'users': len(users),
+        'config': {
+            'rates': args.rates,
+            'duration': args.duration,
+            'mix': args.mix,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'stages': stages,
+    }
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.compare:
+        with open(args.compare[0]) as fh:
+            compare(json.load(fh), results)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Reproducible performance scenarios against a local fake Spotify server.
+
+Creates a throwaway test database, points SpotifyClient at
+``benchmarks.fake_spotify`` and times:
+
+    single_refresh   one fetch_spotify_recommendations run
+    batch_refresh    one refresh per user for --users users, --workers at a time
+    read_hit         GET /api/recommendations/me/ served from the cache
+    read_miss        GET /api/recommendations/me/ with the cache key dropped first
+
+Postgres and Redis from the usual settings are required (run it in the web
+container). Results are written as JSON and can be diffed against an earlier run:
+
+    python -m benchmarks.run --users 10000 --workers 8 --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import cache  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    override_settings, setup_test_environment, teardown_test_environment
+)
+from django.urls import reverse  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from recommendations.tasks import fetch_spotify_recommendations  # noqa: E402
+
+from . import fake_spotify  # noqa: E402
+from .stats import summarize  # noqa: E402
+
+User = get_user_model()
+
+ARTIST_POOL = [f'Benchmark Artist {index}' for index in range(500)]
+COMPARED_METRICS = ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def _create_users(count):
+    users = [
+        User(
+            email=f'bench{index}@example.com',
+            password='!',
+            favorite_artists=[ARTIST_POOL[(index * 7 + offset) % len(ARTIST_POOL)] for offset in range(3)],
+            favorite_genres=['pop'],
+            moods=['happy'],
+        )
+        for index in range(count)
+    ]
+    return User.objects.bulk_create(users, batch_size=2000)
+
+
+def _refresh(user_id):
+    start = time.perf_counter()
+    try:
+        fetch_spotify_recommendations.apply(args=[user_id])
+    finally:
+        connections.close_all()
+    return (time.perf_counter() - start) * 1000
+
+
+def _with_calls(server, run):
+    """Run a scenario and attach the Spotify calls it made"""
+    before = fake_spotify.server_stats(server)['calls']
+    started = time.perf_counter()
+    result = run()
+    result['wall_s'] = round(time.perf_counter() - started, 3)
+    after = fake_spotify.server_stats(server)['calls']
+    result['spotify_calls'] = {
+        endpoint: count - before.get(endpoint, 0)
+        for endpoint, count in after.items()
+        if count - before.get(endpoint, 0)
+    }
+    return result
+
+
+def scenario_single_refresh(user):
+    return summarize([_refresh(user.id)])
+
+
+def scenario_batch_refresh(users, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(_refresh, [user.id for user in users]))
+    result = summarize(latencies)
+    result['tasks_per_s'] = round(len(users) / (time.perf_counter() - started), 1)
+    return result
+
+
+def scenario_reads(user, requests, drop_cache):
+    client = APIClient()
+    client.force_authenticate(user)
+    url = reverse('my-recommendations')
+    latencies = []
+    for _ in range(requests):
+        if drop_cache:
+            cache.delete(f'recommendations_user_{user.id}')
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+    return summarize(latencies)
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    print(f"{'scenario':<16} {'metric':<8} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+            print(f'{name:<16} {metric:<8} {old:>11.3f} {new:>11.3f} {change:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the backend benchmark scenarios')
+    parser.add_argument('--users', type=int, default=1000, help='Users in the batch refresh')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent refreshes')
+    parser.add_argument('--reads', type=int, default=500, help='Requests per read scenario')
+    parser.add_argument('--scenarios', default='single_refresh,batch_refresh,read_hit,read_miss')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Baseline JSON results to diff against')
+    fake_spotify.add_arguments(parser)
+    args = parser.parse_args()
+    selected = args.scenarios.split(',')
+
+    server, base_url = fake_spotify.start_server(**fake_spotify.config_from_args(args))
+    overrides = {
+        'SPOTIFY_TOKEN_URL': f'{base_url}/api/token',
+        'SPOTIFY_API_BASE_URL': f'{base_url}/v1',
+        'SPOTIFY_CLIENT_ID': 'benchmark',
+        'SPOTIFY_CLIENT_SECRET': 'benchmark',
+        'CACHES': {
+            'default': {**settings.CACHES['default'], 'KEY_PREFIX': 'music_discovery_bench'},
+        },
+        'REST_FRAMEWORK': {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_CLASSES': []},
+    }
+
+    setup_test_environment()
+    old_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    scenarios = {}
+    try:
+        with override_settings(**overrides):
+            # Only touch the benchmark's own key prefix, never FLUSHDB
+            cache.delete_pattern('*')
+            users = _create_users(max(args.users, 1))
+            reader = users[0]
+
+            if 'single_refresh' in selected:
+                scenarios['single_refresh'] = _with_calls(
+                    server, lambda: scenario_single_refresh(reader)
+                )
+            if 'batch_refresh' in selected:
+                scenarios['batch_refresh'] = _with_calls(
+                    server, lambda: scenario_batch_refresh(users, args.workers)
+                )
+            if 'read_hit' in selected:
+                _refresh(reader.id)
+                scenarios['read_hit'] = scenario_reads(reader, args.reads, drop_cache=False)
+            if 'read_miss' in selected:
+                scenarios['read_miss'] = scenario_reads(reader, args.reads, drop_cache=True)
+            cache.delete_pattern('*')
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_db_name, verbosity=0)
+        teardown_test_environment()
+        server.shutdown()
+
+    results = {
+        'revision': _git_revision(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'config': vars(args),
+        'scenarios': scenarios,
+    }
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Microbenchmark of recommendation/analytics response rendering.
+
+Compares the stock path (``RecommendationSerializer`` + DRF ``JSONRenderer``)
+with the fast path (``recommendation_data`` over ``.values()`` rows +
+``ORJSONRenderer``) on in-memory data, after checking both produce the same
+bytes. No database or Redis needed:
+
+    python -m benchmarks.serialization --items 50 --repeat 2000
+"""
+import argparse
+import os
+import timeit
+from datetime import datetime, timedelta, timezone
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from backend.renderers import ORJSONRenderer  # noqa: E402
+from recommendations.models import Recommendation  # noqa: E402
+from recommendations.serializers import (  # noqa: E402
+    RecommendationSerializer, recommendation_data, recommendation_values
+)
+
+
+def _recommendations(count):
+    now = datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    return [
+        Recommendation(
+            id=index + 1,
+            user_id=1,
+            track_id=f'{index:022d}',
+            track_name=f'Tráck {index} “quoted”',
+            artist_name=f'Artist {index % 7}',
+            album_name='Album',
+            preview_url=None if index % 3 else f'https://p.scdn.co/mp3-preview/{index}',
+            spotify_url=f'https://open.spotify.com/track/{index:022d}',
+            genres=['pop', 'k-pop'][:1 + index % 2],
+            popularity=index % 100,
+            duration_ms=180000 + index,
+            metadata={'album_image': f'https://i.scdn.co/image/{index}', 'release_date': '2020-01-01'},
+            created_at=now - timedelta(seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+def _trends():
+    return {
+        'trending_artists': [{'name': f'Artist {i}', 'interactions': 100 - i} for i in range(10)],
+        'trending_genres': [{'name': f'genre-{i}', 'interactions': 50 - i} for i in range(10)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response serialization')
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    instances = _recommendations(args.items)
+    rows = recommendation_values(instances)
+    stock_renderer, fast_renderer = JSONRenderer(), ORJSONRenderer()
+
+    def stock_recommendations():
+        data = RecommendationSerializer(instances, many=True).data
+        return stock_renderer.render({'user_id': 1, 'count': len(data), 'recommendations': data})
+
+    def fast_recommendations():
+        data = recommendation_data(rows)
+        return fast_renderer.render({'user_id': 1, 'count': len(data), 'recommendations': data})
+
+    trends = _trends()
+    cases = [
+        ('recommendations', stock_recommendations, fast_recommendations),
+        ('trends', lambda: stock_renderer.render(trends), lambda: fast_renderer.render(trends)),
+    ]
+
+    print(f"{'case':<16} {'stock us':>10} {'fast us':>10} {'speedup':>8}")
+    for name, stock, fast in cases:
+        assert stock() == fast(), f'{name}: fast path output differs'
+        stock_us = min(timeit.repeat(stock, number=args.repeat, repeat=3)) / args.repeat * 1e6
+        fast_us = min(timeit.repeat(fast, number=args.repeat, repeat=3)) / args.repeat * 1e6
+        print(f'{name:<16} {stock_us:>10.1f} {fast_us:>10.1f} {stock_us / fast_us:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
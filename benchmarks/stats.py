@@ -0,0 +1,17 @@
+import statistics
+
+from backend.stats import percentile
+
+
+def summarize(latencies_ms):
+    """Mean and p50/p95/p99 of a list of millisecond latencies"""
+    if not latencies_ms:
+        return {'count': 0}
+    return {
+        'count': len(latencies_ms),
+        'mean_ms': round(statistics.mean(latencies_ms), 3),
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p95_ms': round(percentile(latencies_ms, 95), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'max_ms': round(max(latencies_ms), 3),
+    }
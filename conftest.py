@@ -0,0 +1,110 @@
+import os
+import time
+from contextlib import contextmanager
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Scale wall-time budgets on slow CI machines, e.g. PERF_BUDGET_SCALE=3
+BUDGET_SCALE = float(os.getenv('PERF_BUDGET_SCALE', 1))
+
+
+@pytest.fixture(autouse=True)
+def local_services(settings):
+    """Keep tests off Redis and independent: in-memory cache, no metrics writes, no memoized Spotify lookups"""
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    settings.METRICS_ENABLED = False
+    from django.core.cache import cache
+    from recommendations.coalescing import clear_loaders
+    cache.clear()
+    clear_loaders()
+
+
+@pytest.fixture
+def perf_data(db):
+    """A user with a full recommendation set and activity, plus a staff user"""
+    from django.contrib.auth import get_user_model
+    from analytics.models import UserActivity
+    from recommendations.models import Recommendation
+
+    User = get_user_model()
+    users = User.objects.bulk_create([
+        User(
+            email=f'perf{index}@example.com',
+            favorite_artists=['Artist A', 'Artist B', 'Artist C'],
+            favorite_genres=['pop', 'rock'],
+            moods=['happy'],
+        )
+        for index in range(20)
+    ])
+    staff = User.objects.create_user(
+        email='staff@example.com', password='StaffPass123!', is_staff=True
+    )
+    recommendations = Recommendation.objects.bulk_create([
+        Recommendation(
+            user=user,
+            track_id=f'track{user.id}x{index}',
+            track_name=f'Track {index}',
+            artist_name=f'Artist {index % 7}',
+            album_name='Album',
+            spotify_url=f'https://open.spotify.com/track/{index}',
+            genres=['pop', 'rock'][:1 + index % 2],
+            popularity=index,
+            duration_ms=200000,
+        )
+        for user in users
+        for index in range(50)
+    ])
+    UserActivity.objects.bulk_create([
+        UserActivity(user_id=rec.user_id, recommendation=rec, interaction_type=kind)
+        for rec in recommendations[::5]
+        for kind in ('play', 'like')
+    ])
+    return {'user': users[0], 'users': users, 'staff': staff}
+
+
+def _format_queries(queries):
+    return '\n'.join(
+        f"  [{query['time']}s] {query['sql']}" for query in queries
+    )
+
+
+@pytest.fixture
+def budget():
+    """
+    ``with budget(queries=N, ms=T):`` fails the test when the block runs more
+    than ``N`` queries or takes longer than ``T`` milliseconds, printing the SQL
+    """
+    @contextmanager
+    def check(queries, ms):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            yield captured
+            elapsed = (time.perf_counter() - start) * 1000
+        count = len(captured.captured_queries)
+        if count > queries:
+            pytest.fail(
+                f'{count} queries, budget is {queries}:\n{_format_queries(captured.captured_queries)}',
+                pytrace=False
+            )
+        if elapsed > ms * BUDGET_SCALE:
+            pytest.fail(
+                f'{elapsed:.1f}ms, budget is {ms * BUDGET_SCALE:.0f}ms:\n'
+                f'{_format_queries(captured.captured_queries)}',
+                pytrace=False
+            )
+    return check
+
+
+@pytest.fixture
+def auth_client():
+    """APIClient factory authenticating with a real JWT, as the frontend does"""
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    def make(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+    return make
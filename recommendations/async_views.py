@@ -0,0 +1,157 @@
+import asyncio
+import json
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.contrib.auth import get_user_model
+from .models import Recommendation
+from .serializers import RECOMMENDATION_FIELDS
+from .views import _recommendations_payload
+from backend.cache import aread_through
+from backend.renderers import dumps
+from backend.pubsub import hub
+from backend.throttling import acheck_throttles
+from users.authentication import aauthenticate
+
+User = get_user_model()
+
+# Idle connections get a comment line this often so proxies keep them open
+HEARTBEAT_INTERVAL = 15
+# Clients reconnect (with Last-Event-ID) after this long
+MAX_STREAM_SECONDS = 300
+
+
+def json_response(data, status=200):
+    """JSON response rendered exactly like the DRF views'"""
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def unauthorized():
+    return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+async def throttled(request):
+    """DRF's 429 response if the default throttles refuse ``request``, else ``None``"""
+    exc = await acheck_throttles(request)
+    if exc is None:
+        return None
+    response = json_response({'detail': str(exc.detail)}, status=429)
+    if exc.wait is not None:
+        response['Retry-After'] = '%d' % exc.wait
+    return response
+
+
+async def _recommendations_response(user_id):
+    """Async variant of views._recommendations_response"""
+    async def rebuild():
+        recommendations = Recommendation.objects.filter(user_id=user_id).values(*RECOMMENDATION_FIELDS)
+        return [row async for row in recommendations[:50]]
+    
+    recommendations, hit = await aread_through(
+        f'recommendations_user_{user_id}', rebuild, timeout=3600
+    )
+    return json_response(_recommendations_payload(user_id, recommendations, hit))
+
+
+@require_GET
+async def my_recommendations(request):
+    """GET /recommendations/me/ - Async variant of MyRecommendationsView"""
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized()
+    
+    refused = await throttled(request)
+    if refused is not None:
+        return refused
+    
+    return await _recommendations_response(user.id)
+
+
+@require_GET
+async def get_recommendations(request, user_id):
+    """GET /recommendations/{user_id}/ - Async variant of GetRecommendationsView"""
+    user = await aauthenticate(request)
+    if user is None:
+        return unauthorized()
+    
+    refused = await throttled(request)
+    if refused is not None:
+        return refused
+    
+    if user.id != user_id and not user.is_staff:
+        return json_response(
+            {'error': 'You can only view your own recommendations'},
+            status=403
+        )
+    
+    if not await User.objects.filter(id=user_id).aexists():
+        return json_response({'error': 'User not found'}, status=404)
+    
+    return await _recommendations_response(user_id)
+
+
+def _sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def _recommendation_events(user_id, since):
+    """
+    ``recommendations_ready`` whenever the user has a newer set than ``since``,
+    ``refresh_finished`` with the status of refreshes that ended without one.
+    While the hub has no Redis subscription, new sets are found by polling
+    the version key on every heartbeat instead
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MAX_STREAM_SECONDS
+    version_key = f'recommendations_version_user_{user_id}'
+
+    async with hub.subscribe(f'refresh_finished:{user_id}') as queue:
+        # Catch up on a refresh that finished before we subscribed
+        poll = True
+        while loop.time() < deadline:
+            if poll:
+                version = await cache.aget(version_key)
+                if version and version > since:
+                    yield _sse('recommendations_ready', {'user_id': user_id, 'version': version}, version)
+                    since = version
+
+            try:
+                payload = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                poll = not hub.connected
+                yield ': keepalive\n\n'
+                continue
+
+            poll = False
+            if 'version' not in payload:
+                yield _sse('refresh_finished', payload)
+            elif payload['version'] > since:
+                yield _sse('recommendations_ready', payload, payload['version'])
+                since = payload['version']
+
+
+@require_GET
+async def recommendation_events(request):
+    """GET /recommendations/me/events/ - Server-sent events for finished refreshes"""
+    user = await aauthenticate(request, query_token=True)
+    if user is None:
+        return unauthorized()
+
+    since = request.headers.get('Last-Event-ID') or request.GET.get('since') or 0
+    try:
+        since = int(since)
+    except ValueError:
+        since = 0
+
+    response = StreamingHttpResponse(
+        _recommendation_events(user.id, since),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,118 @@
+"""
+Bulk refresh jobs, for staff re-running many users at once.
+
+A job is one Redis hash holding its counters. Users are handed to
+``refresh_bulk_chunk`` tasks in chunks, which schedule the usual per-user
+refreshes on the batch lane with the job ID attached; every refresh then
+reports its outcome with a single HINCRBY. Progress is read back with one
+HGETALL however many users the job covers, without looking at individual
+task results.
+
+Outcomes:
+
+- ``done``: a new set was saved (degraded catalog sets included);
+- ``failed``: the user does not exist or the refresh gave up after its retries;
+- ``skipped``: another refresh of the user was already pending or took over,
+  or Spotify was down and there was nothing to fall back on.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# User IDs per refresh_bulk_chunk task
+BULK_REFRESH_CHUNK = 500
+# Largest explicit ID list a single job accepts, bigger sets go by segment
+BULK_REFRESH_MAX_IDS = 100_000
+# Jobs and their counters are forgotten this long after the last update
+BULK_JOB_TTL = 7 * 24 * 3600
+
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+OUTCOMES = (DONE, FAILED, SKIPPED)
+
+
+def _job_key(job_id):
+    return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:refresh_job:{job_id}"
+
+
+def create_job(created_by, total=None):
+    """
+    Start a job and return its ID. ``total`` is the number of users when it
+    is known up front; segment jobs add to it with ``add_users`` as they list
+    """
+    job_id = uuid.uuid4().hex
+    key = _job_key(job_id)
+    pipe = get_redis_connection('default').pipeline()
+    pipe.hset(key, mapping={
+        'created_at': int(time.time()),
+        'created_by': created_by,
+        'total': total or 0,
+        'listed': int(total is not None),
+        **{outcome: 0 for outcome in OUTCOMES},
+    })
+    pipe.expire(key, BULK_JOB_TTL)
+    pipe.execute()
+    return job_id
+
+
+def add_users(job_id, count, listed=False):
+    """Count ``count`` more users into the job; ``listed`` once all are in"""
+    key = _job_key(job_id)
+    pipe = get_redis_connection('default').pipeline()
+    pipe.hincrby(key, 'total', count)
+    if listed:
+        pipe.hset(key, 'listed', 1)
+    pipe.expire(key, BULK_JOB_TTL)
+    pipe.execute()
+
+
+def record_outcome(job_id, outcome, count=1):
+    """
+    Count a finished refresh. A no-op without ``job_id``; never raises, a
+    refresh must not fail because its progress could not be reported
+    """
+    if not job_id or not count:
+        return
+    try:
+        key = _job_key(job_id)
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.hincrby(key, outcome, count)
+        pipe.expire(key, BULK_JOB_TTL)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Could not record {outcome} for refresh job {job_id}: {exc}")
+
+
+def job_progress(job_id):
+    """Counters of a job, or ``None`` if it is unknown or expired"""
+    job = get_redis_connection('default').hgetall(_job_key(job_id))
+    if not job:
+        return None
+
+    counts = {field.decode(): int(value) for field, value in job.items()}
+    finished = sum(counts[outcome] for outcome in OUTCOMES)
+    pending = max(0, counts['total'] - finished)
+    if not counts['listed']:
+        state = 'listing'
+    else:
+        state = 'running' if pending else 'finished'
+    return {
+        'job_id': job_id,
+        'status': state,
+        'created_at': counts['created_at'],
+        'created_by': counts['created_by'],
+        'total': counts['total'],
+        **{outcome: counts[outcome] for outcome in OUTCOMES},
+        'pending': pending,
+    }
+
+
+def chunks(user_ids, size=BULK_REFRESH_CHUNK):
+    for start in range(0, len(user_ids), size):
+        yield user_ids[start:start + size]
@@ -0,0 +1,89 @@
+"""
+Local snapshot of recently fetched Spotify tracks (``CatalogTrack``).
+
+Every successful refresh upserts the tracks it received, with their genres.
+When the Spotify circuit breaker is open, refreshes pick a user's set from
+this snapshot instead (degraded mode) so they finish without waiting on
+Spotify, and a real refresh is queued for after the breaker's cooldown.
+"""
+import random
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import CatalogTrack
+
+# Tracks not seen in any refresh for this long are pruned
+CATALOG_MAX_AGE = timedelta(days=30)
+# Candidates read per degraded set, sampled down to the set size
+CANDIDATE_FACTOR = 4
+
+_UPDATE_FIELDS = [
+    'track_name', 'artist_name', 'artist_names', 'album_name', 'preview_url', 'spotify_url',
+    'genres', 'popularity', 'duration_ms', 'metadata', 'fetched_at',
+]
+
+
+def record_tracks(tracks, recommendations):
+    """Upsert the Spotify ``tracks`` behind freshly built ``recommendations``"""
+    now = timezone.now()
+    rows = {
+        rec.track_id: CatalogTrack(
+            track_id=rec.track_id,
+            track_name=rec.track_name,
+            artist_name=rec.artist_name,
+            artist_names=[artist['name'] for artist in track['artists']],
+            album_name=rec.album_name,
+            preview_url=rec.preview_url,
+            spotify_url=rec.spotify_url,
+            genres=rec.genres,
+            popularity=rec.popularity,
+            duration_ms=rec.duration_ms,
+            metadata=rec.metadata,
+            fetched_at=now,
+        )
+        for track, rec in zip(tracks, recommendations)
+    }
+    # Upserting in key order makes concurrent refreshes lock shared tracks in
+    # the same order, so overlapping upserts wait instead of deadlocking
+    CatalogTrack.objects.bulk_create(
+        [rows[track_id] for track_id in sorted(rows)],
+        update_conflicts=True,
+        unique_fields=['track_id'],
+        update_fields=_UPDATE_FIELDS,
+    )
+
+
+def snapshot_tracks(user, limit=50):
+    """
+    Up to ``limit`` recent catalog tracks for ``user``: popular tracks in
+    their favorite genres or by their favorite artists first, then popular
+    tracks overall
+    """
+    recent = CatalogTrack.objects.filter(fetched_at__gte=timezone.now() - CATALOG_MAX_AGE)
+    taste = Q()
+    if user.favorite_genres:
+        taste |= Q(genres__overlap=user.favorite_genres)
+    if user.favorite_artists:
+        taste |= Q(artist_names__overlap=user.favorite_artists)
+
+    picks = []
+    if taste:
+        candidates = list(recent.filter(taste).order_by('-popularity')[:limit * CANDIDATE_FACTOR])
+        picks = random.sample(candidates, min(limit, len(candidates)))
+
+    if len(picks) < limit:
+        candidates = list(
+            recent.exclude(track_id__in=[track.track_id for track in picks])
+            .order_by('-popularity')[:limit * CANDIDATE_FACTOR]
+        )
+        picks += random.sample(candidates, min(limit - len(picks), len(candidates)))
+
+    return picks
+
+
+def prune_catalog():
+    """Delete tracks no refresh has seen within ``CATALOG_MAX_AGE``"""
+    deleted, _ = CatalogTrack.objects.filter(fetched_at__lt=timezone.now() - CATALOG_MAX_AGE).delete()
+    return deleted
@@ -0,0 +1,124 @@
+"""
+Request coalescing for Spotify lookups, in the spirit of DataLoader.
+
+A ``Loader`` sits in front of a function fetching many keys at once. Within
+a worker process:
+
+- a key that is already being fetched is not fetched again, the second
+  caller waits for the first call's result;
+- results are kept for a short time, so the same lookup repeated within a
+  refresh (or by a concurrent task) costs nothing;
+- keys requested within ``window`` seconds of each other are merged into
+  calls of up to ``max_batch`` keys, for endpoints that accept several IDs.
+
+There is no background thread: every caller drains the queue it added keys
+to, so a batch is sent by whichever caller gets there first and everybody
+receives only the keys they asked for. The batch is fetched with that
+caller's client, so per-client counters such as ``SpotifyClient.calls``
+include other callers' keys, and callers served by someone else's batch are
+not charged. Cached values are shared between callers and must be treated as
+read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Loaders created in this process, for clear_loaders()
+_loaders = []
+
+
+class Loader:
+
+    def __init__(self, fetch_many, max_batch=1, window=0.0, ttl=60, max_entries=1024):
+        """
+        ``fetch_many(client, keys)`` returns ``{key: value}``; keys it leaves
+        out resolve to ``None``
+        """
+        self.fetch_many = fetch_many
+        self.max_batch = max_batch
+        self.window = window
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.queue = []
+        self.results = OrderedDict()
+        _loaders.append(self)
+
+    def load(self, client, key):
+        return self.load_many(client, [key])[key]
+
+    def load_many(self, client, keys):
+        futures = {}
+        queued = False
+        now = time.monotonic()
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                cached = self.results.get(key)
+                if cached is not None and cached[1] > now:
+                    futures[key] = _resolved(cached[0])
+                elif key in self.pending:
+                    futures[key] = self.pending[key]
+                else:
+                    futures[key] = self.pending[key] = Future()
+                    self.queue.append(key)
+                    queued = True
+
+        if queued and self.window:
+            # Give concurrent callers a moment to add their keys to the batch
+            time.sleep(self.window)
+        # Also picks up keys left queued by a caller that was interrupted
+        self._drain(client)
+
+        return {key: future.result() for key, future in futures.items()}
+
+    def _drain(self, client):
+        while True:
+            with self.lock:
+                batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+            if not batch:
+                return
+            try:
+                values = self.fetch_many(client, batch)
+            except Exception as exc:
+                # Every caller waiting on these keys gets the error, nothing is cached
+                self._fail(batch, exc)
+                continue
+            except BaseException as exc:
+                self._fail(batch, exc)
+                raise
+            self._resolve(batch, values)
+
+    def _fail(self, batch, exc):
+        with self.lock:
+            for key in batch:
+                self.pending.pop(key).set_exception(exc)
+
+    def _resolve(self, batch, values):
+        expires_at = time.monotonic() + self.ttl
+        with self.lock:
+            for key in batch:
+                value = values.get(key)
+                if self.ttl:
+                    self.results[key] = (value, expires_at)
+                    self.results.move_to_end(key)
+                self.pending.pop(key).set_result(value)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def clear_loaders():
+    """Forget every cached lookup in this process"""
+    for loader in _loaders:
+        loader.clear()
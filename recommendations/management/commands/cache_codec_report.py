@@ -0,0 +1,80 @@
+import pickle
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+from backend.cache_codecs import CodecRouter, decode, describe
+
+
+def _timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Sample cached values and report size and encode/decode cost per CACHE_CODECS pattern'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=2000, help='Keys to inspect')
+        parser.add_argument('--repeat', type=int, default=20, help='Timing iterations per key')
+
+    def handle(self, *args, **options):
+        redis = get_redis_connection('default')
+        router = CodecRouter(getattr(settings, 'CACHE_CODECS', {}))
+        match = cache.make_key('*')
+        rows = defaultdict(lambda: defaultdict(float))
+        formats = defaultdict(Counter)
+
+        inspected = 0
+        for raw_key in redis.scan_iter(match=match, count=1000):
+            if inspected >= options['sample']:
+                break
+            # Lists, sets and hashes (metrics, queues) are not cache values
+            if redis.type(raw_key) != b'string':
+                continue
+            data = redis.get(raw_key)
+            if data is None:
+                continue
+            try:
+                int(data)
+                continue
+            except ValueError:
+                pass
+
+            key = raw_key.decode().split(':', 2)[2]
+            value = decode(data)
+            codec = router.codec_for(key)
+            encoded = codec.encode(value)
+            row = rows[router.pattern_for(key)]
+            row['keys'] += 1
+            row['pickle_bytes'] += len(pickle.dumps(value, pickle.DEFAULT_PROTOCOL))
+            row['stored_bytes'] += len(data)
+            row['configured_bytes'] += len(encoded)
+            row['encode_us'] += _timed(lambda: codec.encode(value), options['repeat'])
+            row['decode_us'] += _timed(lambda: decode(encoded), options['repeat'])
+            codec_name, compressed = describe(data)
+            formats[router.pattern_for(key)][codec_name + ('+zlib' if compressed else '')] += 1
+            inspected += 1
+
+        if not rows:
+            self.stdout.write('No cached values found')
+            return
+
+        self.stdout.write(
+            f"{'pattern':<26} {'keys':>6} {'pickle':>10} {'stored':>10} {'configured':>11} "
+            f"{'saved':>7} {'enc us':>8} {'dec us':>8}  stored formats"
+        )
+        for pattern, row in sorted(rows.items()):
+            keys = int(row['keys'])
+            saved = 1 - row['configured_bytes'] / row['pickle_bytes'] if row['pickle_bytes'] else 0
+            stored_formats = ', '.join(f'{name}={count}' for name, count in formats[pattern].most_common())
+            self.stdout.write(
+                f"{pattern:<26} {keys:>6} {int(row['pickle_bytes']):>10} {int(row['stored_bytes']):>10} "
+                f"{int(row['configured_bytes']):>11} {saved:>7.1%} "
+                f"{row['encode_us'] / keys:>8.1f} {row['decode_us'] / keys:>8.1f}  {stored_formats}"
+            )
@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import random
+import string
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+from multiprocessing import Pool
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from analytics.models import UserActivity
+from recommendations.models import Recommendation
+
+User = get_user_model()
+
+GENRES = [
+    'pop', 'rock', 'hip-hop', 'jazz', 'classical', 'electronic', 'indie',
+    'metal', 'country', 'r-n-b', 'latin', 'k-pop', 'folk', 'blues', 'reggae',
+]
+MOODS = ['energetic', 'calm', 'happy', 'sad', 'focused', 'party']
+# Likes and skips are rarer than plays
+INTERACTIONS = ['play'] * 7 + ['like'] * 2 + ['skip']
+ALPHABET = string.ascii_letters + string.digits
+
+
+def _pg_array(values):
+    return '{' + ','.join('"' + value.replace('"', '\\"') + '"' for value in values) + '}'
+
+
+def _columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+class Plan:
+    """Everything a worker needs to generate one chunk reproducibly"""
+
+    def __init__(self, options, user_offset, rec_offset, activity_offset, now):
+        self.users = options['users']
+        self.recs_per_user = options['recs_per_user']
+        self.activity_mean = options['activity_mean']
+        self.activity_alpha = options['activity_alpha']
+        self.artists = options['artists']
+        self.artist_skew = options['artist_skew']
+        self.months = options['months']
+        self.seed = options['seed']
+        self.chunk_size = options['chunk_size']
+        self.user_offset = user_offset
+        self.rec_offset = rec_offset
+        self.activity_offset = activity_offset
+        self.now = now
+
+    def rng(self, phase, chunk):
+        return random.Random(f'{self.seed}:{phase}:{chunk}')
+
+    def chunks(self):
+        return range((self.users + self.chunk_size - 1) // self.chunk_size)
+
+    def user_range(self, chunk):
+        start = chunk * self.chunk_size
+        return range(start, min(start + self.chunk_size, self.users))
+
+    def artist_names(self):
+        return [f'Synthetic Artist {rank}' for rank in range(1, self.artists + 1)]
+
+    def artist_weights(self):
+        """Cumulative Zipf weights, rank 1 is the most popular artist"""
+        return list(accumulate(1 / rank ** self.artist_skew for rank in range(1, self.artists + 1)))
+
+    def random_time(self, rng, after=None):
+        start = after or self.now - timedelta(days=30 * self.months)
+        return start + (self.now - start) * rng.random()
+
+
+def _copy(model, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    buffer.seek(0)
+    columns = ', '.join(_columns(model))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {model._meta.db_table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+    return len(rows)
+
+
+def _user_rows(plan, chunk):
+    rng = plan.rng('users', chunk)
+    artists = plan.artist_names()
+    weights = plan.artist_weights()
+    rows = []
+    for index in plan.user_range(chunk):
+        joined = plan.random_time(rng)
+        row = {
+            'id': plan.user_offset + index,
+            'password': '!',
+            'last_login': '',
+            'is_superuser': 'f',
+            'first_name': 'Synthetic',
+            'last_name': f'User {index}',
+            'is_staff': 'f',
+            'is_active': 't',
+            'date_joined': joined.isoformat(),
+            'email': f'synthetic-{plan.user_offset + index}@example.com',
+            'favorite_genres': _pg_array(rng.sample(GENRES, rng.randint(1, 4))),
+            'favorite_artists': _pg_array(dict.fromkeys(rng.choices(artists, cum_weights=weights, k=3))),
+            'moods': _pg_array(rng.sample(MOODS, rng.randint(0, 2))),
+            'last_seen_at': plan.random_time(rng, joined).isoformat(),
+            'recommendations_refreshed_at': plan.random_time(rng, joined).isoformat(),
+        }
+        rows.append([row[column] for column in _columns(User)])
+    return rows
+
+
+def _recommendation_rows(plan, chunk):
+    rng = plan.rng('recommendations', chunk)
+    artists = plan.artist_names()
+    weights = plan.artist_weights()
+    rows = []
+    for index in plan.user_range(chunk):
+        for position in range(plan.recs_per_user):
+            artist_rank = rng.choices(range(plan.artists), cum_weights=weights)[0]
+            track_id = ''.join(rng.choices(ALPHABET, k=22))
+            row = {
+                'id': plan.rec_offset + index * plan.recs_per_user + position,
+                'user_id': plan.user_offset + index,
+                'track_id': track_id,
+                'track_name': f'Track {track_id[:8]}',
+                'artist_name': artists[artist_rank],
+                'album_name': f'Album {track_id[8:14]}',
+                'preview_url': '',
+                'spotify_url': f'https://open.spotify.com/track/{track_id}',
+                'genres': json.dumps([GENRES[artist_rank % len(GENRES)]]),
+                'popularity': max(0, 100 - artist_rank * 100 // plan.artists - rng.randint(0, 10)),
+                'duration_ms': rng.randint(120000, 300000),
+                'metadata': json.dumps({'album_image': None, 'release_date': None}),
+                'created_at': plan.random_time(rng).isoformat(),
+            }
+            rows.append([row[column] for column in _columns(Recommendation)])
+    return rows
+
+
+def _activity_rows(plan, chunk):
+    rng = plan.rng('activities', chunk)
+    rows = []
+    for index in plan.user_range(chunk):
+        # Pareto-distributed activity: most users do little, a few do a lot
+        count = int((rng.paretovariate(plan.activity_alpha) - 1) * plan.activity_mean * (plan.activity_alpha - 1))
+        count = min(count, plan.recs_per_user * 20)
+        for number in range(count):
+            # Users interact with the top of their list more than the bottom
+            position = min(int(rng.expovariate(5 / plan.recs_per_user)), plan.recs_per_user - 1)
+            row = {
+                # Activity ids are sparse, each user gets a fixed-size id block
+                'id': plan.activity_offset + index * plan.recs_per_user * 20 + number,
+                'user_id': plan.user_offset + index,
+                'recommendation_id': plan.rec_offset + index * plan.recs_per_user + position,
+                'interaction_type': rng.choice(INTERACTIONS),
+                'timestamp': plan.random_time(rng).isoformat(),
+                'metadata': '{}',
+            }
+            rows.append([row[column] for column in _columns(UserActivity)])
+    return rows
+
+
+PHASES = [
+    ('users', User, _user_rows),
+    ('recommendations', Recommendation, _recommendation_rows),
+    ('activities', UserActivity, _activity_rows),
+]
+
+
+def _worker_init():
+    # Never reuse a connection inherited from the parent process
+    connections.close_all()
+
+
+def _run_chunk(args):
+    plan, phase, chunk = args
+    _, model, build = next(item for item in PHASES if item[0] == phase)
+    return _copy(model, build(plan, chunk))
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic dataset of users, recommendations and activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--recs-per-user', type=int, default=50)
+        parser.add_argument('--activity-mean', type=float, default=20.0,
+                            help='Mean interactions per user')
+        parser.add_argument('--activity-alpha', type=float, default=1.5,
+                            help='Pareto shape of per-user activity, lower is more skewed')
+        parser.add_argument('--artists', type=int, default=20000)
+        parser.add_argument('--artist-skew', type=float, default=1.1,
+                            help='Zipf exponent of artist popularity')
+        parser.add_argument('--months', type=int, default=6,
+                            help='Spread timestamps over this many months')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Users per COPY batch')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('generate_dataset needs PostgreSQL (it loads data with COPY)')
+        if options['activity_alpha'] <= 1:
+            raise CommandError('--activity-alpha must be greater than 1')
+
+        # Append after existing rows so the generator can run on a used database
+        user_offset = (User.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        rec_offset = (Recommendation.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        activity_offset = (UserActivity.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        plan = Plan(
+            options, user_offset, rec_offset, activity_offset,
+            now=datetime.now(dt_timezone.utc)
+        )
+        connections.close_all()
+
+        with Pool(options['workers'], initializer=_worker_init) as pool:
+            # Phases run one after another so foreign keys always resolve
+            for phase, _, _ in PHASES:
+                jobs = [(plan, phase, chunk) for chunk in plan.chunks()]
+                total = 0
+                for rows in pool.imap_unordered(_run_chunk, jobs):
+                    total += rows
+                self.stdout.write(f'{phase}: {total} rows')
+
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [User, Recommendation, UserActivity]):
+                cursor.execute(sql)
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(self.style.SUCCESS('Synthetic dataset generated'))
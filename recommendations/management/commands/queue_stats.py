@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from backend.celery import app
+from backend.task_metrics import lane_stats
+
+
+def _fmt(seconds):
+    return '-' if seconds is None else f'{seconds:.2f}s'
+
+
+class Command(BaseCommand):
+    help = 'Show queue depth and wait-time percentiles for each Celery lane'
+
+    def handle(self, *args, **options):
+        stats = lane_stats(app, settings.CELERY_TASK_QUEUE_LANES)
+        self.stdout.write(f"{'lane':<14} {'depth':>7} {'samples':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+        for queue, row in stats.items():
+            self.stdout.write(
+                f"{queue:<14} {row['depth']:>7} {row['wait_samples']:>8} "
+                f"{_fmt(row['wait_p50']):>9} {_fmt(row['wait_p95']):>9} {_fmt(row['wait_p99']):>9}"
+            )
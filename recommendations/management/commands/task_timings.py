@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from backend.task_metrics import task_stats
+
+
+def _fmt(seconds):
+    return '-' if seconds is None else f'{seconds:.3f}s'
+
+
+class Command(BaseCommand):
+    help = 'Show queue lag, runtime and stage percentiles per Celery task, with the slowest runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tasks', nargs='*', help='Task names (default: every recorded task)')
+        parser.add_argument('--slow', type=int, default=5, help='Slow runs to list per task')
+
+    def _row(self, label, pcts):
+        self.stdout.write(
+            f"  {label:<20} {_fmt(pcts['p50']):>10} {_fmt(pcts['p95']):>10} {_fmt(pcts['p99']):>10}"
+        )
+
+    def handle(self, *args, **options):
+        stats = task_stats(options['tasks'] or None)
+        if not stats:
+            self.stdout.write('No task runs recorded yet')
+            return
+
+        for name, row in stats.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name} ({row['runs']} runs, {row['failures']} not successful)"
+            ))
+            self.stdout.write(f"  {'':<20} {'p50':>10} {'p95':>10} {'p99':>10}")
+            self._row('queue lag', row['lag'])
+            self._row('runtime', row['runtime'])
+            for stage, pcts in row['stages'].items():
+                self._row(f'  {stage}', pcts)
+
+            for run in row['slowest'][:options['slow']]:
+                extra = {
+                    key: value for key, value in run.items()
+                    if key not in ('task_id', 'state', 'finished_at', 'lag', 'runtime', 'stages')
+                }
+                stages = ', '.join(f'{stage}={seconds:.2f}s' for stage, seconds in run['stages'].items())
+                self.stdout.write(
+                    f"  slow {run['task_id']} {run['state']} runtime={run['runtime']:.2f}s "
+                    f"lag={_fmt(run['lag'])} {extra} [{stages}]"
+                )
@@ -0,0 +1,29 @@
+from backend.metrics import Counter, Histogram
+# Registered here too so /metrics lists them in processes that never call Spotify
+from backend.circuit_breaker import CIRCUIT_REJECTED, CIRCUIT_TRANSITIONS  # noqa: F401
+
+SPOTIFY_LATENCY = Histogram(
+    'spotify_request_duration_seconds', 'Spotify API call latency by endpoint', ['endpoint']
+)
+SPOTIFY_RESPONSES = Counter(
+    'spotify_responses', 'Spotify API responses by endpoint and status code', ['endpoint', 'status']
+)
+SPOTIFY_RETRIES = Counter(
+    'spotify_retries', 'Spotify API calls retried, by reason', ['endpoint', 'reason']
+)
+SPOTIFY_TIMEOUTS = Counter(
+    'spotify_timeouts', 'Spotify API calls that timed out', ['endpoint']
+)
+SPOTIFY_RATE_LIMITED = Counter(
+    'spotify_rate_limited', 'Spotify API 429 responses', ['endpoint']
+)
+SPOTIFY_RETRY_AFTER = Histogram(
+    'spotify_retry_after_seconds', 'Retry-After sent with Spotify 429 responses', [],
+    buckets=(1, 2, 5, 10, 30, 60, 300)
+)
+# Approximate under concurrency: a coalesced batch is charged to the refresh
+# that sent it, and refreshes served by another's batch are not charged
+SPOTIFY_CALLS_PER_REFRESH = Histogram(
+    'spotify_calls_per_refresh', 'Spotify API calls sent by one recommendation refresh', [],
+    buckets=(1, 2, 4, 6, 8, 10, 15, 20, 30)
+)
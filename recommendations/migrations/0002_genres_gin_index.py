@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:48
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Built without locking writes, which cannot happen in a transaction
+    atomic = False
+
+    dependencies = [
+        ('recommendations', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recommendation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='recommendations_genres_gin'),
+        ),
+    ]
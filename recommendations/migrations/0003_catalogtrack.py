@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:54
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_genres_gin_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track_id', models.CharField(max_length=255, unique=True)),
+                ('track_name', models.CharField(max_length=500)),
+                ('artist_name', models.CharField(max_length=500)),
+                ('artist_names', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, size=None)),
+                ('album_name', models.CharField(blank=True, max_length=500)),
+                ('preview_url', models.URLField(blank=True, null=True)),
+                ('spotify_url', models.URLField()),
+                ('genres', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None)),
+                ('popularity', models.IntegerField(default=0)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'catalog_tracks',
+                'indexes': [models.Index(fields=['fetched_at'], name='catalog_tra_fetched_d970e7_idx'), django.contrib.postgres.indexes.GinIndex(fields=['genres'], name='catalog_tracks_genres_gin'), django.contrib.postgres.indexes.GinIndex(fields=['artist_names'], name='catalog_tracks_artists_gin')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-19 17:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0003_catalogtrack'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recommendation',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+    ]
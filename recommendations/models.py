@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -20,11 +22,60 @@ class Recommendation(models.Model):
 
     class Meta:
         db_table = 'recommendations'
-        ordering = ['-created_at']
+        # Rows of one refresh share created_at, the id keeps their order stable
+        ordering = ['-created_at', '-id']
         indexes = [
             models.Index(fields=['user', '-created_at']),
             models.Index(fields=['track_id']),
+            # jsonb_ops: genres__contains (@>) and genres__has_any_keys (?|)
+            GinIndex(fields=['genres'], name='recommendations_genres_gin'),
         ]
 
     def __str__(self):
-        return f"{self.track_name} by {self.artist_name} for {self.user.email}"
+        # user_id rather than user.email: printing a list must not query per row
+        return f"{self.track_name} by {self.artist_name} for user {self.user_id}"
+
+
+class CatalogTrack(models.Model):
+    """
+    Snapshot of tracks from recent Spotify responses, upserted by every
+    refresh. Refreshes fall back to it while Spotify is unavailable.
+    """
+    track_id = models.CharField(max_length=255, unique=True)
+    track_name = models.CharField(max_length=500)
+    artist_name = models.CharField(max_length=500)
+    artist_names = ArrayField(models.CharField(max_length=255), default=list, blank=True)
+    album_name = models.CharField(max_length=500, blank=True)
+    preview_url = models.URLField(blank=True, null=True)
+    spotify_url = models.URLField()
+    genres = ArrayField(models.CharField(max_length=100), default=list, blank=True)
+    popularity = models.IntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+    metadata = models.JSONField(default=dict, blank=True)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'catalog_tracks'
+        indexes = [
+            models.Index(fields=['fetched_at']),
+            GinIndex(fields=['genres'], name='catalog_tracks_genres_gin'),
+            GinIndex(fields=['artist_names'], name='catalog_tracks_artists_gin'),
+        ]
+
+    def __str__(self):
+        return f"{self.track_name} by {self.artist_name}"
+
+    def to_recommendation(self, user):
+        return Recommendation(
+            user=user,
+            track_id=self.track_id,
+            track_name=self.track_name,
+            artist_name=self.artist_name,
+            album_name=self.album_name,
+            preview_url=self.preview_url,
+            spotify_url=self.spotify_url,
+            genres=list(self.genres),
+            popularity=self.popularity,
+            duration_ms=self.duration_ms,
+            metadata=dict(self.metadata),
+        )
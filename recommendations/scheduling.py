@@ -0,0 +1,166 @@
+"""
+Idempotent scheduling of recommendation refreshes.
+
+Every caller that wants a user's recommendations refreshed goes through
+``schedule_refresh``. A per-user in-flight marker in Redis makes duplicate
+requests attach to the task that is already queued or running, and refreshes
+are skipped entirely while the current set is newer than the freshness window.
+
+Background refreshes are change driven: ``mark_dirty`` puts a user into a Redis
+sorted set scored by when they are due, and the periodic dispatcher enqueues
+whoever is due. Due times carry jitter so refreshes spread out instead of
+firing in one burst.
+"""
+import logging
+import random
+import time
+import uuid
+
+from celery import signature
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .models import Recommendation
+
+logger = logging.getLogger(__name__)
+
+FETCH_TASK = 'recommendations.tasks.fetch_spotify_recommendations'
+
+# Long enough for a queued run to start and finish, retries extend the marker
+# by their countdown (see hold_refresh)
+INFLIGHT_TIMEOUT = 600
+
+# Celery lanes, see CELERY_TASK_QUEUE_LANES
+INTERACTIVE_QUEUE = 'interactive'
+BATCH_QUEUE = 'batch'
+
+QUEUED = 'queued'
+IN_PROGRESS = 'in_progress'
+FRESH = 'fresh'
+
+
+def _inflight_key(user_id):
+    return f'refresh_inflight_user_{user_id}'
+
+
+def _marker(key):
+    """
+    The in-flight marker at ``key``. Markers written before refresh lanes
+    existed hold a bare task id, and are read as interactive
+    """
+    marker = cache.get(key)
+    if marker is None or isinstance(marker, dict):
+        return marker
+    return {'task_id': marker, 'queue': INTERACTIVE_QUEUE}
+
+
+def last_refreshed_at(user_id):
+    """Unix time of the user's current recommendation set, or ``None``"""
+    version = cache.get(f'recommendations_version_user_{user_id}')
+    if version:
+        return version / 1000
+
+    created_at = Recommendation.objects.filter(
+        user_id=user_id
+    ).values_list('created_at', flat=True).first()
+    return created_at.timestamp() if created_at else None
+
+
+def is_fresh(user_id, fresh_for=None):
+    if fresh_for is None:
+        fresh_for = settings.RECOMMENDATIONS_FRESH_FOR
+    refreshed_at = last_refreshed_at(user_id)
+    return refreshed_at is not None and time.time() - refreshed_at < fresh_for
+
+
+def schedule_refresh(user_id, fresh_for=None, force=False, queue=INTERACTIVE_QUEUE, job_id=None):
+    """
+    Enqueue a refresh for ``user_id`` on ``queue`` unless one is pending or not needed.
+
+    Returns ``(task_id, state)``: the new or already pending task with state
+    ``queued``/``in_progress``, or ``(None, 'fresh')`` when it was skipped.
+    A new task reports its outcome to the bulk refresh job ``job_id``.
+    """
+    if not force and is_fresh(user_id, fresh_for):
+        return None, FRESH
+
+    key = _inflight_key(user_id)
+    task_id = str(uuid.uuid4())
+    marker = {'task_id': task_id, 'queue': queue}
+    if not cache.add(key, marker, timeout=INFLIGHT_TIMEOUT):
+        existing = _marker(key)
+        # A user waiting on a batch refresh gets a new one on the interactive
+        # lane, the batch task then finds itself superseded and does nothing
+        if existing and (existing['queue'] == queue or queue != INTERACTIVE_QUEUE):
+            return existing['task_id'], IN_PROGRESS
+        cache.set(key, marker, timeout=INFLIGHT_TIMEOUT)
+
+    kwargs = {'job_id': job_id} if job_id else {}
+    signature(FETCH_TASK, args=(user_id,), kwargs=kwargs).apply_async(task_id=task_id, queue=queue)
+    return task_id, QUEUED
+
+
+def is_superseded(user_id, task_id):
+    """Whether another task has since taken over the refresh of ``user_id``"""
+    marker = _marker(_inflight_key(user_id))
+    return marker is not None and marker['task_id'] != task_id
+
+
+def hold_refresh(user_id, task_id, countdown):
+    """
+    Keep ``task_id``'s in-flight marker until its retry in ``countdown``
+    seconds has had time to run, however long Spotify asked us to wait
+    """
+    key = _inflight_key(user_id)
+    marker = _marker(key)
+    if marker and marker['task_id'] == task_id:
+        cache.touch(key, timeout=countdown + INFLIGHT_TIMEOUT)
+
+
+def release_refresh(user_id, task_id):
+    """Clear the in-flight marker once ``task_id`` is finished for good"""
+    key = _inflight_key(user_id)
+    marker = _marker(key)
+    if marker and marker['task_id'] == task_id:
+        cache.delete(key)
+
+
+def _due_key():
+    return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:refresh_due"
+
+
+def mark_dirty(user_id, delay=0, jitter=60):
+    """
+    Make ``user_id`` due for a background refresh in ``delay`` seconds plus up
+    to ``jitter`` seconds. A user already due sooner keeps the earlier time.
+    Never raises: callers have already saved the change, and the staleness
+    sweep catches users missed here.
+    """
+    due_at = time.time() + delay + random.uniform(0, jitter)
+    try:
+        get_redis_connection('default').zadd(_due_key(), {user_id: due_at}, lt=True)
+    except Exception as exc:
+        logger.warning(f"Could not schedule a background refresh for user {user_id}: {exc}")
+
+
+def spread_due(user_ids, window):
+    """Spread ``user_ids`` evenly over the next ``window`` seconds, with jitter"""
+    if not user_ids:
+        return 0
+    now = time.time()
+    slot = window / len(user_ids)
+    mapping = {
+        user_id: now + (index + random.random()) * slot
+        for index, user_id in enumerate(user_ids)
+    }
+    # Users already scheduled keep their due time
+    return get_redis_connection('default').zadd(_due_key(), mapping, nx=True)
+
+
+def pop_due(limit):
+    """Remove and return up to ``limit`` user ids whose due time has passed"""
+    redis = get_redis_connection('default')
+    candidates = redis.zrangebyscore(_due_key(), '-inf', time.time(), start=0, num=limit)
+    # Only the caller whose ZREM succeeds owns the user, so dispatchers may overlap
+    return [int(member) for member in candidates if redis.zrem(_due_key(), member)]
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Recommendation
 
@@ -10,3 +11,40 @@ class RecommendationSerializer(serializers.ModelSerializer):
             'genres', 'popularity', 'duration_ms', 'metadata', 'created_at'
         ]
         read_only_fields = ['id', 'created_at']
+
+
+RECOMMENDATION_FIELDS = RecommendationSerializer.Meta.fields
+_created_at = serializers.DateTimeField()
+
+
+def recommendation_values(recommendations):
+    """Plain field dicts of model instances, the shape ``.values(*RECOMMENDATION_FIELDS)`` returns"""
+    return [
+        {field: getattr(rec, field) for field in RECOMMENDATION_FIELDS}
+        for rec in recommendations
+    ]
+
+
+def _format_created_at(value, tz):
+    """DateTimeField's default ISO 8601 output, without its per-call setup"""
+    if value is None or timezone.is_naive(value):
+        return _created_at.to_representation(value)
+    text = value.astimezone(tz).isoformat()
+    if text.endswith('+00:00'):
+        text = text[:-6] + 'Z'
+    return text
+
+
+def recommendation_data(rows):
+    """
+    Same output as ``RecommendationSerializer(rows, many=True).data`` for
+    ``.values()`` dicts, without the per-field serializer machinery. Only
+    ``created_at`` needs converting, every other field is stored as rendered.
+    """
+    tz = timezone.get_current_timezone()
+    data = []
+    for row in rows:
+        item = {field: row[field] for field in RECOMMENDATION_FIELDS}
+        item['created_at'] = _format_created_at(item['created_at'], tz)
+        data.append(item)
+    return data
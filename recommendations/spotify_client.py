@@ -1,17 +1,116 @@
 import base64
+import logging
+import random
+import re
+import time
+
 import requests
 from django.conf import settings
 from django.core.cache import cache
-import random
+
+from backend import metrics
+from backend.circuit_breaker import CircuitBreaker, CircuitOpen
+from .coalescing import Loader
+from .metrics import (
+    SPOTIFY_LATENCY, SPOTIFY_RESPONSES, SPOTIFY_RETRIES, SPOTIFY_TIMEOUTS,
+    SPOTIFY_RATE_LIMITED, SPOTIFY_RETRY_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between retries of failed calls, doubled per attempt
+BACKOFF = 0.5
+
+# Most IDs the multi-artist endpoint accepts per call
+ARTISTS_BATCH = 50
+# Artist genres barely change, keep them for a week
+ARTIST_GENRES_TIMEOUT = 7 * 24 * 3600
+
+
+class SpotifyRateLimited(requests.HTTPError):
+    """Spotify answered 429 and asked for a longer pause than we wait inline"""
+    
+    def __init__(self, retry_after, *args, **kwargs):
+        super().__init__(f'Spotify rate limit, retry after {retry_after}s', *args, **kwargs)
+        self.retry_after = retry_after
+
+
+class SpotifyUnavailable(requests.RequestException):
+    """The Spotify circuit breaker is open, no call was made"""
+    
+    def __init__(self, retry_after, *args, **kwargs):
+        super().__init__(f'Spotify circuit open, retry after {retry_after}s', *args, **kwargs)
+        self.retry_after = retry_after
+
+
+# Shared by every process, see backend.circuit_breaker
+breaker = CircuitBreaker('spotify', settings.SPOTIFY_BREAKER)
+
+
+def _endpoint_label(path, params=None):
+    """Low-cardinality metric label for an API path"""
+    if path == 'search':
+        return f"search:{(params or {}).get('type', 'track')}"
+    if re.fullmatch(r'artists/[^/]+/top-tracks', path):
+        return 'top-tracks'
+    return path.split('/')[0]
+
+
+def _retry_after(response):
+    try:
+        return max(0, int(response.headers.get('Retry-After', 1)))
+    except ValueError:
+        return 1
+
+
+def _search_artists(client, names):
+    return {name: client._search_artist(name) for name in names}
+
+
+def _top_tracks(client, keys):
+    return {
+        (artist_id, market): client._make_request(f'artists/{artist_id}/top-tracks', params={'market': market})
+        for artist_id, market in keys
+    }
+
+
+def _artists(client, artist_ids):
+    result = client._make_request('artists', params={'ids': ','.join(artist_ids)})
+    return {artist['id']: artist for artist in result.get('artists', []) if artist}
+
+
+# Shared by every client in the process, see recommendations.coalescing
+_artist_searches = Loader(_search_artists, ttl=settings.SPOTIFY_COALESCE_TTL)
+_artist_top_tracks = Loader(_top_tracks, ttl=settings.SPOTIFY_COALESCE_TTL)
+_artist_lookups = Loader(
+    _artists,
+    max_batch=ARTISTS_BATCH,
+    window=settings.SPOTIFY_COALESCE_WINDOW,
+    ttl=settings.SPOTIFY_COALESCE_TTL
+)
+
 
 class SpotifyClient:
-    """Client for interacting with Spotify Web API"""
+    """
+    Client for interacting with Spotify Web API
+    
+    Artist searches, top tracks and artist lookups are coalesced per process:
+    repeated and concurrent lookups share one call, and artist lookups are
+    merged into multi-ID requests.
+    """
     
     def __init__(self):
         self.client_id = settings.SPOTIFY_CLIENT_ID
         self.client_secret = settings.SPOTIFY_CLIENT_SECRET
         self.token_url = settings.SPOTIFY_TOKEN_URL
         self.api_base_url = settings.SPOTIFY_API_BASE_URL
+        self.timeout = settings.SPOTIFY_TIMEOUT
+        self.max_retries = settings.SPOTIFY_MAX_RETRIES
+        self.max_retry_after = settings.SPOTIFY_MAX_RETRY_AFTER
+        # HTTP calls sent by this client, including retries. Coalesced lookups
+        # (see coalescing) are sent by whichever caller drains the batch, so
+        # under concurrency this is approximate per refresh, exact in total
+        self.calls = 0
         
     def _get_access_token(self):
         """Get cached access token or request new one"""
@@ -31,10 +130,7 @@ class SpotifyClient:
         
         data = {'grant_type': 'client_credentials'}
         
-        response = requests.post(self.token_url, headers=headers, data=data)
-        response.raise_for_status()
-        
-        token_data = response.json()
+        token_data = self._send('POST', self.token_url, 'token', headers=headers, data=data)
         token = token_data['access_token']
         expires_in = token_data.get('expires_in', 3600)
         
@@ -42,6 +138,88 @@ class SpotifyClient:
         
         return token
     
+    def _send(self, method, url, endpoint, **kwargs):
+        """
+        Perform an HTTP call with timeouts, retries and instrumentation.
+        
+        Timeouts, connection errors and 5xx responses are retried with
+        exponential backoff. A 429 is waited out inline when its Retry-After is
+        at most SPOTIFY_MAX_RETRY_AFTER, otherwise ``SpotifyRateLimited`` is
+        raised for the caller (the Celery task) to back off.
+        
+        Every attempt passes the circuit breaker, which raises
+        ``SpotifyUnavailable`` without calling Spotify while it is open.
+        Errors, 5xx and slow responses count against it.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                probe = breaker.allow()
+            except CircuitOpen as exc:
+                raise SpotifyUnavailable(exc.retry_after) from exc
+            self.calls += 1
+            start = time.perf_counter()
+            try:
+                response = requests.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.Timeout, requests.ConnectionError) as exc:
+                breaker.record(False, time.perf_counter() - start, probe)
+                timed_out = isinstance(exc, requests.Timeout)
+                self._observe(endpoint, start, 'timeout' if timed_out else 'error')
+                if timed_out:
+                    SPOTIFY_TIMEOUTS.inc(endpoint=endpoint)
+                logger.warning(
+                    f"Spotify {endpoint} call failed: {exc}",
+                    extra={'endpoint': endpoint, 'attempt': attempt, 'error': type(exc).__name__}
+                )
+                if attempt == self.max_retries:
+                    raise
+                self._retry(endpoint, 'timeout' if timed_out else 'connection', attempt)
+                continue
+            
+            status = response.status_code
+            breaker.record(status < 500, time.perf_counter() - start, probe)
+            self._observe(endpoint, start, status)
+            
+            if status == 429:
+                retry_after = _retry_after(response)
+                with metrics.batch():
+                    SPOTIFY_RATE_LIMITED.inc(endpoint=endpoint)
+                    SPOTIFY_RETRY_AFTER.observe(retry_after)
+                logger.warning(
+                    f"Spotify rate limited {endpoint}, retry after {retry_after}s",
+                    extra={'endpoint': endpoint, 'attempt': attempt, 'retry_after': retry_after}
+                )
+                if attempt == self.max_retries or retry_after > self.max_retry_after:
+                    raise SpotifyRateLimited(retry_after, response=response)
+                self._retry(endpoint, 'rate_limited', attempt, delay=retry_after)
+                continue
+            
+            if status >= 500 and attempt < self.max_retries:
+                logger.warning(
+                    f"Spotify {endpoint} returned {status}",
+                    extra={'endpoint': endpoint, 'attempt': attempt, 'status': status}
+                )
+                self._retry(endpoint, 'server_error', attempt)
+                continue
+            
+            response.raise_for_status()
+            return response.json()
+    
+    def _observe(self, endpoint, start, status):
+        elapsed = time.perf_counter() - start
+        with metrics.batch():
+            SPOTIFY_LATENCY.observe(elapsed, endpoint=endpoint)
+            SPOTIFY_RESPONSES.inc(endpoint=endpoint, status=status)
+        logger.debug(
+            f"Spotify {endpoint} {status} in {elapsed * 1000:.0f}ms",
+            extra={'endpoint': endpoint, 'status': status, 'duration_ms': round(elapsed * 1000, 1)}
+        )
+    
+    def _retry(self, endpoint, reason, attempt, delay=None):
+        SPOTIFY_RETRIES.inc(endpoint=endpoint, reason=reason)
+        if delay is None:
+            delay = BACKOFF * 2 ** attempt + random.uniform(0, BACKOFF / 2)
+        time.sleep(delay)
+    
     def _make_request(self, endpoint, params=None):
         """Make authenticated request to Spotify API"""
         token = self._get_access_token()
@@ -52,10 +230,7 @@ class SpotifyClient:
         }
         
         url = f"{self.api_base_url}/{endpoint}"
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        
-        return response.json()
+        return self._send('GET', url, _endpoint_label(endpoint, params), headers=headers, params=params)
     
     def get_recommendations(self, seed_genres=None, seed_artists=None, limit=20, **kwargs):
         """
@@ -79,7 +254,10 @@ class SpotifyClient:
                     if artist_id:
                         tracks = self.get_artist_top_tracks(artist_id)
                         all_tracks.extend(tracks.get('tracks', [])[:5])
-                except:
+                except (SpotifyRateLimited, SpotifyUnavailable):
+                    raise
+                except requests.RequestException as exc:
+                    logger.warning(f"Skipping seed artist {artist}: {exc}", extra={'artist': artist})
                     continue
         
         # Strategy 2: Search by genre keywords
@@ -90,7 +268,10 @@ class SpotifyClient:
                     result = self.search_tracks(search_query, limit=10)
                     tracks = result.get('tracks', {}).get('items', [])
                     all_tracks.extend(tracks)
-                except:
+                except (SpotifyRateLimited, SpotifyUnavailable):
+                    raise
+                except requests.RequestException as exc:
+                    logger.warning(f"Skipping seed genre {genre}: {exc}", extra={'genre': genre})
                     continue
         
         # Strategy 3: Search popular tracks if nothing else worked
@@ -101,8 +282,10 @@ class SpotifyClient:
                 result = self.search_tracks(query, limit=20)
                 tracks = result.get('tracks', {}).get('items', [])
                 all_tracks.extend(tracks)
-            except:
-                pass
+            except (SpotifyRateLimited, SpotifyUnavailable):
+                raise
+            except requests.RequestException as exc:
+                logger.warning(f"Popular tracks fallback failed: {exc}")
         
         # Remove duplicates and limit
         unique_tracks = []
@@ -118,6 +301,9 @@ class SpotifyClient:
     
     def search_artist(self, artist_name):
         """Search for artist by name and return artist ID"""
+        return _artist_searches.load(self, artist_name)
+    
+    def _search_artist(self, artist_name):
         params = {
             'q': artist_name,
             'type': 'artist',
@@ -143,7 +329,39 @@ class SpotifyClient:
     
     def get_artist_top_tracks(self, artist_id, market='US'):
         """Get artist's top tracks"""
-        return self._make_request(f'artists/{artist_id}/top-tracks', params={'market': market})
+        return _artist_top_tracks.load(self, (artist_id, market))
+    
+    def get_popular_tracks_by_artist(self, artist_id, limit=5):
+        """Get IDs of an artist's most popular tracks"""
+        tracks = self.get_artist_top_tracks(artist_id).get('tracks', [])
+        return [track['id'] for track in tracks[:limit]]
+    
+    def get_artists(self, artist_ids):
+        """Artist objects for the given IDs, 50 per call (``None`` for unknown IDs)"""
+        artists = _artist_lookups.load_many(self, artist_ids)
+        return [artists[artist_id] for artist_id in artist_ids]
+    
+    def get_artist_genres(self, artist_ids):
+        """Genres by artist ID, from the cache or batched ``artists`` calls"""
+        artist_ids = list(dict.fromkeys(artist_ids))
+        keys = {artist_id: f'spotify_artist_genres_{artist_id}' for artist_id in artist_ids}
+        cached = cache.get_many(list(keys.values()))
+        genres = {artist_id: cached[key] for artist_id, key in keys.items() if key in cached}
+        
+        missing = [artist_id for artist_id in artist_ids if artist_id not in genres]
+        if missing:
+            # Unknown artists are cached without genres so they are not asked for again
+            fetched = dict.fromkeys(missing, [])
+            for artist in self.get_artists(missing):
+                if artist:
+                    fetched[artist['id']] = artist.get('genres', [])
+            cache.set_many(
+                {keys[artist_id]: value for artist_id, value in fetched.items() if artist_id in keys},
+                timeout=ARTIST_GENRES_TIMEOUT
+            )
+            genres.update(fetched)
+        
+        return genres
     
     def get_available_genres(self):
         """Note: This endpoint is also deprecated, returning mock data"""
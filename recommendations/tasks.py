@@ -1,120 +1,371 @@
 from celery import shared_task
 from django.core.cache import cache
+from django.db.models import Q
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from .models import Recommendation
-from .spotify_client import SpotifyClient
+from .bulk import add_users, record_outcome, BULK_REFRESH_CHUNK, DONE, FAILED, SKIPPED
+from .catalog import record_tracks, snapshot_tracks, prune_catalog
+from .serializers import recommendation_values
+from .spotify_client import SpotifyClient, SpotifyRateLimited, SpotifyUnavailable
+from .metrics import SPOTIFY_CALLS_PER_REFRESH
+from .scheduling import (
+    schedule_refresh, hold_refresh, release_refresh, is_superseded, mark_dirty, spread_due, pop_due,
+    QUEUED, IN_PROGRESS, BATCH_QUEUE
+)
+from backend.cache import store
+from backend.pubsub import publish
+from backend.task_metrics import stage, tag
+from users.segments import segment_batches, segment_queryset
+from datetime import timedelta
 import logging
+import random
+import time
+
+import requests
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# The full refresh skips users refreshed within half its 6 hour cycle
+BATCH_FRESH_FOR = 3 * 3600
+
+# Users whose set is older than this are queued by the staleness sweep
+STALE_AFTER = timedelta(hours=6)
+# Only users seen this recently get background refreshes
+ACTIVE_WITHIN = timedelta(days=30)
+# The sweep spreads due times across this many seconds (its own period)
+SWEEP_WINDOW = 3600
+# Upper bound of refreshes handed out per dispatcher run
+DISPATCH_BATCH = 1000
+# Users with a recent set are retried this long after Spotify was unavailable
+OUTAGE_RETRY_DELAY = 15 * 60
+
+
 @shared_task(bind=True, max_retries=3)
-def fetch_spotify_recommendations(self, user_id):
+def fetch_spotify_recommendations(self, user_id, job_id=None):
     """
     Background task to fetch recommendations from Spotify API
+    
+    While the Spotify circuit breaker is open the user's current set is kept;
+    only users without one get a set from the local catalog snapshot. Refreshes
+    started by a bulk job report their outcome to ``job_id``.
+    
+    Every refresh that ends, whatever its status, is announced to connected
+    clients on ``refresh_finished:{user_id}``; only a retry is not an end.
     """
+    tag(user_id=user_id)
+    if is_superseded(user_id, self.request.id):
+        logger.info(f"Refresh {self.request.id} for user {user_id} superseded, skipping")
+        record_outcome(job_id, SKIPPED)
+        _announce(user_id, 'superseded')
+        return {'user_id': user_id, 'status': 'superseded'}
+    
     try:
-        user = User.objects.get(id=user_id)
+        with stage('load_user'):
+            user = User.objects.get(id=user_id)
         client = SpotifyClient()
         
-        # Convert artist names to IDs and get their tracks
-        seed_artists = []
-        seed_tracks = []
+        unavailable = None
+        try:
+            tracks = _fetch_tracks(client, user)
+        except SpotifyUnavailable as exc:
+            unavailable = exc
         
-        for artist_name in user.favorite_artists[:3]:
-            artist_id = client.search_artist(artist_name)
-            if artist_id:
-                seed_artists.append(artist_id)
-                # Get popular tracks from this artist
-                tracks = client.get_popular_tracks_by_artist(artist_id, limit=2)
-                seed_tracks.extend(tracks)
-        
-        # Limit to 5 seeds total (Spotify requirement)
-        seed_artists = seed_artists[:2]
-        seed_tracks = seed_tracks[:3]
+        if unavailable is None:
+            with stage('enrich_genres'):
+                artist_genres = _artist_genres(client, tracks)
+            recommendations = [_recommendation(user, track, artist_genres) for track in tracks]
+        else:
+            # Replacing a set with another catalog sample on every retry would
+            # only churn rows and notifications, so existing sets are kept
+            has_set = Recommendation.objects.filter(user=user).exists()
+            recommendations = []
+            if not has_set:
+                logger.warning(f"Spotify unavailable, building user {user_id}'s recommendations from the catalog")
+                with stage('catalog_read'):
+                    recommendations = [track.to_recommendation(user) for track in snapshot_tracks(user)]
+        SPOTIFY_CALLS_PER_REFRESH.observe(client.calls)
+        tag(spotify_calls=client.calls, degraded=unavailable is not None)
         
-        # Fallback if no seeds found
-        if not seed_artists and not seed_tracks:
-            # Use default popular artists
-            seed_artists = [
-                '4YRxDV8wJFPHPTeXepOstw',  # Coldplay
-                '6eUKZXaKkcviH0Ku9w2n3V',  # Ed Sheeran
-            ]
-        
-        # Map moods to Spotify audio features
-        mood_params = _map_moods_to_features(user.moods)
-        
-        # Fetch recommendations from Spotify
-        # Note: Not using seed_genres due to API deprecation
-        spotify_data = client.get_recommendations(
-            seed_artists=seed_artists,
-            seed_tracks=seed_tracks,
-            limit=50,
-            **mood_params
-        )
+        if unavailable is not None:
+            # Catalog sets and stale sets leave recommendations_refreshed_at old,
+            # so the staleness sweep brings their real refresh. Only users with a
+            # recent real set need to be queued again for after the outage.
+            refreshed_at = user.recommendations_refreshed_at
+            if refreshed_at and refreshed_at >= timezone.now() - STALE_AFTER:
+                mark_dirty(user_id, delay=max(unavailable.retry_after, OUTAGE_RETRY_DELAY))
+            if not recommendations:
+                status = 'kept' if has_set else 'deferred'
+                release_refresh(user_id, self.request.id)
+                record_outcome(job_id, SKIPPED)
+                _announce(user_id, status)
+                return {'user_id': user_id, 'status': status}
         
         # Clear old recommendations (keep last 100)
-        old_recs = Recommendation.objects.filter(user=user).order_by('-created_at')[100:]
-        old_recs.delete()
+        with stage('delete_old'):
+            # Django refuses delete() on a sliced queryset, so slice the ids instead
+            old_ids = Recommendation.objects.filter(user=user).order_by('-created_at', '-id').values('id')[100:]
+            Recommendation.objects.filter(id__in=old_ids).delete()
         
         # Save new recommendations
-        recommendations = []
-        for track in spotify_data.get('tracks', []):
-            rec = Recommendation(
-                user=user,
-                track_id=track['id'],
-                track_name=track['name'],
-                artist_name=', '.join([artist['name'] for artist in track['artists']]),
-                album_name=track['album']['name'],
-                preview_url=track.get('preview_url'),
-                spotify_url=track['external_urls']['spotify'],
-                popularity=track.get('popularity', 0),
-                duration_ms=track.get('duration_ms', 0),
-                metadata={
-                    'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    'release_date': track['album'].get('release_date'),
-                }
-            )
-            recommendations.append(rec)
+        with stage('bulk_create'):
+            Recommendation.objects.bulk_create(recommendations)
+            if unavailable is None:
+                # Degraded sets stay stale so the periodic sweep replaces them too
+                User.objects.filter(id=user_id).update(recommendations_refreshed_at=timezone.now())
         
-        Recommendation.objects.bulk_create(recommendations)
+        if unavailable is None:
+            with stage('catalog_write'):
+                record_tracks(tracks, recommendations)
         
         # Cache the recommendations
-        cache_key = f'recommendations_user_{user_id}'
-        cache.set(cache_key, recommendations, timeout=3600)
+        with stage('cache_write'):
+            cache_key = f'recommendations_user_{user_id}'
+            store(cache_key, recommendation_values(recommendations), timeout=3600)
+            
+            # Streams opened later catch up from this version
+            version = int(time.time() * 1000)
+            cache.set(f'recommendations_version_user_{user_id}', version, timeout=None)
         
         logger.info(f"Successfully fetched {len(recommendations)} recommendations for user {user_id}")
+        status = 'success' if unavailable is None else 'degraded'
+        release_refresh(user_id, self.request.id)
+        record_outcome(job_id, DONE)
+        # Let connected clients know a new set is ready
+        _announce(user_id, status, version=version, count=len(recommendations))
         
         return {
             'user_id': user_id,
             'count': len(recommendations),
-            'status': 'success'
+            'status': status
         }
         
     except User.DoesNotExist:
         logger.error(f"User {user_id} not found")
+        release_refresh(user_id, self.request.id)
+        record_outcome(job_id, FAILED)
+        _announce(user_id, 'failed')
         return {'error': 'User not found'}
     
     except Exception as exc:
         logger.error(f"Error fetching recommendations for user {user_id}: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60)
+        # Back off at least as long as Spotify asked us to
+        countdown = max(60, exc.retry_after) if isinstance(exc, SpotifyRateLimited) else 60
+        if self.request.retries >= self.max_retries:
+            release_refresh(user_id, self.request.id)
+            record_outcome(job_id, FAILED)
+            _announce(user_id, 'failed')
+        else:
+            # Requests arriving during the back-off must still attach to this task
+            hold_refresh(user_id, self.request.id, countdown)
+        raise self.retry(exc=exc, countdown=countdown)
 
 
+def _announce(user_id, status, **fields):
+    """
+    Publish the end of a refresh to connected clients. Never raises, the
+    refresh itself is over either way
+    """
+    try:
+        publish(f'refresh_finished:{user_id}', {'user_id': user_id, 'status': status, **fields})
+    except Exception as exc:
+        logger.warning(f"Could not announce the end of user {user_id}'s refresh: {exc}")
+
+
+def _fetch_tracks(client, user):
+    """Spotify tracks for ``user`` seeded by their favorite artists and moods"""
+    # Convert artist names to IDs and get their tracks
+    seed_artists = []
+    seed_tracks = []
+    
+    with stage('resolve_artists'):
+        for artist_name in user.favorite_artists[:3]:
+            artist_id = client.search_artist(artist_name)
+            if artist_id:
+                seed_artists.append(artist_id)
+                # Get popular tracks from this artist
+                tracks = client.get_popular_tracks_by_artist(artist_id, limit=2)
+                seed_tracks.extend(tracks)
+    
+    # Limit to 5 seeds total (Spotify requirement)
+    seed_artists = seed_artists[:2]
+    seed_tracks = seed_tracks[:3]
+    
+    # Fallback if no seeds found
+    if not seed_artists and not seed_tracks:
+        # Use default popular artists
+        seed_artists = [
+            '4YRxDV8wJFPHPTeXepOstw',  # Coldplay
+            '6eUKZXaKkcviH0Ku9w2n3V',  # Ed Sheeran
+        ]
+    
+    # Map moods to Spotify audio features
+    mood_params = _map_moods_to_features(user.moods)
+    
+    # Fetch recommendations from Spotify
+    # Note: Not using seed_genres due to API deprecation
+    with stage('spotify_fetch'):
+        spotify_data = client.get_recommendations(
+            seed_artists=seed_artists,
+            seed_tracks=seed_tracks,
+            limit=50,
+            **mood_params
+        )
+    return spotify_data.get('tracks', [])
+
+
+def _recommendation(user, track, artist_genres):
+    return Recommendation(
+        user=user,
+        track_id=track['id'],
+        track_name=track['name'],
+        artist_name=', '.join([artist['name'] for artist in track['artists']]),
+        album_name=track['album']['name'],
+        preview_url=track.get('preview_url'),
+        spotify_url=track['external_urls']['spotify'],
+        genres=_track_genres(track, artist_genres),
+        popularity=track.get('popularity', 0),
+        duration_ms=track.get('duration_ms', 0),
+        metadata={
+            'album_image': track['album']['images'][0]['url'] if track['album']['images'] else None,
+            'release_date': track['album'].get('release_date'),
+        }
+    )
+
 
 @shared_task
 def refresh_all_users_recommendations():
     """
-    Periodic task to refresh recommendations for all users
+    Refresh recommendations for all active users (manual backfill)
     """
-    users = User.objects.filter(is_active=True)
+    # Freshness is checked in this one query instead of once per user
+    fresh_since = timezone.now() - timedelta(seconds=BATCH_FRESH_FOR)
+    user_ids = User.objects.filter(is_active=True).filter(
+        Q(recommendations_refreshed_at__isnull=True) |
+        Q(recommendations_refreshed_at__lt=fresh_since)
+    ).values_list('id', flat=True)
+    
+    triggered = 0
+    for user_id in user_ids.iterator():
+        _, state = schedule_refresh(user_id, force=True, queue=BATCH_QUEUE)
+        if state == QUEUED:
+            triggered += 1
     
-    for user in users:
-        fetch_spotify_recommendations.delay(user.id)
+    logger.info(f"Triggered recommendation refresh for {triggered} users")
+    
+    return {'triggered': triggered}
+
+
+@shared_task
+def schedule_stale_refreshes():
+    """
+    Periodic task queueing recently active users whose recommendations are stale
+    """
+    now = timezone.now()
+    user_ids = list(User.objects.filter(
+        is_active=True,
+        last_seen_at__gte=now - ACTIVE_WITHIN
+    ).filter(
+        Q(recommendations_refreshed_at__isnull=True) |
+        Q(recommendations_refreshed_at__lt=now - STALE_AFTER)
+    ).order_by().values_list('id', flat=True))
     
-    logger.info(f"Triggered recommendation refresh for {users.count()} users")
+    random.shuffle(user_ids)
+    added = spread_due(user_ids, SWEEP_WINDOW)
     
-    return {'triggered': users.count()}
+    logger.info(f"Scheduled {added} stale users over the next {SWEEP_WINDOW}s")
+    
+    return {'stale': len(user_ids), 'scheduled': added}
+
+
+@shared_task
+def dispatch_due_refreshes():
+    """
+    Periodic task enqueueing refreshes for users whose due time has passed
+    """
+    triggered = 0
+    for user_id in pop_due(DISPATCH_BATCH):
+        _, state = schedule_refresh(user_id, force=True, queue=BATCH_QUEUE)
+        if state == QUEUED:
+            triggered += 1
+    
+    if triggered:
+        logger.info(f"Dispatched {triggered} due recommendation refreshes")
+    
+    return {'triggered': triggered}
+
+
+@shared_task
+def plan_bulk_refresh(job_id, filters, match='any'):
+    """
+    List the users of an audience segment into a bulk refresh job, one chunk
+    task per batch of IDs
+    """
+    listed = 0
+    for user_ids in segment_batches(segment_queryset(filters, match), batch_size=BULK_REFRESH_CHUNK):
+        add_users(job_id, len(user_ids))
+        refresh_bulk_chunk.delay(job_id, user_ids)
+        listed += len(user_ids)
+    add_users(job_id, 0, listed=True)
+    
+    logger.info(f"Listed {listed} users into refresh job {job_id}")
+    
+    return {'job_id': job_id, 'listed': listed}
+
+
+@shared_task
+def refresh_bulk_chunk(job_id, user_ids):
+    """
+    Schedule refreshes for a chunk of a bulk job, the refreshes report back
+    """
+    existing = set(User.objects.filter(id__in=user_ids, is_active=True).values_list('id', flat=True))
+    record_outcome(job_id, FAILED, len(user_ids) - len(existing))
+    
+    triggered = attached = 0
+    for user_id in user_ids:
+        if user_id not in existing:
+            continue
+        _, state = schedule_refresh(user_id, force=True, queue=BATCH_QUEUE, job_id=job_id)
+        if state == QUEUED:
+            triggered += 1
+        elif state == IN_PROGRESS:
+            # That refresh belongs to someone else and will not report here
+            attached += 1
+    record_outcome(job_id, SKIPPED, attached)
+    
+    return {'job_id': job_id, 'triggered': triggered, 'skipped': attached}
+
+
+@shared_task
+def prune_catalog_tracks():
+    """
+    Periodic task dropping catalog tracks no refresh has seen for a while
+    """
+    deleted = prune_catalog()
+    logger.info(f"Pruned {deleted} catalog tracks")
+    
+    return {'deleted': deleted}
+
+
+def _artist_genres(client, tracks):
+    """Genres of every artist on ``tracks``, empty if Spotify fails"""
+    artist_ids = [artist['id'] for track in tracks for artist in track['artists'] if artist.get('id')]
+    try:
+        return client.get_artist_genres(artist_ids)
+    except requests.RequestException as exc:
+        # Genres only feed trends, the refresh itself still succeeds
+        logger.warning(f"Could not fetch artist genres: {exc}")
+        return {}
+
+
+def _track_genres(track, artist_genres):
+    """Genres of a track's artists, in artist order without duplicates"""
+    return list(dict.fromkeys(
+        genre
+        for artist in track['artists']
+        for genre in artist_genres.get(artist.get('id'), [])
+    ))
 
 
 def _map_moods_to_features(moods):
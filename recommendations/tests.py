@@ -1,9 +1,92 @@
+import asyncio
+import io
+import json
+import logging
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+
 import pytest
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory
 from django.urls import reverse
-from rest_framework.test import APIClient
+from django.utils import timezone
+from django_redis.pool import ConnectionFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from analytics.views import CacheStatsView
+from backend import cache_backends, metrics, pubsub, task_metrics, throttling
+from backend.cache import read_many, read_through, store
+from backend.cache_codecs import Codec, decode, describe
+from backend.circuit_breaker import CircuitOpen
+from backend.pubsub import EventHub
+from backend.renderers import ORJSONRenderer
+from backend.stats import percentile
+from backend.throttling import UserRateThrottle
+from benchmarks.fake_spotify import fake_artist, spotify_id
+from users import authentication
 from users.models import UserProfile
-from recommendations.models import Recommendation
+from recommendations import async_views, bulk, scheduling, spotify_client, tasks, views
+from recommendations.metrics import SPOTIFY_CALLS_PER_REFRESH
+from recommendations.models import CatalogTrack, Recommendation
+from recommendations.scheduling import (
+    INFLIGHT_TIMEOUT, hold_refresh, is_superseded, mark_dirty, pop_due, release_refresh,
+    schedule_refresh, spread_due
+)
+from recommendations.serializers import (
+    RecommendationSerializer, recommendation_data, recommendation_values
+)
+from recommendations.spotify_client import SpotifyClient, SpotifyRateLimited, SpotifyUnavailable
+from recommendations.views import RefreshRateThrottle
+
+User = get_user_model()
+
+
+@pytest.fixture
+def plain_user():
+    """A signed-in, non-staff user that never touches the database"""
+    return SimpleNamespace(id=11, pk=11, is_authenticated=True, is_staff=False)
+
+
+@pytest.fixture
+def staff_user():
+    """A signed-in staff user that never touches the database"""
+    return SimpleNamespace(id=1, pk=1, is_authenticated=True, is_staff=True)
+
+
+@pytest.fixture
+def plain_request(plain_user):
+    """Just enough of a DRF request for the throttles"""
+    return SimpleNamespace(user=plain_user, META={})
+
+
+@pytest.fixture
+def signed_in(plain_user, monkeypatch):
+    """
+    Authenticate async view requests as ``plain_user``. Returns the
+    ``query_token`` flag of every authentication, in order
+    """
+    query_tokens = []
+    
+    async def authenticated(request, query_token=False):
+        query_tokens.append(query_token)
+        request.user = plain_user
+        return plain_user
+    
+    monkeypatch.setattr(async_views, 'aauthenticate', authenticated)
+    return query_tokens
+
 
 @pytest.mark.django_db
 class TestRecommendations:
@@ -31,3 +114,1111 @@ class TestRecommendations:
         
         assert response.status_code == status.HTTP_200_OK
         assert response.data['count'] == 0
+
+
+class TestReadThroughCache:
+    
+    def test_rebuilds_once_then_hits(self):
+        """Test that a cold key is rebuilt once and then served from cache"""
+        calls = []
+        
+        def rebuild():
+            calls.append(1)
+            return ['track']
+        
+        assert read_through('rt_key', rebuild, timeout=60) == (['track'], False)
+        assert read_through('rt_key', rebuild, timeout=60) == (['track'], True)
+        assert len(calls) == 1
+    
+    def test_serves_stale_while_locked(self):
+        """Test that an expired entry is served while another caller rebuilds"""
+        store('rt_stale', ['old'], timeout=-1)
+        cache.add('rt_stale:lock', 1)
+        
+        value, hit = read_through('rt_stale', lambda: ['new'], timeout=60)
+        
+        assert value == ['old']
+        assert hit
+    
+    def test_bare_values_are_misses(self):
+        """Test that values cached before the entry format are rebuilt, not unpacked"""
+        legacy = [{'track_id': 'a'}, {'track_id': 'b'}, {'track_id': 'c'}]
+        cache.set('rt_legacy', legacy)
+        cache.set('rt_legacy_many', legacy)
+        
+        assert read_through('rt_legacy', lambda: ['new'], timeout=60) == (['new'], False)
+        assert read_many(['rt_legacy', 'rt_legacy_many']) == {'rt_legacy': ['new']}
+
+
+class TestRefreshScheduling:
+    
+    @pytest.fixture
+    def due(self, monkeypatch):
+        """A fakeredis client holding the due set"""
+        fakeredis = pytest.importorskip('fakeredis')
+        redis = fakeredis.FakeRedis()
+        monkeypatch.setattr(scheduling, 'get_redis_connection', lambda alias: redis)
+        return redis
+    
+    def test_duplicate_refresh_attaches_to_pending_task(self):
+        """Test that a second refresh request returns the pending task"""
+        cache.set('recommendations_version_user_7', 1)
+        
+        with mock.patch('recommendations.scheduling.signature') as sig:
+            first_id, first_state = schedule_refresh(7)
+            second_id, second_state = schedule_refresh(7)
+        
+        assert (first_state, second_state) == ('queued', 'in_progress')
+        assert first_id == second_id
+        assert sig.return_value.apply_async.call_count == 1
+    
+    def test_fresh_set_is_not_refreshed(self):
+        """Test that refreshes are skipped inside the freshness window"""
+        cache.set('recommendations_version_user_8', int(time.time() * 1000))
+        
+        assert schedule_refresh(8) == (None, 'fresh')
+    
+    def test_interactive_refresh_supersedes_batch_refresh(self):
+        """Test that a user-triggered refresh is not stuck behind a batch one"""
+        cache.set('recommendations_version_user_9', 1)
+        
+        with mock.patch('recommendations.scheduling.signature'):
+            batch_id, _ = schedule_refresh(9, queue='batch')
+            interactive_id, state = schedule_refresh(9)
+        
+        assert state == 'queued'
+        assert interactive_id != batch_id
+        assert is_superseded(9, batch_id)
+    
+    def test_legacy_marker_still_attaches(self):
+        """Test that an in-flight marker holding a bare task id is still understood"""
+        cache.set('recommendations_version_user_10', 1)
+        cache.set('refresh_inflight_user_10', 'old-task')
+        
+        with mock.patch('recommendations.scheduling.signature') as sig:
+            assert schedule_refresh(10) == ('old-task', 'in_progress')
+        assert not sig.called
+        assert is_superseded(10, 'other-task')
+        release_refresh(10, 'old-task')
+        assert cache.get('refresh_inflight_user_10') is None
+    
+    def test_retry_holds_marker_through_countdown(self):
+        """Test that a retry waiting out a long 429 keeps its marker, and only its own"""
+        cache.set('recommendations_version_user_13', 1)
+        with mock.patch('recommendations.scheduling.signature'):
+            task_id, _ = schedule_refresh(13)
+        cache.add('refresh_inflight_user_14', {'task_id': 'newer', 'queue': 'interactive'}, timeout=INFLIGHT_TIMEOUT)
+        
+        hold_refresh(13, task_id, countdown=1800)
+        hold_refresh(14, 'older', countdown=1800)
+        
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 1800):
+            assert cache.get('refresh_inflight_user_13') == {'task_id': task_id, 'queue': 'interactive'}
+            assert cache.get('refresh_inflight_user_14') is None
+    
+    def test_mark_dirty_survives_redis_errors(self, monkeypatch, caplog):
+        """Test that a failed due-time write is logged, not raised into the request"""
+        redis = mock.Mock(**{'zadd.side_effect': ConnectionError('Redis is down')})
+        monkeypatch.setattr(scheduling, 'get_redis_connection', lambda alias: redis)
+        
+        with caplog.at_level(logging.WARNING, logger='recommendations.scheduling'):
+            mark_dirty(12, delay=60)
+        
+        assert 'Could not schedule a background refresh for user 12: Redis is down' in caplog.text
+    
+    def test_mark_dirty_keeps_earlier_due_time(self, due):
+        """Test that marking a user dirty again only ever brings the refresh forward"""
+        mark_dirty(15, delay=600, jitter=0)
+        first = due.zscore(scheduling._due_key(), 15)
+        
+        mark_dirty(15, delay=3600, jitter=0)
+        assert due.zscore(scheduling._due_key(), 15) == first
+        
+        mark_dirty(15, delay=0, jitter=0)
+        assert due.zscore(scheduling._due_key(), 15) < first - 500
+    
+    def test_spread_due_fills_window_evenly(self, due):
+        """Test that each user gets their own slot of the window and scheduled users keep theirs"""
+        due.zadd(scheduling._due_key(), {16: 1})
+        
+        start = time.time()
+        assert spread_due([16, 17, 18, 19], window=400) == 3
+        end = time.time()
+        
+        scores = {int(member): score for member, score in due.zrange(scheduling._due_key(), 0, -1, withscores=True)}
+        assert scores.pop(16) == 1
+        for index, user_id in enumerate([17, 18, 19], start=1):
+            assert start + index * 100 <= scores[user_id] <= end + (index + 1) * 100
+        assert spread_due([], window=400) == 0
+    
+    def test_pop_due_takes_only_due_users(self, due):
+        """Test that due users are handed out oldest first, once, and future ones stay"""
+        now = time.time()
+        due.zadd(scheduling._due_key(), {20: now - 30, 21: now - 20, 22: now - 10, 23: now + 60})
+        
+        assert pop_due(2) == [20, 21]
+        assert pop_due(10) == [22]
+        assert pop_due(10) == []
+        assert due.zrange(scheduling._due_key(), 0, -1) == [b'23']
+    
+    def test_dispatch_enqueues_due_users_on_batch_lane(self, due):
+        """Test that the dispatcher queues due users as batch refreshes, skipping those in flight"""
+        now = time.time()
+        due.zadd(scheduling._due_key(), {24: now - 10, 25: now - 5, 26: now + 60})
+        cache.add('refresh_inflight_user_25', {'task_id': 'pending', 'queue': 'batch'})
+        
+        with mock.patch('recommendations.scheduling.signature') as sig:
+            assert tasks.dispatch_due_refreshes() == {'triggered': 1}
+        
+        sig.assert_called_once_with(scheduling.FETCH_TASK, args=(24,), kwargs={})
+        assert sig.return_value.apply_async.call_args.kwargs['queue'] == 'batch'
+        assert due.zrange(scheduling._due_key(), 0, -1) == [b'26']
+    
+    @pytest.mark.django_db
+    def test_stale_sweep_schedules_active_stale_users(self, due):
+        """Test that the sweep only schedules recently active users whose set is stale or missing"""
+        now = timezone.now()
+        stale = User.objects.create_user(
+            email='stale@example.com', password='x',
+            last_seen_at=now, recommendations_refreshed_at=now - timedelta(hours=7)
+        )
+        never = User.objects.create_user(email='never@example.com', password='x', last_seen_at=now)
+        User.objects.create_user(
+            email='fresh@example.com', password='x',
+            last_seen_at=now, recommendations_refreshed_at=now - timedelta(hours=1)
+        )
+        User.objects.create_user(
+            email='idle@example.com', password='x', last_seen_at=now - timedelta(days=31)
+        )
+        User.objects.create_user(
+            email='inactive@example.com', password='x', last_seen_at=now, is_active=False
+        )
+        
+        assert tasks.schedule_stale_refreshes() == {'stale': 2, 'scheduled': 2}
+        assert {int(member) for member in due.zrange(scheduling._due_key(), 0, -1)} == {stale.id, never.id}
+
+
+class TestFastSerialization:
+    
+    def test_matches_drf_output_bytes(self):
+        """Test that the values() fast path renders exactly like the DRF serializer"""
+        recs = [
+            Recommendation(
+                id=index, user_id=1, track_id=f'id{index}', track_name='Café \u2028',
+                artist_name='Artist', spotify_url='https://open.spotify.com/track/x',
+                genres=['pop'], metadata={'album_image': None},
+                created_at=datetime(2025, 1, 1, 12, 0, 0, index * 1000, tzinfo=dt_timezone.utc)
+            )
+            for index in range(3)
+        ]
+        
+        stock = JSONRenderer().render(RecommendationSerializer(recs, many=True).data)
+        fast = ORJSONRenderer().render(recommendation_data(recommendation_values(recs)))
+        
+        assert fast == stock
+    
+    def test_integers_beyond_64_bits_rendered_by_drf(self):
+        """Test that integers orjson refuses fall back to DRF's encoder"""
+        data = {'big': 2 ** 64, 'negative': -2 ** 63 - 1, 'track': 'Café'}
+        
+        assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+        assert ORJSONRenderer().render(data) == '{"big":18446744073709551616,"negative":-9223372036854775809,"track":"Café"}'.encode()
+    
+    def test_non_finite_floats_render_as_null(self):
+        """Test the documented difference: NaN and Infinity become null where DRF raises"""
+        data = {'nan': float('nan'), 'inf': float('inf'), 'ninf': float('-inf')}
+        
+        assert ORJSONRenderer().render(data) == b'{"nan":null,"inf":null,"ninf":null}'
+        with pytest.raises(ValueError):
+            JSONRenderer().render(data)
+    
+    def test_float_exponents_differ_only_in_form(self):
+        """Test the documented difference: shorter exponents than DRF, for the same numbers"""
+        data = [1e16, 1e-7, 1.5e300, 0.1]
+        
+        fast = ORJSONRenderer().render(data)
+        stock = JSONRenderer().render(data)
+        
+        assert fast == b'[1e16,1e-7,1.5e300,0.1]'
+        assert stock == b'[1e+16,1e-07,1.5e+300,0.1]'
+        assert json.loads(fast) == json.loads(stock) == data
+
+
+class TestCacheCodecs:
+    
+    def test_msgpack_round_trip(self):
+        """Test that msgpack entries keep aware datetimes and lists of dicts"""
+        created = datetime(2025, 1, 1, 12, 0, 0, 5000, tzinfo=dt_timezone.utc)
+        value = ([{'id': index, 'created_at': created, 'genres': ['pop']} for index in range(20)], 0.01)
+        
+        encoded = Codec({'CODEC': 'msgpack', 'COMPRESS_MIN_BYTES': 64}).encode(value)
+        
+        assert describe(encoded) == ('msgpack', True)
+        assert decode(encoded) == [value[0], value[1]]
+    
+    def test_falls_back_to_pickle(self):
+        """Test that values msgpack cannot encode are pickled, and legacy pickles decode"""
+        rec = Recommendation(id=1, user_id=1, track_id='id', track_name='Track')
+        
+        encoded = Codec({'CODEC': 'msgpack'}).encode(rec)
+        
+        assert describe(encoded) == ('pickle', False)
+        assert decode(encoded).track_name == 'Track'
+        assert decode(pickle.dumps({'legacy': True})) == {'legacy': True}
+
+
+@pytest.fixture
+def l1_cache(settings, monkeypatch):
+    """An L1RedisCache on fakeredis, with its own local layer and invalidation listener"""
+    fakeredis = pytest.importorskip('fakeredis')
+    settings.L1_CACHE = {'KEYS': ['hot_*', 'warm_*'], 'MAX_ENTRIES': 2, 'TIMEOUT': 0.2}
+    monkeypatch.setattr(cache_backends, '_store', cache_backends._LocalStore())
+    monkeypatch.setattr(cache_backends, '_listener', {'pid': None, 'thread': None})
+    # django-redis keeps connection pools per URL for the whole process
+    monkeypatch.setattr(ConnectionFactory, '_pools', {})
+    server = fakeredis.FakeServer()
+    l1 = cache_backends.L1RedisCache('redis://localhost:6379/0', {
+        'KEY_PREFIX': 'test',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SERIALIZER': 'backend.cache_codecs.EnvelopeSerializer',
+            'CONNECTION_POOL_KWARGS': {'connection_class': fakeredis.FakeRedisConnection, 'server': server},
+        },
+    })
+    monkeypatch.setattr(l1, 'async_client', lambda: fakeredis.FakeAsyncRedis(server=server))
+    return l1
+
+
+def _write_behind_l1(l1, key, value):
+    """Change ``key`` in Redis only, as another process would without broadcasting"""
+    super(cache_backends.L1RedisCache, l1).set(key, l1._encode(key, value))
+
+
+def _until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class TestL1Cache:
+    
+    def test_hits_are_copies(self, l1_cache):
+        """Test that changing a value got from, or given to, the local layer does not change it there"""
+        value = {'tracks': ['a']}
+        l1_cache.set('hot_trends', value)
+        value['tracks'].append('b')
+        
+        first = l1_cache.get('hot_trends')
+        first['tracks'].append('c')
+        
+        assert l1_cache.get('hot_trends') == {'tracks': ['a']}
+        assert l1_cache.get('hot_trends') is not l1_cache.get('hot_trends')
+    
+    def test_bounded_lru(self, l1_cache):
+        """Test that the least recently used key is evicted beyond MAX_ENTRIES"""
+        for key in ('hot_a', 'hot_b'):
+            l1_cache.set(key, key)
+        l1_cache.get('hot_a')
+        l1_cache.set('hot_c', 'hot_c')
+        
+        assert list(cache_backends._store.entries) == [l1_cache.make_key('hot_a'), l1_cache.make_key('hot_c')]
+    
+    def test_entries_expire(self, l1_cache):
+        """Test that a local copy is served until the L1 timeout, then read from Redis again"""
+        l1_cache.set('hot_a', 'old')
+        _write_behind_l1(l1_cache, 'hot_a', 'new')
+        
+        assert l1_cache.get('hot_a') == 'old'
+        time.sleep(0.25)
+        assert l1_cache.get('hot_a') == 'new'
+    
+    def test_invalidated_by_other_processes(self, l1_cache):
+        """Test that writes broadcast by another process drop the local copy, our own echoes do not"""
+        redis = l1_cache.client.get_client()
+        l1_cache.set('hot_a', 'old')
+        _until(lambda: redis.pubsub_numsub(l1_cache._l1_channel)[0][1])
+        # The listener drops everything once subscribed, set again afterwards
+        time.sleep(0.05)
+        for key in ('hot_a', 'hot_b'):
+            l1_cache.set(key, 'old')
+            _write_behind_l1(l1_cache, key, 'new')
+        
+        redis.publish(l1_cache._l1_channel, f"{cache_backends._SENDER_ID} {l1_cache.make_key('hot_a')}")
+        redis.publish(l1_cache._l1_channel, f"other {l1_cache.make_key('hot_b')}")
+        
+        _until(lambda: l1_cache.get('hot_b') == 'new')
+        assert l1_cache.get('hot_a') == 'old'
+    
+    def test_stats_per_prefix(self, l1_cache):
+        """Test that hits and misses are counted per L1 key pattern, other keys not at all"""
+        _write_behind_l1(l1_cache, 'warm_a', 'value')
+        l1_cache.set('hot_a', 'value')
+        for key in ('hot_a', 'hot_a', 'warm_a', 'warm_a', 'cold_a'):
+            l1_cache.get(key)
+        
+        prefixes = l1_cache.l1_stats()['prefixes']
+        
+        assert prefixes == {
+            'hot_*': {'hits': 2, 'misses': 0, 'hit_ratio': 1.0},
+            'warm_*': {'hits': 1, 'misses': 1, 'hit_ratio': 0.5},
+        }
+    
+    def test_async_api(self, l1_cache):
+        """Test that aset/aget share values with the sync API and the local layer"""
+        async def roundtrip():
+            assert await l1_cache.aset('hot_a', {'tracks': ['a']}, timeout=60)
+            assert not await l1_cache.aadd('hot_a', 'other')
+            local = await l1_cache.aget('hot_a')
+            local['tracks'].append('b')
+            await l1_cache.aset('cold_a', [1, 2])
+            return await l1_cache.aget('hot_a'), await l1_cache.aget('missing', 'default')
+        
+        assert asyncio.run(roundtrip()) == ({'tracks': ['a']}, 'default')
+        assert l1_cache.get('cold_a') == [1, 2]
+        _write_behind_l1(l1_cache, 'hot_a', 'new')
+        assert l1_cache.get('hot_a') == {'tracks': ['a']}
+    
+    def test_stats_view_without_local_layer(self, staff_user):
+        """Test that the cache stats endpoint answers 404 on backends without L1"""
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, staff_user)
+        
+        assert CacheStatsView.as_view()(request).status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestThrottling:
+    
+    def test_refresh_limit_counted_separately(self, plain_request):
+        """Test that ordinary requests do not use up the refresh allowance"""
+        
+        for _ in range(10):
+            UserRateThrottle().allow_request(plain_request, None)
+        
+        assert all(RefreshRateThrottle().allow_request(plain_request, None) for _ in range(5))
+        throttle = RefreshRateThrottle()
+        assert not throttle.allow_request(plain_request, None)
+        assert 0 < throttle.wait() <= 3600
+    
+    def test_gcra_script(self, plain_request, monkeypatch):
+        """Test the Redis GCRA script: a full burst, then an exact wait for the next slot"""
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('lupa')
+        redis = fakeredis.FakeRedis()
+        monkeypatch.setattr(throttling, 'get_redis_connection', lambda alias: redis)
+        monkeypatch.setattr(throttling, '_script', None)
+        
+        # 5/hour: one request every 720s, all five may be spent at once
+        assert [RefreshRateThrottle().allow_request(plain_request, None) for _ in range(5)] == [True] * 5
+        throttle = RefreshRateThrottle()
+        assert not throttle.allow_request(plain_request, None)
+        assert 715 < throttle.wait() <= 720
+        
+        # Moving the stored arrival time back one interval frees exactly one slot
+        key = f'{throttling._prefix()}:{throttle.key}'
+        redis.set(key, int(redis.get(key)) - 720_000_000)
+        assert RefreshRateThrottle().allow_request(plain_request, None)
+        assert not RefreshRateThrottle().allow_request(plain_request, None)
+
+
+class TestGenreEnrichment:
+    
+    def test_artist_genres_batched_and_cached(self):
+        """Test that genres cost one call per 50 new artists and none once cached"""
+        artist_ids = [spotify_id(f'artist:{index}') for index in range(120)]
+        client = SpotifyClient()
+        
+        def artists(endpoint, params):
+            return {'artists': [fake_artist(artist_id) for artist_id in params['ids'].split(',')]}
+        
+        with mock.patch.object(client, '_make_request', side_effect=artists) as request:
+            first = client.get_artist_genres(artist_ids + artist_ids[:10])
+            second = client.get_artist_genres(artist_ids[:60])
+        
+        assert request.call_count == 3
+        assert first[artist_ids[0]] == fake_artist(artist_ids[0])['genres']
+        assert second == {artist_id: first[artist_id] for artist_id in artist_ids[:60]}
+
+
+class TestCoalescing:
+    
+    def test_repeated_lookups_share_calls(self):
+        """Test that a refresh looking up the same artist twice calls Spotify once"""
+        client = SpotifyClient()
+        responses = {
+            'search': {'artists': {'items': [{'id': 'a' * 22}]}},
+            f"artists/{'a' * 22}/top-tracks": {'tracks': []},
+        }
+        
+        with mock.patch.object(client, '_make_request', side_effect=lambda endpoint, params: responses[endpoint]) as request:
+            for _ in range(2):
+                artist_id = client.search_artist('Artist A')
+                client.get_artist_top_tracks(artist_id)
+        
+        assert request.call_count == 2
+    
+    def test_concurrent_lookups_merged(self, monkeypatch):
+        """Test that concurrent artist lookups share multi-ID calls, each getting its own slice"""
+        monkeypatch.setattr(spotify_client._artist_lookups, 'window', 0.1)
+        artist_ids = [spotify_id(f'artist:{index}') for index in range(30)]
+        calls = []
+        
+        def artists(self, endpoint, params):
+            calls.append(params['ids'])
+            time.sleep(0.01)
+            return {'artists': [fake_artist(artist_id) for artist_id in params['ids'].split(',')]}
+        
+        monkeypatch.setattr(spotify_client.SpotifyClient, '_make_request', artists)
+        barrier = threading.Barrier(8)
+        
+        def lookup(index):
+            wanted = artist_ids[index * 3:index * 3 + 10]
+            barrier.wait()
+            return wanted, spotify_client.SpotifyClient().get_artists(wanted)
+        
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lookup, range(8)))
+        
+        fetched = [artist_id for ids in calls for artist_id in ids.split(',')]
+        assert sorted(fetched) == sorted(artist_ids)
+        assert len(calls) < 8
+        for wanted, artists in results:
+            assert [artist['id'] for artist in artists] == wanted
+
+
+def _spotify_response(status_code, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = json.dumps(body or {}).encode()
+    return response
+
+
+class TestSpotifySend:
+    
+    @pytest.fixture
+    def spotify(self, settings, monkeypatch):
+        """
+        A client whose HTTP calls are answered by ``request.side_effect``
+        (responses, or exceptions to raise) without sleeping, with metric
+        writes summed by sample
+        """
+        settings.SPOTIFY_MAX_RETRIES = 2
+        settings.SPOTIFY_MAX_RETRY_AFTER = 5
+        settings.METRICS_ENABLED = True
+        request = mock.Mock()
+        sleeps = []
+        outcomes = []
+        monkeypatch.setattr(spotify_client.requests, 'request', request)
+        monkeypatch.setattr(spotify_client.time, 'sleep', sleeps.append)
+        monkeypatch.setattr(spotify_client.breaker, 'allow', lambda: False)
+        monkeypatch.setattr(
+            spotify_client.breaker, 'record', lambda success, duration, probe: outcomes.append(success)
+        )
+        
+        with mock.patch.object(metrics, 'get_redis_connection') as connection:
+            redis = connection.return_value
+            
+            def written():
+                calls = redis.hincrbyfloat.call_args_list + redis.pipeline.return_value.hincrbyfloat.call_args_list
+                totals = {}
+                for call in calls:
+                    totals[call.args[1]] = totals.get(call.args[1], 0) + call.args[2]
+                return totals
+            
+            yield SimpleNamespace(
+                client=SpotifyClient(), request=request, sleeps=sleeps, outcomes=outcomes, written=written
+            )
+    
+    def test_failures_retried_with_exponential_backoff(self, spotify):
+        """Test that 5xx and timeouts are retried after 0.5s then 1s (plus jitter) and counted"""
+        spotify.request.side_effect = [
+            _spotify_response(503), requests.Timeout('read timed out'), _spotify_response(200, {'ok': True})
+        ]
+        
+        assert spotify.client._send('GET', 'https://spotify.test/search', 'search:track') == {'ok': True}
+        
+        assert spotify.client.calls == spotify.request.call_count == 3
+        assert spotify.request.call_args.kwargs['timeout'] == spotify.client.timeout
+        assert spotify.outcomes == [False, False, True]
+        assert len(spotify.sleeps) == 2
+        assert 0.5 <= spotify.sleeps[0] <= 0.75
+        assert 1.0 <= spotify.sleeps[1] <= 1.25
+        written = spotify.written()
+        assert written['spotify_retries_total{endpoint="search:track",reason="server_error"}'] == 1
+        assert written['spotify_retries_total{endpoint="search:track",reason="timeout"}'] == 1
+        assert written['spotify_timeouts_total{endpoint="search:track"}'] == 1
+        assert written['spotify_responses_total{endpoint="search:track",status="timeout"}'] == 1
+    
+    def test_retries_exhausted_raise_last_error(self, spotify):
+        """Test that a call failing every attempt raises its error after max_retries retries"""
+        spotify.request.side_effect = [requests.ConnectionError('refused')] * 3
+        
+        with pytest.raises(requests.ConnectionError):
+            spotify.client._send('GET', 'https://spotify.test/artists', 'artists')
+        
+        assert spotify.client.calls == 3
+        assert len(spotify.sleeps) == 2
+        written = spotify.written()
+        assert written['spotify_retries_total{endpoint="artists",reason="connection"}'] == 2
+        assert 'spotify_timeouts_total{endpoint="artists"}' not in written
+    
+    def test_short_rate_limit_waited_inline(self, spotify):
+        """Test that a 429 within SPOTIFY_MAX_RETRY_AFTER sleeps exactly Retry-After and retries"""
+        spotify.request.side_effect = [
+            _spotify_response(429, headers={'Retry-After': '3'}), _spotify_response(200, {'ok': True})
+        ]
+        
+        assert spotify.client._send('GET', 'https://spotify.test/search', 'search:track') == {'ok': True}
+        
+        assert spotify.sleeps == [3]
+        assert spotify.outcomes == [True, True]
+        written = spotify.written()
+        assert written['spotify_rate_limited_total{endpoint="search:track"}'] == 1
+        assert written['spotify_retries_total{endpoint="search:track",reason="rate_limited"}'] == 1
+        assert written['spotify_retry_after_seconds_bucket le=5'] == 1
+        assert written['spotify_retry_after_seconds_sum'] == 3
+    
+    def test_long_rate_limit_raised_to_caller(self, spotify):
+        """Test that a 429 asking for more than SPOTIFY_MAX_RETRY_AFTER raises without waiting"""
+        spotify.request.side_effect = [_spotify_response(429, headers={'Retry-After': '120'})]
+        
+        with pytest.raises(SpotifyRateLimited) as raised:
+            spotify.client._send('GET', 'https://spotify.test/search', 'search:track')
+        
+        assert raised.value.retry_after == 120
+        assert spotify.client.calls == 1
+        assert spotify.sleeps == []
+        written = spotify.written()
+        assert written['spotify_rate_limited_total{endpoint="search:track"}'] == 1
+        assert written['spotify_retry_after_seconds_bucket le=300'] == 1
+        assert not any(field.startswith('spotify_retries_total') for field in written)
+    
+    def test_rate_limit_on_last_attempt_raised(self, spotify):
+        """Test that short 429s stop being waited out once the retries are spent"""
+        spotify.request.side_effect = [_spotify_response(429, headers={'Retry-After': '1'})] * 3
+        
+        with pytest.raises(SpotifyRateLimited) as raised:
+            spotify.client._send('GET', 'https://spotify.test/search', 'search:track')
+        
+        assert raised.value.retry_after == 1
+        assert spotify.sleeps == [1, 1]
+        assert spotify.written()['spotify_rate_limited_total{endpoint="search:track"}'] == 3
+
+
+class TestCircuitBreaker:
+    
+    def test_open_circuit_fails_fast(self, monkeypatch):
+        """Test that no HTTP call is made while the Spotify circuit is open"""
+        
+        def open_circuit():
+            raise CircuitOpen('spotify', 30)
+        
+        monkeypatch.setattr(spotify_client.breaker, 'allow', open_circuit)
+        monkeypatch.setattr(spotify_client.requests, 'request', pytest.fail)
+        client = spotify_client.SpotifyClient()
+        
+        with pytest.raises(spotify_client.SpotifyUnavailable) as raised:
+            client.search_tracks('top hits')
+        assert raised.value.retry_after == 30
+        assert client.calls == 0
+    
+    @pytest.mark.django_db
+    def test_degraded_refresh_uses_catalog(self, monkeypatch):
+        """Test that only users without a set get a catalog set while Spotify is unavailable"""
+        now = timezone.now()
+        user = User.objects.create_user(
+            email='degraded@example.com', password='x', favorite_genres=['jazz']
+        )
+        CatalogTrack.objects.bulk_create([
+            CatalogTrack(
+                track_id=f'track{index}', track_name=f'Track {index}', artist_name='Artist',
+                spotify_url='https://open.spotify.com/track/x', fetched_at=now,
+                genres=['jazz'] if index < 5 else ['pop'], popularity=index
+            )
+            for index in range(60)
+        ])
+        dirty = []
+        
+        def unavailable(client, user):
+            raise SpotifyUnavailable(30)
+        
+        monkeypatch.setattr(tasks, '_fetch_tracks', unavailable)
+        monkeypatch.setattr(tasks, 'mark_dirty', lambda user_id, delay: dirty.append((user_id, delay)))
+        announced = []
+        monkeypatch.setattr(tasks, 'publish', lambda name, payload: announced.append((name, payload)))
+        
+        result = tasks.fetch_spotify_recommendations.apply(args=[user.id]).get()
+        
+        assert result['status'] == 'degraded'
+        assert result['count'] == 50
+        assert Recommendation.objects.filter(user=user, genres=['jazz']).count() == 5
+        
+        # Retries during the outage keep that set, the staleness sweep owns the user
+        ids = set(Recommendation.objects.filter(user=user).values_list('id', flat=True))
+        result = tasks.fetch_spotify_recommendations.apply(args=[user.id]).get()
+        assert result['status'] == 'kept'
+        assert set(Recommendation.objects.filter(user=user).values_list('id', flat=True)) == ids
+        assert dirty == []
+        
+        # A recent real set is kept too, and queued again for after the outage
+        User.objects.filter(id=user.id).update(recommendations_refreshed_at=now)
+        result = tasks.fetch_spotify_recommendations.apply(args=[user.id]).get()
+        assert result['status'] == 'kept'
+        assert dirty == [(user.id, tasks.OUTAGE_RETRY_DELAY)]
+        
+        # Every refresh told connected clients it was over, only the first brought a set
+        assert {name for name, _ in announced} == {f'refresh_finished:{user.id}'}
+        assert [payload['status'] for _, payload in announced] == ['degraded', 'kept', 'kept']
+        assert 'version' in announced[0][1] and 'version' not in announced[1][1]
+    
+    def test_superseded_refresh_announced(self, monkeypatch):
+        """Test that a refresh skipped for a newer one still tells connected clients it ended"""
+        announced = []
+        monkeypatch.setattr(tasks, 'publish', lambda name, payload: announced.append((name, payload)))
+        cache.add('refresh_inflight_user_3', {'task_id': 'newer', 'queue': 'interactive'})
+        
+        result = tasks.fetch_spotify_recommendations.apply(args=[3], task_id='older').get()
+        
+        assert result['status'] == 'superseded'
+        assert announced == [('refresh_finished:3', {'user_id': 3, 'status': 'superseded'})]
+
+
+class TestBulkRefresh:
+    
+    @pytest.mark.django_db
+    def test_ids_queued_in_chunks(self, monkeypatch):
+        """Test that a bulk refresh by IDs creates a job and queues chunk tasks"""
+        staff = User.objects.create_user(
+            email='bulkstaff@example.com', password='x', is_staff=True
+        )
+        chunks = []
+        monkeypatch.setattr(views, 'create_job', lambda created_by, total=None: 'job1')
+        monkeypatch.setattr(views.refresh_bulk_chunk, 'delay', lambda job_id, ids: chunks.append(ids))
+        client = APIClient()
+        client.force_authenticate(staff)
+        
+        user_ids = list(range(1, bulk.BULK_REFRESH_CHUNK + 11)) + [1]
+        response = client.post(reverse('bulk-refresh'), {'user_ids': user_ids}, format='json')
+        
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['job_id'] == 'job1'
+        assert response.data['total'] == bulk.BULK_REFRESH_CHUNK + 10
+        assert [len(chunk) for chunk in chunks] == [bulk.BULK_REFRESH_CHUNK, 10]
+        assert client.post(reverse('bulk-refresh'), {'user_ids': ['1']}, format='json').status_code == 400
+        for segment in ({'genre': [1]}, {'genre': []}, {'decade': ['90s']}, {}):
+            response = client.post(reverse('bulk-refresh'), {'segment': segment}, format='json')
+            assert response.status_code == 400
+    
+    @pytest.mark.django_db
+    def test_chunk_reports_missing_and_pending_users(self, monkeypatch):
+        """Test that a chunk counts unknown users as failed and passes the job to new refreshes"""
+        users = [
+            User.objects.create_user(email=f'bulk{index}@example.com', password='x')
+            for index in range(2)
+        ]
+        cache.add(f'refresh_inflight_user_{users[1].id}', {'task_id': 'other', 'queue': 'batch'})
+        outcomes = []
+        monkeypatch.setattr(tasks, 'record_outcome', lambda job_id, outcome, count=1: outcomes.append((outcome, count)))
+        
+        with mock.patch('recommendations.scheduling.signature') as sig:
+            result = tasks.refresh_bulk_chunk.apply(args=['job1', [user.id for user in users] + [0]]).get()
+        
+        assert result == {'job_id': 'job1', 'triggered': 1, 'skipped': 1}
+        assert outcomes == [('failed', 1), ('skipped', 1)]
+        assert sig.call_args.kwargs['kwargs'] == {'job_id': 'job1'}
+
+
+class TestBatchRead:
+    
+    def test_cached_sets_served_in_request_order(self, staff_user, monkeypatch):
+        """Test that a batch read answers cached users from the cache, in request order, and caches no empty sets"""
+        monkeypatch.setattr(views, '_latest_sets', lambda user_ids: {user_id: [] for user_id in user_ids})
+        row = {field: None for field in views.RECOMMENDATION_FIELDS}
+        store('recommendations_user_2', [dict(row, track_id='cached')], timeout=60)
+        request = APIRequestFactory().post('/', {'user_ids': [3, 2, 3]}, format='json')
+        force_authenticate(request, staff_user)
+        
+        response = views.BatchRecommendationsView.as_view()(request)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        
+        assert [(line['user_id'], line['count']) for line in lines] == [(3, 0), (2, 1)]
+        assert lines[1]['source'] == 'cache'
+        assert lines[1]['recommendations'][0]['track_id'] == 'cached'
+        assert cache.get('recommendations_user_3') is None
+    
+    @pytest.mark.django_db
+    def test_ties_ranked_like_single_reads(self):
+        """Test that rows sharing created_at are picked and ordered like the single-user read, newest id first"""
+        user = User.objects.create_user(email='ties@example.com', password='x')
+        Recommendation.objects.bulk_create([
+            Recommendation(user=user, track_id=f'track{index}', track_name='Track', artist_name='Artist')
+            for index in range(views.SET_SIZE + 10)
+        ])
+        Recommendation.objects.filter(user=user).update(created_at=timezone.now())
+        single = list(Recommendation.objects.filter(user=user).values_list('id', flat=True)[:views.SET_SIZE])
+        
+        batch = views._latest_sets([user.id])[user.id]
+        
+        assert [row['id'] for row in batch] == single == sorted(single, reverse=True)
+
+
+class TestRecommendationEvents:
+    
+    @pytest.fixture
+    def local_hub(self, monkeypatch):
+        """An event hub fed by the test instead of Redis"""
+        hub = EventHub()
+        
+        def start():
+            hub.ready = asyncio.Event()
+            hub.ready.set()
+        
+        monkeypatch.setattr(hub, '_start', start)
+        monkeypatch.setattr(async_views, 'hub', hub)
+        monkeypatch.setattr(async_views, 'HEARTBEAT_INTERVAL', 0.01)
+        return hub
+    
+    def test_catch_up_then_live_events(self, local_hub):
+        """Test that a refresh finished before subscribing is sent first, then newer ones and other endings"""
+        cache.set('recommendations_version_user_4', 2000)
+        
+        async def consume():
+            stream = async_views._recommendation_events(4, since=1000)
+            catch_up = await stream.__anext__()
+            keepalive = await stream.__anext__()
+            for queue in local_hub.queues['refresh_finished:4']:
+                queue.put_nowait({'user_id': 4, 'status': 'success', 'version': 1500})
+                queue.put_nowait({'user_id': 4, 'status': 'success', 'version': 3000})
+                queue.put_nowait({'user_id': 4, 'status': 'kept'})
+            live = await stream.__anext__()
+            finished = await stream.__anext__()
+            await stream.aclose()
+            return catch_up, keepalive, live, finished
+        
+        catch_up, keepalive, live, finished = asyncio.run(consume())
+        
+        assert catch_up.startswith('id: 2000\nevent: recommendations_ready\n')
+        assert keepalive == ': keepalive\n\n'
+        assert live.startswith('id: 3000\n')
+        assert finished == 'event: refresh_finished\ndata: {"user_id": 4, "status": "kept"}\n\n'
+        assert not local_hub.queues
+    
+    def test_polls_without_redis_subscription(self, monkeypatch):
+        """Test that a stream whose hub cannot subscribe stops waiting and polls the version key"""
+        hub = EventHub()
+        
+        def start():
+            hub.ready = asyncio.Event()
+        
+        monkeypatch.setattr(hub, '_start', start)
+        monkeypatch.setattr(async_views, 'hub', hub)
+        monkeypatch.setattr(async_views, 'HEARTBEAT_INTERVAL', 0.01)
+        monkeypatch.setattr(pubsub, 'READY_TIMEOUT', 0.01)
+        
+        async def consume():
+            stream = async_views._recommendation_events(6, since=0)
+            keepalive = await stream.__anext__()
+            cache.set('recommendations_version_user_6', 2000)
+            ready = await stream.__anext__()
+            await stream.aclose()
+            return keepalive, ready
+        
+        keepalive, ready = asyncio.run(consume())
+        
+        assert keepalive == ': keepalive\n\n'
+        assert ready.startswith('id: 2000\nevent: recommendations_ready\n')
+    
+    def test_no_catch_up_when_up_to_date(self, local_hub):
+        """Test that a client resuming at the current version only gets keepalives"""
+        cache.set('recommendations_version_user_5', 2000)
+        
+        async def first():
+            stream = async_views._recommendation_events(5, since=2000)
+            try:
+                return await stream.__anext__()
+            finally:
+                await stream.aclose()
+        
+        assert asyncio.run(first()) == ': keepalive\n\n'
+        assert not local_hub.queues
+    
+    def test_last_event_id_takes_precedence(self, plain_user, signed_in, monkeypatch):
+        """Test that the stream resumes from Last-Event-ID, then ?since="""
+        streams = []
+        
+        async def events(user_id, since):
+            streams.append((user_id, since))
+            yield ''
+        
+        monkeypatch.setattr(async_views, '_recommendation_events', events)
+        factory = RequestFactory()
+        
+        async def open_stream(request):
+            response = await async_views.recommendation_events(request)
+            async for _ in response.streaming_content:
+                pass
+            return response
+        
+        for request in (
+            factory.get('/?since=10', HTTP_LAST_EVENT_ID='20'),
+            factory.get('/?since=10'),
+            factory.get('/?since=junk'),
+        ):
+            response = asyncio.run(open_stream(request))
+            assert response['Content-Type'] == 'text/event-stream'
+        
+        assert streams == [(plain_user.id, 20), (plain_user.id, 10), (plain_user.id, 0)]
+        assert signed_in == [True] * 3
+
+
+class TestAsyncViews:
+    
+    def test_anonymous_rejected(self):
+        """Test that the async reads require a JWT"""
+        response = asyncio.run(async_views.my_recommendations(RequestFactory().get('/')))
+        
+        assert response.status_code == 401
+    
+    def test_query_token_only_for_event_stream(self, plain_user, monkeypatch):
+        """Test that ?token= is ignored outside the EventSource endpoint"""
+        validated = []
+        
+        def validate(self, raw_token):
+            validated.append(raw_token)
+            return {'user_id': plain_user.id}
+        
+        async def get_user(self, token):
+            return plain_user
+        
+        monkeypatch.setattr(authentication.CachedJWTAuthentication, 'get_validated_token', validate)
+        monkeypatch.setattr(authentication.CachedJWTAuthentication, 'aget_user', get_user)
+        request = RequestFactory().get('/?token=abc')
+        
+        assert asyncio.run(authentication.aauthenticate(request)) is None
+        assert asyncio.run(authentication.aauthenticate(request, query_token=True)) is plain_user
+        assert validated == ['abc']
+    
+    def test_cached_user_read_with_aget(self, monkeypatch):
+        """Test that a cached user is resolved through the async cache API, not the sync fallback"""
+        monkeypatch.setattr(
+            JWTAuthentication, 'get_user', lambda self, token: User(id=5, email='async@example.com')
+        )
+        token = AccessToken.for_user(User(id=5))
+        authentication.CachedJWTAuthentication().get_user(token)
+        monkeypatch.setattr(authentication, 'sync_to_async', pytest.fail)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        
+        user = asyncio.run(authentication.aauthenticate(request))
+        
+        assert user.email == 'async@example.com'
+        assert request.user is user
+    
+    def test_reads_are_throttled(self, plain_user, signed_in, monkeypatch):
+        """Test that the async reads apply the default user rate like the DRF views"""
+        monkeypatch.setattr(SimpleRateThrottle, 'THROTTLE_RATES', {'anon': '2/hour', 'user': '2/hour'})
+        store(f'recommendations_user_{plain_user.id}', [], timeout=60)
+        
+        responses = [
+            asyncio.run(async_views.my_recommendations(RequestFactory().get('/')))
+            for _ in range(3)
+        ]
+        
+        assert [response.status_code for response in responses] == [200, 200, 429]
+        assert 0 < int(responses[2]['Retry-After']) <= 3600
+        assert signed_in == [False] * 3
+    
+    def test_async_gcra_shares_sync_allowance(self, plain_request, monkeypatch):
+        """Test that async views spend the sync views' GCRA allowance, over redis.asyncio"""
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('lupa')
+        server = fakeredis.FakeServer()
+        redis = fakeredis.FakeRedis(server=server)
+        monkeypatch.setattr(throttling, 'get_redis_connection', lambda alias: redis)
+        monkeypatch.setattr(throttling, '_script', None)
+        monkeypatch.setattr(
+            throttling, 'cache', SimpleNamespace(async_client=lambda: fakeredis.FakeAsyncRedis(server=server))
+        )
+        monkeypatch.setattr(SimpleRateThrottle, 'THROTTLE_RATES', {'anon': '2/hour', 'user': '2/hour'})
+        
+        assert UserRateThrottle().allow_request(plain_request, None)
+        assert asyncio.run(throttling.acheck_throttles(plain_request)) is None
+        refused = asyncio.run(throttling.acheck_throttles(plain_request))
+        
+        assert 1795 < refused.wait <= 1800
+        assert not UserRateThrottle().allow_request(plain_request, None)
+    
+    def test_other_users_forbidden(self, plain_user, signed_in):
+        """Test that a non-staff user cannot read someone else's set"""
+        response = asyncio.run(async_views.get_recommendations(RequestFactory().get('/'), plain_user.id + 1))
+        
+        assert response.status_code == 403
+
+
+class TestPercentile:
+    
+    def test_nearest_rank(self):
+        """Test that percentiles are the smallest samples covering their share of the list"""
+        samples = [50, 15, 40, 20, 35]
+        
+        assert [percentile(samples, pct) for pct in (0, 5, 30, 40, 50, 100)] == [15, 15, 20, 20, 35, 50]
+        assert percentile([], 50) is None
+
+
+class TestTaskMetrics:
+    
+    @pytest.fixture
+    def run(self, settings, monkeypatch):
+        """
+        Pass a fake task through the Celery signal handlers on fakeredis, its
+        stages taking the given seconds on a fake clock
+        """
+        fakeredis = pytest.importorskip('fakeredis')
+        redis = fakeredis.FakeRedis()
+        monkeypatch.setattr(task_metrics, 'get_redis_connection', lambda alias: redis)
+        settings.TASK_SLOW_THRESHOLD = 5
+        clock = [0.0]
+        monkeypatch.setattr(task_metrics, 'time', SimpleNamespace(time=time.time, perf_counter=lambda: clock[0]))
+        
+        def run(name, stages=(), state='SUCCESS', lag=None, **tags):
+            task_id = f'{name}-{len(redis.lrange(task_metrics._runs_key(name), 0, -1))}'
+            task = SimpleNamespace(name=name, request=SimpleNamespace(
+                id=task_id, eta=None, delivery_info={'routing_key': 'batch'},
+                enqueued_at=None if lag is None else time.time() - lag
+            ))
+            monkeypatch.setattr(task_metrics, 'current_task', task)
+            task_metrics.record_queue_wait(task_id=task_id, task=task)
+            for stage_name, seconds in stages:
+                with task_metrics.stage(stage_name):
+                    clock[0] += seconds
+            task_metrics.tag(**tags)
+            task_metrics.record_task_run(task_id=task_id, task=task, state=state)
+        
+        return run
+    
+    def test_queue_lag_from_publish_timestamp(self):
+        """Test that lag counts from the publish stamp, or from the ETA of delayed messages"""
+        headers = {}
+        task_metrics.stamp_enqueue_time(headers=headers)
+        stamped = headers['enqueued_at']
+        # Retries are published again, but keep the first stamp
+        task_metrics.stamp_enqueue_time(headers=headers)
+        assert headers['enqueued_at'] == stamped
+        
+        now = time.time()
+        queued = SimpleNamespace(enqueued_at=str(now - 10), eta=None)
+        delayed = SimpleNamespace(enqueued_at=now - 10, eta=datetime.fromtimestamp(now - 4, dt_timezone.utc).isoformat())
+        future = SimpleNamespace(enqueued_at=now - 10, eta=datetime.fromtimestamp(now + 60, dt_timezone.utc))
+        
+        assert task_metrics._queue_wait(queued) == pytest.approx(10, abs=0.5)
+        assert task_metrics._queue_wait(delayed) == pytest.approx(4, abs=0.5)
+        assert task_metrics._queue_wait(future) == 0.0
+        assert task_metrics._queue_wait(SimpleNamespace(eta=None)) is None
+    
+    def test_runs_aggregated_per_task_and_stage(self, run):
+        """Test lag, runtime and stage percentiles per task, with slow runs kept with their tags"""
+        run('refresh', [('fetch', 1), ('fetch', 1), ('save', 0.5)], lag=2)
+        run('refresh', [('fetch', 4)], state='FAILURE', lag=4)
+        run('refresh', [('fetch', 6), ('save', 1)], user_id=9)
+        run('sweep')
+        
+        stats = task_metrics.task_stats()
+        
+        assert list(stats) == ['refresh', 'sweep']
+        refresh = stats['refresh']
+        assert (refresh['runs'], refresh['failures']) == (3, 1)
+        assert refresh['lag']['p50'] == pytest.approx(2, abs=0.5)
+        assert refresh['lag']['p99'] == pytest.approx(4, abs=0.5)
+        assert refresh['runtime'] == {'p50': 4, 'p95': 7, 'p99': 7}
+        # Repeated stages add up within a run, stages missing from a run are not zeros
+        assert refresh['stages'] == {
+            'fetch': {'p50': 4, 'p95': 6, 'p99': 6},
+            'save': {'p50': 0.5, 'p95': 1, 'p99': 1},
+        }
+        assert [(slow['task_id'], slow['user_id']) for slow in refresh['slowest']] == [('refresh-2', 9)]
+        assert stats['sweep']['runs'] == 1
+        assert stats['sweep']['lag'] == {'p50': None, 'p95': None, 'p99': None}
+        assert task_metrics.get_redis_connection('default').llen(task_metrics._wait_key('batch')) == 2
+    
+    def test_stage_outside_task_is_not_recorded(self, run, monkeypatch):
+        """Test that stage() and tag() are no-ops when called outside a worker"""
+        monkeypatch.setattr(task_metrics, 'current_task', None)
+        
+        with task_metrics.stage('load_user'):
+            task_metrics.tag(user_id=1)
+        
+        assert task_metrics.task_stats() == {}
+    
+    def test_task_timings_command(self, run):
+        """Test the task_timings report: a block per task, stage rows and the slow runs"""
+        out = io.StringIO()
+        call_command('task_timings', stdout=out)
+        assert out.getvalue() == 'No task runs recorded yet\n'
+        
+        run('refresh', [('fetch', 1)], lag=2)
+        run('refresh', [('fetch', 6), ('save', 1)], user_id=9)
+        run('sweep')
+        
+        out = io.StringIO()
+        call_command('task_timings', 'refresh', stdout=out, no_color=True)
+        lines = out.getvalue().splitlines()
+        
+        assert lines[0] == 'refresh (2 runs, 0 not successful)'
+        assert lines[1].split() == ['p50', 'p95', 'p99']
+        assert lines[2].split()[:3] == ['queue', 'lag', '2.000s']
+        assert lines[3].split() == ['runtime', '1.000s', '7.000s', '7.000s']
+        assert lines[4].split() == ['fetch', '1.000s', '6.000s', '6.000s']
+        assert lines[5].split() == ['save', '1.000s', '1.000s', '1.000s']
+        assert lines[6] == "  slow refresh-1 SUCCESS runtime=7.00s lag=- {'user_id': 9} [fetch=6.00s, save=1.00s]"
+        assert len(lines) == 7
+
+
+class TestMetrics:
+    
+    def test_request_updates_flushed_once(self, settings, monkeypatch):
+        """Test that a batch sums its updates into one pipeline with one write per sample"""
+        settings.METRICS_ENABLED = True
+        monkeypatch.setattr(metrics, '_registry', {})
+        latency = metrics.Histogram('test_latency_seconds', 'Test latency', ['view'], buckets=(0.1, 1.0))
+        
+        with mock.patch.object(metrics, 'get_redis_connection') as connection:
+            with metrics.batch():
+                latency.observe(0.05, view='me')
+                latency.observe(0.07, view='me')
+                latency.observe(5, view='me')
+        
+        pipe = connection.return_value.pipeline.return_value
+        writes = {call.args[1]: call.args[2] for call in pipe.hincrbyfloat.call_args_list}
+        assert writes == {
+            'test_latency_seconds_bucket{view="me"} le=0.1': 2,
+            'test_latency_seconds_bucket{view="me"} le=+Inf': 1,
+            'test_latency_seconds_sum{view="me"}': 5.12,
+            'test_latency_seconds_count{view="me"}': 3,
+        }
+        assert pipe.execute.call_count == 1
+        
+        fields = {field: str(value) for field, value in writes.items()}
+        assert [line for line in latency.samples(fields) if '_bucket' in line[0]] == [
+            ('test_latency_seconds_bucket{view="me",le="0.1"}', 2.0),
+            ('test_latency_seconds_bucket{view="me",le="1.0"}', 2.0),
+            ('test_latency_seconds_bucket{view="me",le="+Inf"}', 3.0),
+        ]
+    
+    def test_disabled_metrics_not_written(self):
+        """Test that METRICS_ENABLED=False (conftest) also silences metrics outside requests"""
+        
+        with mock.patch.object(metrics, 'get_redis_connection') as connection:
+            SPOTIFY_CALLS_PER_REFRESH.observe(3)
+        
+        assert not connection.called
+    
+    def test_metrics_token_required(self, settings, monkeypatch):
+        """Test that /metrics needs the bearer token when one is configured"""
+        settings.METRICS_TOKEN = 's3cret'
+        monkeypatch.setattr(metrics, 'render', lambda: '')
+        factory = RequestFactory()
+        
+        assert metrics.metrics_view(factory.get('/metrics')).status_code == 403
+        assert metrics.metrics_view(
+            factory.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        ).status_code == 200
@@ -0,0 +1,110 @@
+import pytest
+from django.urls import reverse
+
+from benchmarks.fake_spotify import fake_artist, fake_track, spotify_id
+from recommendations import scheduling, tasks
+from recommendations.models import Recommendation
+from recommendations.spotify_client import SpotifyClient
+
+
+@pytest.fixture
+def no_broker(monkeypatch):
+    """Record enqueued refreshes instead of publishing them"""
+    sent = []
+
+    class Signature:
+        def __init__(self, name, args, kwargs=None):
+            self.args = args
+
+        def apply_async(self, task_id, queue):
+            sent.append((self.args[0], queue))
+
+    monkeypatch.setattr(scheduling, 'signature', Signature)
+    return sent
+
+
+@pytest.fixture
+def offline_spotify(monkeypatch):
+    """Serve SpotifyClient calls from the benchmark's fake catalogue"""
+    monkeypatch.setattr(SpotifyClient, 'search_artist', lambda self, name: spotify_id(f'artist:{name}'))
+    monkeypatch.setattr(
+        SpotifyClient, 'get_popular_tracks_by_artist',
+        lambda self, artist_id, limit=5: [spotify_id(f'{artist_id}:{i}') for i in range(limit)]
+    )
+    monkeypatch.setattr(
+        SpotifyClient, 'get_recommendations',
+        lambda self, limit=20, **kwargs: {'tracks': [fake_track(f'rec:{i}') for i in range(limit)]}
+    )
+    monkeypatch.setattr(
+        SpotifyClient, 'get_artist_genres',
+        lambda self, artist_ids: {artist_id: fake_artist(artist_id)['genres'] for artist_id in artist_ids}
+    )
+    monkeypatch.setattr(tasks, 'publish', lambda name, payload: None)
+
+
+@pytest.mark.performance
+@pytest.mark.django_db
+class TestRecommendationBudgets:
+
+    def test_my_recommendations_miss(self, perf_data, auth_client, budget):
+        """Cold read: auth, last-seen update and one recommendations query"""
+        client = auth_client(perf_data['user'])
+        with budget(queries=4, ms=150):
+            response = client.get(reverse('my-recommendations'))
+        assert response.data['count'] == 50
+
+    def test_my_recommendations_hit(self, perf_data, auth_client, budget):
+        """Cached read with a cached user never reaches Postgres"""
+        client = auth_client(perf_data['user'])
+        client.get(reverse('my-recommendations'))
+        with budget(queries=0, ms=50):
+            response = client.get(reverse('my-recommendations'))
+        assert response.data['source'] == 'cache'
+
+    def test_get_recommendations_by_id(self, perf_data, auth_client, budget):
+        user = perf_data['user']
+        client = auth_client(perf_data['staff'])
+        with budget(queries=4, ms=150):
+            response = client.get(reverse('get-recommendations', kwargs={'user_id': user.id}))
+        assert response.data['count'] == 50
+
+    def test_refresh(self, perf_data, auth_client, budget, no_broker):
+        client = auth_client(perf_data['user'])
+        with budget(queries=4, ms=100):
+            response = client.post(reverse('refresh-my-recommendations'))
+        assert response.status_code in (200, 202)
+
+    def test_fetch_task(self, perf_data, budget, offline_spotify):
+        """A refresh costs a fixed number of queries regardless of history size"""
+        user = perf_data['user']
+        with budget(queries=12, ms=500):
+            result = tasks.fetch_spotify_recommendations.apply(args=[user.id]).get()
+        assert result['status'] == 'success'
+        assert Recommendation.objects.filter(user=user).count() == 100
+        newest = Recommendation.objects.filter(user=user).order_by('-id')[:50]
+        assert all(rec.genres for rec in newest)
+
+    def test_refresh_all_task(self, perf_data, budget, no_broker):
+        """The backfill must not query per user"""
+        with budget(queries=2, ms=200):
+            tasks.refresh_all_users_recommendations.apply().get()
+        assert len(no_broker) == len(perf_data['users']) + 1
+
+    def test_batch_read(self, perf_data, auth_client, budget):
+        """Sets of many users cost one ranked query cold and no queries once cached"""
+        import json
+        client = auth_client(perf_data['staff'])
+        user_ids = [user.id for user in perf_data['users']]
+
+        def read():
+            response = client.post(reverse('batch-recommendations'), {'user_ids': user_ids}, format='json')
+            return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        with budget(queries=3, ms=300):
+            lines = read()
+        assert [line['user_id'] for line in lines] == user_ids
+        assert all(line['count'] == 50 and line['source'] == 'database' for line in lines)
+
+        with budget(queries=0, ms=100):
+            lines = read()
+        assert all(line['source'] == 'cache' for line in lines)
@@ -1,17 +1,42 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RefreshRecommendationsView,
     GetRecommendationsView,
     MyRecommendationsView,
-    RefreshMyRecommendationsView
+    RefreshMyRecommendationsView,
+    BulkRefreshView,
+    BulkRefreshProgressView,
+    BatchRecommendationsView
 )
+from .async_views import (
+    recommendation_events,
+    my_recommendations,
+    get_recommendations
+)
+
+# Read endpoints are served by native async views on ASGI deployments
+if settings.ASYNC_READ_VIEWS:
+    my_recommendations_view = my_recommendations
+    get_recommendations_view = get_recommendations
+else:
+    my_recommendations_view = MyRecommendationsView.as_view()
+    get_recommendations_view = GetRecommendationsView.as_view()
 
 urlpatterns = [
     # Current user endpoints
-    path('me/', MyRecommendationsView.as_view(), name='my-recommendations'),
+    path('me/', my_recommendations_view, name='my-recommendations'),
     path('me/refresh/', RefreshMyRecommendationsView.as_view(), name='refresh-my-recommendations'),
+    path('me/events/', recommendation_events, name='my-recommendation-events'),
+    
+    # Batch reads for downstream services (staff)
+    path('batch/', BatchRecommendationsView.as_view(), name='batch-recommendations'),
+    
+    # Bulk refresh jobs (staff)
+    path('bulk-refresh/', BulkRefreshView.as_view(), name='bulk-refresh'),
+    path('bulk-refresh/<str:job_id>/', BulkRefreshProgressView.as_view(), name='bulk-refresh-progress'),
     
     # Specific user endpoints (admin or self)
     path('<int:user_id>/refresh/', RefreshRecommendationsView.as_view(), name='refresh-recommendations'),
-    path('<int:user_id>/', GetRecommendationsView.as_view(), name='get-recommendations'),
+    path('<int:user_id>/', get_recommendations_view, name='get-recommendations'),
 ]
@@ -1,19 +1,148 @@
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.throttling import UserRateThrottle
-from django.core.cache import cache
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 from .models import Recommendation
-from .serializers import RecommendationSerializer
-from .tasks import fetch_spotify_recommendations
+from .bulk import BULK_REFRESH_MAX_IDS, chunks, create_job, job_progress
+from .tasks import plan_bulk_refresh, refresh_bulk_chunk
+from .serializers import (
+    RECOMMENDATION_FIELDS, recommendation_data, recommendation_values
+)
+from .scheduling import schedule_refresh, FRESH, IN_PROGRESS
+from backend.cache import read_through, read_many, store_many
+from backend.renderers import dumps
+from backend.throttling import UserRateThrottle
+from users.segments import SEGMENT_FIELDS, MATCH_LOOKUPS
 
 User = get_user_model()
 
+# Recommendations per user, as served by the single-user read
+SET_SIZE = 50
+# Most user IDs a batch read accepts, and how many it looks up at a time
+BATCH_READ_MAX_IDS = 10_000
+BATCH_READ_CHUNK = 500
+
 
 class RefreshRateThrottle(UserRateThrottle):
-    rate = '5/hour'
+    """Per-user refresh limit, counted separately from the general user rate"""
+    scope = 'refresh'
+
+
+def _refresh_response(user_id):
+    """Schedule a refresh and describe what happened"""
+    task_id, state = schedule_refresh(user_id)
+    
+    if state == FRESH:
+        return Response({
+            'message': 'Recommendations are already up to date',
+            'task_id': None,
+            'user_id': user_id
+        }, status=status.HTTP_200_OK)
+    
+    message = (
+        'Recommendation refresh already in progress' if state == IN_PROGRESS
+        else 'Recommendation refresh triggered'
+    )
+    return Response({
+        'message': message,
+        'task_id': task_id,
+        'user_id': user_id
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+def _recommendations_payload(user_id, recommendations, hit):
+    """Response body for a user's recommendations, shared with the async views"""
+    if not recommendations:
+        return {
+            'message': 'No recommendations found. Trigger a refresh first.',
+            'user_id': user_id,
+            'count': 0,
+            'recommendations': []
+        }
+    
+    # Entries cached before the switch to values() rows hold model instances
+    if isinstance(recommendations[0], Recommendation):
+        recommendations = recommendation_values(recommendations)
+    
+    return {
+        'user_id': user_id,
+        'source': 'cache' if hit else 'database',
+        'count': len(recommendations),
+        'recommendations': recommendation_data(recommendations)
+    }
+
+
+def _recommendations_response(user_id):
+    """Build the recommendations response, reading through the cache"""
+    cache_key = f'recommendations_user_{user_id}'
+    recommendations, hit = read_through(
+        cache_key,
+        lambda: list(Recommendation.objects.filter(user_id=user_id).values(*RECOMMENDATION_FIELDS)[:SET_SIZE]),
+        timeout=3600
+    )
+    return Response(_recommendations_payload(user_id, recommendations, hit))
+
+
+def _latest_sets(user_ids):
+    """
+    Each user's latest ``SET_SIZE`` recommendations in one query, ranked per
+    user with ``ROW_NUMBER() OVER (PARTITION BY user_id ...)``
+    """
+    sets = {user_id: [] for user_id in user_ids}
+    rows = Recommendation.objects.filter(user_id__in=user_ids).annotate(
+        rank=Window(
+            RowNumber(), partition_by=[F('user_id')],
+            order_by=[F('created_at').desc(), F('id').desc()]
+        )
+    ).filter(rank__lte=SET_SIZE).order_by('user_id', 'rank').values('user_id', *RECOMMENDATION_FIELDS)
+    for row in rows:
+        sets[row.pop('user_id')].append(row)
+    return sets
+
+
+def _batch_lines(user_ids):
+    """NDJSON lines of recommendation payloads, one cache MGET and at most one query per chunk"""
+    for start in range(0, len(user_ids), BATCH_READ_CHUNK):
+        chunk = user_ids[start:start + BATCH_READ_CHUNK]
+        keys = {user_id: f'recommendations_user_{user_id}' for user_id in chunk}
+        cached = read_many(list(keys.values()))
+        
+        missing = [user_id for user_id in chunk if keys[user_id] not in cached]
+        built = _latest_sets(missing) if missing else {}
+        # Empty sets are not cached: the IDs may not exist, and a batch of
+        # unknown IDs would otherwise fill the cache with empty entries
+        found = {keys[user_id]: rows for user_id, rows in built.items() if rows}
+        if found:
+            store_many(found, timeout=3600)
+        
+        for user_id in chunk:
+            hit = keys[user_id] in cached
+            rows = cached[keys[user_id]] if hit else built[user_id]
+            yield dumps(_recommendations_payload(user_id, rows, hit)) + b'\n'
+
+
+def _user_id_list(value, limit):
+    """De-duplicated list of 1 to ``limit`` integer user IDs, or ``None`` if ``value`` is not one"""
+    if not isinstance(value, list) or not all(
+        isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in value
+    ):
+        return None
+    user_ids = list(dict.fromkeys(value))
+    if not 0 < len(user_ids) <= limit:
+        return None
+    return user_ids
+
+
+def _segment_filter(name, values):
+    """Whether ``name: values`` is a segment filter the taste array lookups accept"""
+    return (
+        name in SEGMENT_FIELDS and isinstance(values, list) and values
+        and all(isinstance(value, str) for value in values)
+    )
 
 
 class RefreshRecommendationsView(APIView):
@@ -37,14 +166,7 @@ class RefreshRecommendationsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Trigger async task
-        task = fetch_spotify_recommendations.delay(user_id)
-        
-        return Response({
-            'message': 'Recommendation refresh triggered',
-            'task_id': task.id,
-            'user_id': user_id
-        }, status=status.HTTP_202_ACCEPTED)
+        return _refresh_response(user_id)
 
 
 class GetRecommendationsView(APIView):
@@ -67,41 +189,7 @@ class GetRecommendationsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Try cache first
-        cache_key = f'recommendations_user_{user_id}'
-        cached_recs = cache.get(cache_key)
-        
-        if cached_recs:
-            serializer = RecommendationSerializer(cached_recs, many=True)
-            return Response({
-                'user_id': user_id,
-                'source': 'cache',
-                'count': len(cached_recs),
-                'recommendations': serializer.data
-            })
-        
-        # Fallback to database
-        recommendations = Recommendation.objects.filter(user=user)[:50]
-        
-        if not recommendations.exists():
-            return Response({
-                'message': 'No recommendations found. Trigger a refresh first.',
-                'user_id': user_id,
-                'count': 0,
-                'recommendations': []
-            }, status=status.HTTP_200_OK)
-        
-        serializer = RecommendationSerializer(recommendations, many=True)
-        
-        # Cache for future requests
-        cache.set(cache_key, list(recommendations), timeout=3600)
-        
-        return Response({
-            'user_id': user_id,
-            'source': 'database',
-            'count': recommendations.count(),
-            'recommendations': serializer.data
-        })
+        return _recommendations_response(user.id)
 
 
 class MyRecommendationsView(APIView):
@@ -111,41 +199,7 @@ class MyRecommendationsView(APIView):
     def get(self, request):
         user_id = request.user.id
         
-        # Try cache first
-        cache_key = f'recommendations_user_{user_id}'
-        cached_recs = cache.get(cache_key)
-        
-        if cached_recs:
-            serializer = RecommendationSerializer(cached_recs, many=True)
-            return Response({
-                'user_id': user_id,
-                'source': 'cache',
-                'count': len(cached_recs),
-                'recommendations': serializer.data
-            })
-        
-        # Fallback to database
-        recommendations = Recommendation.objects.filter(user=request.user)[:50]
-        
-        if not recommendations.exists():
-            return Response({
-                'message': 'No recommendations found. Trigger a refresh first.',
-                'user_id': user_id,
-                'count': 0,
-                'recommendations': []
-            }, status=status.HTTP_200_OK)
-        
-        serializer = RecommendationSerializer(recommendations, many=True)
-        
-        # Cache for future requests
-        cache.set(cache_key, list(recommendations), timeout=3600)
-        
-        return Response({
-            'user_id': user_id,
-            'source': 'database',
-            'count': recommendations.count(),
-            'recommendations': serializer.data
-        })
+        return _recommendations_response(user_id)
 
 
 class RefreshMyRecommendationsView(APIView):
@@ -156,11 +210,105 @@ class RefreshMyRecommendationsView(APIView):
     def post(self, request):
         user_id = request.user.id
         
-        # Trigger async task
-        task = fetch_spotify_recommendations.delay(user_id)
+        return _refresh_response(user_id)
+
+
+class BulkRefreshView(APIView):
+    """
+    POST /recommendations/bulk-refresh/ - Refresh many users at once (staff only)
+    
+    The body names the users either as ``{"user_ids": [...]}`` or as an
+    audience segment, ``{"segment": {"genre": ["pop"]}, "match": "any"}`` (see
+    ``/api/users/segments/``). Refreshes are queued in chunks on the batch
+    lane; the returned ``job_id`` is polled at ``bulk-refresh/{job_id}/``.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request):
+        user_ids = request.data.get('user_ids')
+        segment = request.data.get('segment')
+        if (user_ids is None) == (segment is None):
+            return Response(
+                {'error': 'Provide either user_ids or segment'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if user_ids is not None:
+            user_ids = _user_id_list(user_ids, BULK_REFRESH_MAX_IDS)
+            if user_ids is None:
+                return Response(
+                    {'error': f'user_ids must be a list of 1 to {BULK_REFRESH_MAX_IDS} integers'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            job_id = create_job(request.user.id, total=len(user_ids))
+            for chunk in chunks(user_ids):
+                refresh_bulk_chunk.delay(job_id, chunk)
+            total = len(user_ids)
+        else:
+            match = request.data.get('match', 'any')
+            if (
+                not isinstance(segment, dict) or not segment
+                or not all(_segment_filter(name, values) for name, values in segment.items())
+                or match not in MATCH_LOOKUPS
+            ):
+                return Response(
+                    {'error': (
+                        'segment maps ' + ', '.join(SEGMENT_FIELDS) + ' to non-empty lists of strings, '
+                        'match is one of: ' + ', '.join(MATCH_LOOKUPS)
+                    )},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            job_id = create_job(request.user.id)
+            plan_bulk_refresh.delay(job_id, segment, match)
+            total = None
         
         return Response({
-            'message': 'Recommendation refresh triggered',
-            'task_id': task.id,
-            'user_id': user_id
+            'message': 'Bulk recommendation refresh triggered',
+            'job_id': job_id,
+            'total': total
         }, status=status.HTTP_202_ACCEPTED)
+
+
+class BulkRefreshProgressView(APIView):
+    """
+    GET /recommendations/bulk-refresh/{job_id}/ - Progress of a bulk refresh
+    (staff only): done/failed/skipped/pending user counts
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, job_id):
+        progress = job_progress(job_id)
+        if progress is None:
+            return Response(
+                {'error': 'Refresh job not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        return Response(progress)
+
+
+class BatchRecommendationsView(APIView):
+    """
+    POST /recommendations/batch/ - Recommendations of many users at once
+    (staff and service accounts)
+    
+    The body is ``{"user_ids": [...]}``. The response is NDJSON with one line
+    per user, in request order, shaped like ``GET /recommendations/{user_id}/``.
+    Cached sets are read with one ``MGET`` per chunk of IDs and the rest with
+    a single query, which also fills the cache. Unknown users get an empty set.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def post(self, request):
+        user_ids = _user_id_list(request.data.get('user_ids'), BATCH_READ_MAX_IDS)
+        if user_ids is None:
+            return Response(
+                {'error': f'user_ids must be a list of 1 to {BATCH_READ_MAX_IDS} integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        response = StreamingHttpResponse(_batch_lines(user_ids), content_type='application/x-ndjson')
+        response['X-Accel-Buffering'] = 'no'
+        return response
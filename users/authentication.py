@@ -0,0 +1,102 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+# Left out of cached users, loaded from the database if a request needs them
+UNCACHED_USER_FIELDS = ('password',)
+
+
+def user_cache_key(user_id):
+    return f'auth_user_{user_id}'
+
+
+def _user_fields(user):
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields
+        if field.attname not in UNCACHED_USER_FIELDS
+    }
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps resolved users in the cache for
+    ``AUTH_USER_CACHE_TIMEOUT`` seconds, so most requests skip the ``users``
+    lookup. ``users.signals`` drops the entry whenever the user is saved or
+    deleted (profile updates, deactivation, password changes, logins).
+    
+    The cache holds field values, not the instance: every request gets its own
+    ``User``, so views changing ``request.user`` cannot leak unsaved values
+    into other requests, and the password hash is never cached.
+    """
+    
+    def _cached_user(self, fields):
+        if not isinstance(fields, dict):
+            # Missing, or a whole instance cached by an earlier release
+            return None
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model), list(fields), list(fields.values())
+        )
+    
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = self._cached_user(cache.get(user_cache_key(user_id)))
+            if user is not None:
+                return user
+        
+        # Raises for unknown and inactive users, which are never cached
+        user = super().get_user(validated_token)
+        cache.set(user_cache_key(user_id), _user_fields(user), timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+    
+    async def aget_user(self, validated_token):
+        """``get_user`` for async views: the cache is read without leaving the event loop"""
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is not None:
+            user = self._cached_user(await cache.aget(user_cache_key(user_id)))
+            if user is not None:
+                return user
+        
+        user = await sync_to_async(super().get_user)(validated_token)
+        await cache.aset(user_cache_key(user_id), _user_fields(user), timeout=settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
+
+
+def _validated_token(authentication, request, query_token):
+    """
+    The JWT of ``request`` from the Authorization header or, with
+    ``query_token`` for clients such as EventSource that cannot set headers,
+    the ``token`` query parameter. Other views ignore it so tokens stay out of
+    access logs. ``None`` without a token, raises ``AuthenticationFailed``
+    for invalid ones
+    """
+    raw_token = request.GET.get('token') if query_token else None
+    if not raw_token:
+        header = authentication.get_header(request)
+        if header is None:
+            return None
+        raw_token = authentication.get_raw_token(header)
+        if raw_token is None:
+            return None
+    return authentication.get_validated_token(raw_token)
+
+
+async def aauthenticate(request, query_token=False):
+    """Authenticate a plain (non-DRF) async view request, ``None`` if anonymous"""
+    authentication = CachedJWTAuthentication()
+    try:
+        validated_token = _validated_token(authentication, request, query_token)
+        if validated_token is None:
+            return None
+        user = await authentication.aget_user(validated_token)
+    except AuthenticationFailed:
+        return None
+    # Like DRF, expose the user to middleware running after the view
+    request.user = user
+    return user
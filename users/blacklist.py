@@ -0,0 +1,222 @@
+"""
+Redis Bloom filter in front of the simplejwt token blacklist.
+
+Every rotated refresh token is blacklisted, so the blacklist grows with
+refresh traffic and each refresh would otherwise query it. The filter is a
+Redis bitmap holding the jti of every blacklisted, unexpired token: when it
+says a jti is absent, the token is definitely not blacklisted and the
+database is skipped. Possible members (including false positives) still get
+the usual ``BlacklistedToken`` query, so the filter can only save queries,
+never let a blacklisted token through.
+
+New blacklist rows are added by a ``post_save`` receiver (``users.signals``).
+Bloom filters cannot forget, so ``rebuild()`` recreates the bitmap from the
+table after expired tokens are pruned (``users.tasks``). Until the first
+rebuild, or while Redis is unreachable, every check goes to the database.
+
+A jti whose add fails is kept in this process and retried before the next
+check or add, and the process sends its own checks to the database until
+the retry succeeds. Should the process exit first, the hourly ``resync()``
+re-adds every recent blacklisting from the table.
+"""
+import hashlib
+import logging
+import math
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .metrics import TOKEN_BLACKLIST_CHECKS
+
+logger = logging.getLogger(__name__)
+
+# jtis written to Redis per pipeline while rebuilding
+REBUILD_BATCH = 5000
+# Blacklistings this recent are re-added after a rebuild swaps bitmaps,
+# covering rows created while it ran (and clock skew between hosts)
+REBUILD_OVERLAP = timedelta(minutes=5)
+# Blacklistings this recent are re-added by the hourly resync
+RESYNC_WINDOW = timedelta(hours=2)
+
+# jtis this process failed to add, retried before the next check or add
+_unsynced = set()
+_unsynced_lock = threading.Lock()
+
+
+def _prefix():
+    return settings.CACHES['default'].get('KEY_PREFIX', '')
+
+
+def _filter_key():
+    return f"{_prefix()}:token_blacklist:bloom"
+
+
+def _building_key():
+    return f"{_prefix()}:token_blacklist:bloom:building"
+
+
+def _ready_key():
+    return f"{_prefix()}:token_blacklist:bloom:ready"
+
+
+def filter_size():
+    """``(bits, hashes)`` for the configured capacity and false positive rate"""
+    config = settings.TOKEN_BLACKLIST_FILTER
+    capacity, error_rate = config['CAPACITY'], config['ERROR_RATE']
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    hashes = max(1, round(bits / capacity * math.log(2)))
+    return bits, hashes
+
+
+def _offsets(jti, bits, hashes):
+    # Double hashing: k positions from two 64-bit halves of one digest
+    digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], 'big')
+    second = int.from_bytes(digest[8:], 'big') | 1
+    return [(first + index * second) % bits for index in range(hashes)]
+
+
+def _set_bits(pipe, key, jtis, bits, hashes):
+    for jti in jtis:
+        for offset in _offsets(jti, bits, hashes):
+            pipe.setbit(key, offset, 1)
+
+
+def is_ready():
+    return bool(get_redis_connection('default').exists(_ready_key()))
+
+
+def _retry_unsynced():
+    """Add jtis whose add failed earlier, ``True`` once none are left"""
+    with _unsynced_lock:
+        pending = list(_unsynced)
+    if not pending:
+        return True
+    bits, hashes = filter_size()
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        _set_bits(pipe, _filter_key(), pending, bits, hashes)
+        pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Token blacklist filter still missing {len(pending)} tokens: {exc}")
+        return False
+    with _unsynced_lock:
+        _unsynced.difference_update(pending)
+        return not _unsynced
+
+
+def might_be_blacklisted(jti):
+    """``False`` only when the jti is definitely not on the blacklist"""
+    if not _retry_unsynced():
+        return True
+    bits, hashes = filter_size()
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.exists(_ready_key())
+        for offset in _offsets(jti, bits, hashes):
+            pipe.getbit(_filter_key(), offset)
+        ready, *found = pipe.execute()
+    except Exception as exc:
+        logger.warning(f"Token blacklist filter unavailable: {exc}")
+        return True
+    return not ready or all(found)
+
+
+def add(jtis):
+    """Add newly blacklisted jtis to the filter"""
+    _retry_unsynced()
+    bits, hashes = filter_size()
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        _set_bits(pipe, _filter_key(), jtis, bits, hashes)
+        pipe.execute()
+    except Exception as exc:
+        # A missed add would let a blacklisted token through, so stop trusting
+        # the filter until the next rebuild, and keep the jtis for a retry in
+        # case Redis cannot even be told that
+        logger.warning(f"Could not add to token blacklist filter, disabling it: {exc}")
+        with _unsynced_lock:
+            _unsynced.update(jtis)
+        try:
+            get_redis_connection('default').delete(_ready_key())
+        except Exception:
+            logger.exception("Could not disable the token blacklist filter")
+
+
+def rebuild():
+    """Recreate the filter from unexpired blacklist rows, returns the jti count"""
+    bits, hashes = filter_size()
+    redis = get_redis_connection('default')
+    started = timezone.now()
+    jtis = (
+        BlacklistedToken.objects
+        .filter(token__expires_at__gt=started)
+        .values_list('token__jti', flat=True)
+    )
+
+    redis.delete(_building_key())
+    # Allocate the whole bitmap up front rather than growing it bit by bit
+    redis.setbit(_building_key(), bits - 1, 0)
+    count = 0
+    batch = []
+    for jti in jtis.iterator(chunk_size=REBUILD_BATCH):
+        batch.append(jti)
+        if len(batch) == REBUILD_BATCH:
+            pipe = redis.pipeline(transaction=False)
+            _set_bits(pipe, _building_key(), batch, bits, hashes)
+            pipe.execute()
+            count += len(batch)
+            batch = []
+    if batch:
+        pipe = redis.pipeline(transaction=False)
+        _set_bits(pipe, _building_key(), batch, bits, hashes)
+        pipe.execute()
+        count += len(batch)
+
+    # Rows blacklisted during the scan only reached the previous bitmap, so
+    # checks go to the database until they are copied over
+    pipe = redis.pipeline()
+    pipe.delete(_ready_key())
+    pipe.rename(_building_key(), _filter_key())
+    pipe.execute()
+    pipe = redis.pipeline(transaction=False)
+    _set_bits(pipe, _filter_key(), jtis.filter(blacklisted_at__gte=started - REBUILD_OVERLAP), bits, hashes)
+    pipe.set(_ready_key(), 1)
+    pipe.execute()
+    return count
+
+
+def resync(window=RESYNC_WINDOW):
+    """Re-add tokens blacklisted within ``window``, returns how many"""
+    bits, hashes = filter_size()
+    jtis = list(
+        BlacklistedToken.objects
+        .filter(blacklisted_at__gte=timezone.now() - window)
+        .values_list('token__jti', flat=True)
+    )
+    pipe = get_redis_connection('default').pipeline(transaction=False)
+    _set_bits(pipe, _filter_key(), jtis, bits, hashes)
+    pipe.execute()
+    return len(jtis)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken checking the Bloom filter before the blacklist table"""
+
+    def check_blacklist(self):
+        if not might_be_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            TOKEN_BLACKLIST_CHECKS.inc(result='filtered')
+            return
+        try:
+            super().check_blacklist()
+        except TokenError:
+            TOKEN_BLACKLIST_CHECKS.inc(result='blacklisted')
+            raise
+        TOKEN_BLACKLIST_CHECKS.inc(result='database')
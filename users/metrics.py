@@ -0,0 +1,5 @@
+from backend.metrics import Counter
+
+TOKEN_BLACKLIST_CHECKS = Counter(
+    'token_blacklist_checks', 'Refresh token blacklist checks by outcome', ['result']
+)
@@ -0,0 +1,72 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+
+User = get_user_model()
+
+# Seconds between last_seen_at writes for the same user
+LAST_SEEN_INTERVAL = 3600
+
+
+def _seen_key(user):
+    return f'last_seen_user_{user.id}'
+
+
+def _is_authenticated(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated
+
+
+async def _aauthenticated_user(request):
+    """
+    The authenticated user of an async request, or ``None``. The session user
+    AuthenticationMiddleware leaves on ``request.user`` is resolved with
+    ``request.auser()``, evaluating it here would query from the event loop
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and hasattr(request, 'auser'):
+        user = await request.auser()
+    if user is None or not user.is_authenticated:
+        return None
+    return user
+
+
+class LastSeenMiddleware:
+    """
+    Record when each user was last active, for refresh scheduling.
+    
+    DRF authenticates inside the view and copies the user back onto the
+    Django request, so the user is only known once the response is ready.
+    Only the first request per interval pays for the UPDATE.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        response = self.get_response(request)
+        
+        if _is_authenticated(request):
+            if cache.add(_seen_key(request.user), 1, timeout=LAST_SEEN_INTERVAL):
+                User.objects.filter(id=request.user.id).update(last_seen_at=timezone.now())
+        
+        return response
+    
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        
+        user = await _aauthenticated_user(request)
+        if user is not None:
+            if await cache.aadd(_seen_key(user), 1, timeout=LAST_SEEN_INTERVAL):
+                await User.objects.filter(id=user.id).aupdate(last_seen_at=timezone.now())
+        
+        return response
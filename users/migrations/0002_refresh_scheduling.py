@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, help_text='Last authenticated request, updated at most hourly', null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recommendations_refreshed_at',
+            field=models.DateTimeField(blank=True, help_text='When the current recommendation set was generated', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['last_seen_at'], name='users_last_se_547346_idx'),
+        ),
+    ]
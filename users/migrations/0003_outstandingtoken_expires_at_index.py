@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('users', '0002_refresh_scheduling'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    # simplejwt does not index expires_at, which prune_expired_tokens
+    # filters on in every batch
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS token_blacklist_outstandingtoken_expires_at_idx '
+            'ON token_blacklist_outstandingtoken (expires_at)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS token_blacklist_outstandingtoken_expires_at_idx',
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 
 
 class UserManager(BaseUserManager):
@@ -53,6 +54,18 @@ class User(AbstractUser):
         help_text="User mood preferences (energetic, calm, happy, etc.)"
     )
     
+    # Refresh scheduling
+    last_seen_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last authenticated request, updated at most hourly"
+    )
+    recommendations_refreshed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the current recommendation set was generated"
+    )
+    
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name']
     
@@ -61,6 +74,13 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-date_joined']
+        indexes = [
+            models.Index(fields=['last_seen_at']),
+            # Audience segments filter these with && (overlap) and @> (contains)
+            GinIndex(fields=['favorite_genres'], name='users_fav_genres_gin'),
+            GinIndex(fields=['favorite_artists'], name='users_fav_artists_gin'),
+            GinIndex(fields=['moods'], name='users_moods_gin'),
+        ]
     
     def __str__(self):
         return self.email
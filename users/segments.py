@@ -0,0 +1,55 @@
+"""
+Audience segments: users selected by their favorite artists, genres or moods.
+
+Each taste array has a GIN index, so ``any`` (array overlap, ``&&``) and
+``all`` (containment, ``@>``) matches are index scans. IDs are read in
+keyset order (``id > last ORDER BY id``), so every batch costs the same
+however deep into a large segment it is, and a consumer can resume from
+the last ID it saw.
+"""
+from django.contrib.auth import get_user_model
+
+User = get_user_model()
+
+# Taste array fields by segment filter name
+SEGMENT_FIELDS = {
+    'artist': 'favorite_artists',
+    'genre': 'favorite_genres',
+    'mood': 'moods',
+}
+MATCH_LOOKUPS = {'any': 'overlap', 'all': 'contains'}
+
+# User IDs fetched per keyset query
+SEGMENT_BATCH = 1000
+
+
+def segment_queryset(filters, match='any', active_only=True):
+    """
+    Users matching every given filter, e.g. ``{'genre': ['pop', 'k-pop']}``.
+    Within a filter, ``match`` is ``any`` (overlap) or ``all`` (contains)
+    """
+    lookup = MATCH_LOOKUPS[match]
+    queryset = User.objects.all()
+    if active_only:
+        queryset = queryset.filter(is_active=True)
+    for name, values in filters.items():
+        queryset = queryset.filter(**{f'{SEGMENT_FIELDS[name]}__{lookup}': list(values)})
+    return queryset
+
+
+def segment_batches(queryset, after=0, batch_size=SEGMENT_BATCH, limit=None):
+    """Yield lists of matching user IDs in ascending order, after ``after``"""
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        ids = list(
+            queryset.filter(id__gt=after).order_by('id').values_list('id', flat=True)[:size]
+        )
+        if not ids:
+            return
+        yield ids
+        if len(ids) < size:
+            return
+        after = ids[-1]
+        if remaining is not None:
+            remaining -= len(ids)
@@ -1,6 +1,8 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from .blacklist import FilteredRefreshToken
 from .models import UserProfile
 
 User = get_user_model()
@@ -71,3 +73,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
         elif not instance and UserProfile.objects.filter(email=value).exists():
             raise serializers.ValidationError("This email is already in use.")
         return value
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh consulting the blacklist Bloom filter before the table"""
+    token_class = FilteredRefreshToken
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import blacklist
+from .authentication import user_cache_key
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the authentication cache entry of a changed user.
+    
+    Queryset ``update()`` calls bypass this, e.g. the hourly last_seen_at
+    write, which is fine for fields requests do not read from
+    ``request.user``. Deactivate users with ``save()``.
+    """
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_to_blacklist_filter(sender, instance, created, **kwargs):
+    if created:
+        blacklist.add([instance.token.jti])
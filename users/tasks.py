@@ -0,0 +1,54 @@
+from celery import shared_task
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+from . import blacklist
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Expired tokens deleted per statement, keeping each DELETE short
+PRUNE_BATCH = 5000
+
+
+@shared_task
+def prune_expired_tokens():
+    """
+    Periodic task deleting expired outstanding tokens and their blacklist rows
+    in batches, then rebuilding the blacklist filter without them
+    """
+    now = aware_utcnow()
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects
+            .filter(expires_at__lte=now)
+            .values_list('id', flat=True)[:PRUNE_BATCH]
+        )
+        if not ids:
+            break
+        BlacklistedToken.objects.filter(token_id__in=ids).delete()
+        # only() keeps the token text out of the deletion collector
+        OutstandingToken.objects.filter(id__in=ids).only('id').delete()
+        deleted += len(ids)
+    
+    logger.info(f"Pruned {deleted} expired tokens")
+    rebuild_blacklist_filter.delay()
+    
+    return {'deleted': deleted}
+
+
+@shared_task
+def rebuild_blacklist_filter(if_missing=False):
+    """
+    Rebuild the blacklist Bloom filter from the table. With ``if_missing``,
+    only when it is not ready (first deploy, Redis flushed, failed add), and
+    otherwise re-add recent blacklistings an unrecorded failed add may have missed
+    """
+    if if_missing and blacklist.is_ready():
+        resynced = blacklist.resync()
+        return {'rebuilt': False, 'resynced': resynced}
+    
+    count = blacklist.rebuild()
+    logger.info(f"Rebuilt the token blacklist filter with {count} tokens")
+    
+    return {'rebuilt': True, 'tokens': count}
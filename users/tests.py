@@ -1,8 +1,19 @@
+import asyncio
+from unittest import mock
+
 import pytest
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.contrib.auth import get_user_model
+from users import middleware, views
+from users.authentication import CachedJWTAuthentication, user_cache_key
+from users.middleware import LastSeenMiddleware
 
 User = get_user_model()
 
@@ -76,3 +87,307 @@ class TestUserAuthentication:
         
         assert response.status_code == status.HTTP_200_OK
         assert response.data['email'] == 'test@example.com'
+    
+    def test_cached_user_invalidated(self, monkeypatch):
+        """Test that updates and deactivation reach JWT-authenticated requests"""
+        from rest_framework_simplejwt.tokens import AccessToken
+        from users import views
+        monkeypatch.setattr(views, 'mark_dirty', lambda *args, **kwargs: None)
+        user = User.objects.create_user(email='test@example.com', password='TestPass123!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        url = reverse('current-user')
+        
+        self.client.patch(url, {'moods': ['calm']}, format='json')
+        assert self.client.get(url).data['moods'] == ['calm']
+        
+        user.refresh_from_db()
+        user.is_active = False
+        user.save()
+        assert self.client.get(url).status_code == status.HTTP_401_UNAUTHORIZED
+    
+    def test_rotated_refresh_token_rejected(self):
+        """Test that a refresh token cannot be reused after rotation"""
+        from rest_framework_simplejwt.tokens import RefreshToken
+        user = User.objects.create_user(email='test@example.com', password='TestPass123!')
+        refresh = str(RefreshToken.for_user(user))
+        url = reverse('token_refresh')
+        
+        first = self.client.post(url, {'refresh': refresh}, format='json')
+        second = self.client.post(url, {'refresh': refresh}, format='json')
+        
+        assert first.status_code == status.HTTP_200_OK
+        assert second.status_code == status.HTTP_401_UNAUTHORIZED
+    
+    def test_prune_expired_tokens(self, monkeypatch):
+        """Test that only expired outstanding and blacklisted tokens are pruned"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+        from users import tasks
+        monkeypatch.setattr(tasks.rebuild_blacklist_filter, 'delay', lambda: None)
+        now = timezone.now()
+        expired = OutstandingToken.objects.create(jti='old', token='x', expires_at=now - timedelta(days=1))
+        current = OutstandingToken.objects.create(jti='new', token='y', expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=expired)
+        BlacklistedToken.objects.create(token=current)
+        
+        assert tasks.prune_expired_tokens() == {'deleted': 1}
+        assert list(OutstandingToken.objects.values_list('jti', flat=True)) == ['new']
+        assert BlacklistedToken.objects.count() == 1
+    
+    def test_segments(self):
+        """Test that segments stream matching user IDs to staff only"""
+        import json
+        from rest_framework_simplejwt.tokens import AccessToken
+        staff = User.objects.create_user(email='staff@example.com', password='x', is_staff=True)
+        pop = User.objects.create_user(email='pop@example.com', password='x', favorite_genres=['pop'])
+        both = User.objects.create_user(email='both@example.com', password='x', favorite_genres=['pop', 'rock'])
+        url = reverse('user-segments')
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(pop)}')
+        assert self.client.get(url, {'genre': 'pop'}).status_code == status.HTTP_403_FORBIDDEN
+        
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(staff)}')
+        assert self.client.get(url).status_code == status.HTTP_400_BAD_REQUEST
+        response = self.client.get(url, {'genre': ['pop', 'rock'], 'match': 'all'})
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        assert lines == [{'user_ids': [both.id], 'next': both.id}]
+
+
+class TestCachedUser:
+    
+    def test_request_changes_do_not_leak(self, monkeypatch):
+        """Test that every request gets its own user and the password hash stays out of the cache"""
+        monkeypatch.setattr(
+            JWTAuthentication, 'get_user',
+            lambda self, token: User(id=5, email='cached@example.com', password='hash', moods=['calm'])
+        )
+        authentication = CachedJWTAuthentication()
+        token = {'user_id': 5}
+        authentication.get_user(token)
+        
+        # A request changing its user in place, then failing to save it
+        changed = authentication.get_user(token)
+        changed.moods.append('sad')
+        changed.is_staff = True
+        following = authentication.get_user(token)
+        
+        assert following is not changed
+        assert following.moods == ['calm']
+        assert not following.is_staff
+        assert following.get_deferred_fields() == {'password'}
+        assert 'password' not in cache.get(user_cache_key(5))
+
+
+class TestLastSeenMiddleware:
+    
+    @pytest.fixture
+    def seen(self, monkeypatch):
+        """Stands in for ``User`` in the middleware, recording last_seen_at updates"""
+        model = mock.MagicMock()
+        model.objects.filter.return_value.aupdate = mock.AsyncMock()
+        monkeypatch.setattr(middleware, 'User', model)
+        return model.objects.filter
+    
+    def test_async_session_user_resolved_with_auser(self, seen):
+        """Test that async requests await request.auser() instead of evaluating the lazy session user"""
+        request = RequestFactory().get('/')
+        request.user = SimpleLazyObject(lambda: pytest.fail('session user evaluated in the event loop'))
+        
+        async def auser():
+            return User(id=7)
+        
+        async def view(request):
+            return HttpResponse()
+        
+        request.auser = auser
+        asyncio.run(LastSeenMiddleware(view)(request))
+        
+        seen.assert_called_once_with(id=7)
+    
+    def test_one_update_per_interval(self, seen):
+        """Test that only the first request per user and interval writes last_seen_at"""
+        def view(request):
+            # DRF authenticates inside the view
+            request.user = User(id=8)
+            return HttpResponse()
+        
+        last_seen = LastSeenMiddleware(view)
+        for _ in range(3):
+            last_seen(RequestFactory().get('/'))
+        seen.assert_called_once_with(id=8)
+        
+        # The next interval starts once the marker expires
+        cache.delete('last_seen_user_8')
+        last_seen(RequestFactory().get('/'))
+        assert seen.call_count == 2
+    
+    def test_async_one_update_per_interval(self, seen):
+        """Test that async requests share the per-interval marker"""
+        async def view(request):
+            request.user = User(id=9)
+            return HttpResponse()
+        
+        async def requests():
+            last_seen = LastSeenMiddleware(view)
+            for _ in range(3):
+                await last_seen(RequestFactory().get('/'))
+        
+        asyncio.run(requests())
+        
+        seen.assert_called_once_with(id=9)
+        assert seen.return_value.aupdate.await_count == 1
+    
+    def test_anonymous_requests_not_recorded(self, seen):
+        """Test that requests without a user never touch the table"""
+        LastSeenMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        
+        assert not seen.called
+
+
+@pytest.mark.django_db
+class TestPreferenceUpdates:
+    
+    @pytest.fixture
+    def dirty(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(views, 'mark_dirty', lambda user_id, **kwargs: calls.append((user_id, kwargs)))
+        return calls
+    
+    def test_changed_preferences_schedule_refresh(self, dirty):
+        """Test that new preferences make the user due for a refresh within a minute"""
+        user = User.objects.create_user(email='prefs@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(user=user)
+        
+        client.patch(reverse('current-user'), {'first_name': 'Renamed'}, format='json')
+        assert dirty == []
+        
+        response = client.patch(reverse('current-user'), {'favorite_genres': ['jazz']}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert dirty == [(user.id, {'delay': 60})]
+
+
+class BitmapRedis:
+    """Just enough of a Redis client for the blacklist filter, which can be taken down"""
+    
+    def __init__(self):
+        self.data = {}
+        self.down = False
+    
+    def _check(self):
+        if self.down:
+            raise ConnectionError('Redis is down')
+    
+    def exists(self, key):
+        self._check()
+        return int(key in self.data)
+    
+    def set(self, key, value):
+        self._check()
+        self.data[key] = value
+    
+    def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def rename(self, source, target):
+        self._check()
+        self.data[target] = self.data.pop(source)
+    
+    def setbit(self, key, offset, value):
+        self._check()
+        bits = self.data.setdefault(key, set())
+        (bits.add if value else bits.discard)(offset)
+    
+    def getbit(self, key, offset):
+        self._check()
+        return int(offset in self.data.get(key, ()))
+    
+    def pipeline(self, transaction=True):
+        return BitmapPipeline(self)
+
+
+class BitmapPipeline:
+    
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+    
+    def __getattr__(self, name):
+        def queue(*args):
+            self.calls.append((name, args))
+        return queue
+    
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+
+class TestBlacklistFilter:
+    
+    @pytest.fixture
+    def redis(self, settings, monkeypatch):
+        from users import blacklist
+        settings.TOKEN_BLACKLIST_FILTER = {'CAPACITY': 1000, 'ERROR_RATE': 0.001}
+        redis = BitmapRedis()
+        monkeypatch.setattr(blacklist, 'get_redis_connection', lambda alias: redis)
+        monkeypatch.setattr(blacklist, '_unsynced', set())
+        return redis
+    
+    def test_absent_only_when_ready(self, redis):
+        """Test that the filter answers "absent" only once built, and never for added jtis"""
+        from users import blacklist
+        blacklist.add(['revoked'])
+        
+        assert blacklist.might_be_blacklisted('fresh')
+        redis.set(blacklist._ready_key(), 1)
+        assert blacklist.might_be_blacklisted('revoked')
+        assert not blacklist.might_be_blacklisted('fresh')
+    
+    def test_failed_add_kept_until_retried(self, redis):
+        """Test that a jti lost to a Redis outage is re-added before the filter is trusted again"""
+        from users import blacklist
+        redis.set(blacklist._ready_key(), 1)
+        
+        redis.down = True
+        blacklist.add(['revoked'])
+        redis.down = False
+        
+        # The outage also kept the filter from being marked unready
+        assert redis.exists(blacklist._ready_key())
+        assert blacklist.might_be_blacklisted('revoked')
+        assert not blacklist._unsynced
+        assert not blacklist.might_be_blacklisted('fresh')
+    
+    def test_checks_go_to_database_while_retry_fails(self, redis):
+        """Test that pending jtis send every check of this process to the database"""
+        from users import blacklist
+        redis.set(blacklist._ready_key(), 1)
+        blacklist._unsynced.add('revoked')
+        redis.down = True
+        
+        assert blacklist.might_be_blacklisted('fresh')
+        assert blacklist._unsynced == {'revoked'}
+    
+    @pytest.mark.django_db
+    def test_rebuild_and_resync(self, redis):
+        """Test that a rebuild holds the unexpired blacklist and a resync restores recent rows"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+        from users import blacklist
+        now = timezone.now()
+        for jti, expires_at in (('live', now + timedelta(days=1)), ('expired', now - timedelta(days=1))):
+            BlacklistedToken.objects.create(
+                token=OutstandingToken.objects.create(jti=jti, token=jti, expires_at=expires_at)
+            )
+        
+        assert blacklist.rebuild() == 1
+        assert blacklist.is_ready()
+        assert blacklist.might_be_blacklisted('live')
+        assert not blacklist.might_be_blacklisted('other')
+        
+        redis.delete(blacklist._filter_key())
+        assert blacklist.resync() == 2
+        assert blacklist.might_be_blacklisted('live')
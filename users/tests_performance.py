@@ -0,0 +1,71 @@
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from users import views
+
+
+@pytest.mark.performance
+@pytest.mark.django_db
+class TestUserBudgets:
+
+    def test_register(self, budget):
+        client = APIClient()
+        data = {
+            'email': 'new@example.com',
+            'password': 'TestPass123!',
+            'password2': 'TestPass123!',
+            'first_name': 'New',
+            'last_name': 'User'
+        }
+        # Password hashing dominates the time
+        with budget(queries=3, ms=1000):
+            response = client.post(reverse('user-register'), data, format='json')
+        assert response.status_code == 201
+
+    def test_token_obtain(self, perf_data, budget):
+        client = APIClient()
+        with budget(queries=4, ms=1000):
+            response = client.post(
+                reverse('token_obtain_pair'),
+                {'email': 'staff@example.com', 'password': 'StaffPass123!'},
+                format='json'
+            )
+        assert 'access' in response.data
+
+    def test_current_user(self, perf_data, auth_client, budget):
+        client = auth_client(perf_data['user'])
+        with budget(queries=2, ms=50):
+            response = client.get(reverse('current-user'))
+        assert response.data['email'] == perf_data['user'].email
+
+    def test_current_user_cached(self, perf_data, auth_client, budget):
+        client = auth_client(perf_data['user'])
+        client.get(reverse('current-user'))
+        with budget(queries=0, ms=20):
+            response = client.get(reverse('current-user'))
+        assert response.data['email'] == perf_data['user'].email
+
+    def test_update_preferences(self, perf_data, auth_client, budget, monkeypatch):
+        monkeypatch.setattr(views, 'mark_dirty', lambda *args, **kwargs: None)
+        client = auth_client(perf_data['user'])
+        with budget(queries=3, ms=100):
+            response = client.patch(
+                reverse('current-user'), {'favorite_genres': ['jazz']}, format='json'
+            )
+        assert response.data['favorite_genres'] == ['jazz']
+
+    def test_user_detail(self, perf_data, auth_client, budget):
+        other = perf_data['users'][1]
+        client = auth_client(perf_data['user'])
+        with budget(queries=3, ms=50):
+            response = client.get(reverse('user-detail-auth', kwargs={'user_id': other.id}))
+        assert response.data['id'] == other.id
+
+    def test_segment(self, perf_data, auth_client, budget):
+        """A segment smaller than one batch is a single keyset query"""
+        client = auth_client(perf_data['staff'])
+        with budget(queries=3, ms=100):
+            response = client.get(reverse('user-segments'), {'genre': ['pop', 'jazz']})
+            lines = b''.join(response.streaming_content).splitlines()
+        assert len(lines) == 1
@@ -2,6 +2,7 @@ from django.urls import path
 from .views import (
     CurrentUserView,
     UserDetailView,
+    UserSegmentView,
     UserProfileCreateUpdateView,
     UserProfileDetailView
 )
@@ -10,6 +11,7 @@ urlpatterns = [
     # New authenticated endpoints
     path('me/', CurrentUserView.as_view(), name='current-user'),
     path('<int:user_id>/', UserDetailView.as_view(), name='user-detail-auth'),
+    path('segments/', UserSegmentView.as_view(), name='user-segments'),
     
     # Legacy endpoints
     path('profile/', UserProfileCreateUpdateView.as_view(), name='user-create-update'),
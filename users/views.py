@@ -1,9 +1,13 @@
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
 from .models import UserProfile
+from .segments import SEGMENT_FIELDS, MATCH_LOOKUPS, segment_batches, segment_queryset
+from backend.renderers import dumps
+from recommendations.scheduling import mark_dirty
 from .serializers import (
     UserRegistrationSerializer,
     UserSerializer,
@@ -12,6 +16,8 @@ from .serializers import (
 
 User = get_user_model()
 
+PREFERENCE_FIELDS = ('favorite_genres', 'favorite_artists', 'moods')
+
 
 class UserRegistrationView(generics.CreateAPIView):
     """POST /api/auth/register/ - Register new user"""
@@ -27,6 +33,15 @@ class CurrentUserView(generics.RetrieveUpdateAPIView):
     
     def get_object(self):
         return self.request.user
+    
+    def perform_update(self, serializer):
+        user = serializer.instance
+        previous = [getattr(user, field) for field in PREFERENCE_FIELDS]
+        serializer.save()
+        
+        # New preferences deserve new recommendations soon
+        if previous != [getattr(user, field) for field in PREFERENCE_FIELDS]:
+            mark_dirty(user.id, delay=60)
 
 
 class UserDetailView(generics.RetrieveAPIView):
@@ -38,6 +53,57 @@ class UserDetailView(generics.RetrieveAPIView):
     lookup_url_kwarg = 'user_id'
 
 
+class UserSegmentView(APIView):
+    """
+    GET /api/users/segments/?genre=pop&artist=Drake&match=any - Stream the IDs
+    of active users in an audience segment (staff only)
+    
+    ``artist``, ``genre`` and ``mood`` may repeat. ``match=any`` selects users
+    with at least one of the values of each filter, ``match=all`` users with
+    all of them. The response is NDJSON, one ``{"user_ids": [...], "next": id}``
+    line per batch, in ascending ID order. ``after=<next>`` resumes a stream,
+    ``limit`` caps the number of IDs.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        filters = {
+            name: request.query_params.getlist(name)
+            for name in SEGMENT_FIELDS
+            if request.query_params.getlist(name)
+        }
+        if not filters:
+            return Response(
+                {'error': 'Filter by at least one of: ' + ', '.join(SEGMENT_FIELDS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        match = request.query_params.get('match', 'any')
+        if match not in MATCH_LOOKUPS:
+            return Response(
+                {'error': 'match must be one of: ' + ', '.join(MATCH_LOOKUPS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = request.query_params.get('limit')
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            return Response(
+                {'error': 'after and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        batches = segment_batches(segment_queryset(filters, match), after=after, limit=limit)
+        response = StreamingHttpResponse(
+            (dumps({'user_ids': ids, 'next': ids[-1]}) + b'\n' for ids in batches),
+            content_type='application/x-ndjson'
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 # Legacy endpoints for UserProfile
 class UserProfileCreateUpdateView(APIView):
     """POST /users/ - Create or update user profile (Legacy)"""